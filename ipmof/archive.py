@@ -0,0 +1,101 @@
+# IPMOF Energy Map Archive Functions
+# Date: October 2026
+import os
+import json
+import zlib
+import zipfile
+
+import numpy as np
+
+# Archive index file name (in archive directory)
+ARCHIVE_INDEX = 'index.json'
+
+
+def is_energy_map_archive(archive_dir):
+    """
+    Checks if given directory is an energy map archive (contains an archive index).
+    """
+    return os.path.exists(os.path.join(archive_dir, ARCHIVE_INDEX))
+
+
+def read_archive_index(archive_dir):
+    """
+    Reads energy map archive index:
+        {'num_shards': n, 'energy_maps': {mof_name: {'shard': shard_file, 'columns': n, 'size': bytes}}}
+    """
+    with open(os.path.join(archive_dir, ARCHIVE_INDEX), 'r') as index_file:
+        return json.load(index_file)
+
+
+def archived_energy_maps(archive_dir):
+    """
+    Returns list of energy map file names (MOF_emap.bin) in an energy map archive.
+    """
+    return [mof_name + '_emap.bin' for mof_name in sorted(read_archive_index(archive_dir)['energy_maps'])]
+
+
+def archive_shard(mof_name, num_shards):
+    """
+    Shard file name of a MOF (assigned by crc32 of the MOF name).
+    """
+    return 'emap_%03i.zip' % (zlib.crc32(mof_name.encode()) % num_shards)
+
+
+def write_energy_map_archive(archive_dir, energy_maps, num_shards=16):
+    """
+    Writes energy maps into a chunked and compressed archive split into num_shards zip files.
+    - energy_maps: iterable of (mof_name, atom_list, emap_block, emap_header)
+        Energy block with shape (columns, na, nb, nc) and its header (see write_binary_energy_map).
+    Each energy map is stored as separately compressed members, so that a single energy map
+    (or a single atom column of it) can be read without reading the rest of the archive:
+        - MOF/header.json: energy map header (including atom list)
+        - MOF/000, MOF/001, ...: float32 energy block of each column
+    The index (index.json) is written after all shards are closed.
+    Existing archives in the directory are replaced.
+    """
+    if not os.path.isdir(archive_dir):
+        os.makedirs(archive_dir)
+    archive_index = {'num_shards': num_shards, 'energy_maps': {}}
+    shards = {}
+    try:
+        for mof_name, atom_list, emap_block, emap_header in energy_maps:
+            shard = archive_shard(mof_name, num_shards)
+            if shard not in shards:
+                shards[shard] = zipfile.ZipFile(os.path.join(archive_dir, shard), 'w', zipfile.ZIP_DEFLATED)
+            emap_header = dict(emap_header, atom_list=atom_list, columns=len(emap_block), layout='block')
+            shards[shard].writestr(mof_name + '/header.json', json.dumps(emap_header))
+            size = shards[shard].filelist[-1].compress_size
+            for column_index, column in enumerate(emap_block):
+                column_bytes = np.ascontiguousarray(column, dtype='<f4').tobytes()
+                shards[shard].writestr('%s/%03i' % (mof_name, column_index), column_bytes)
+                size += shards[shard].filelist[-1].compress_size
+            archive_index['energy_maps'][mof_name] = {'shard': shard, 'columns': len(emap_block), 'size': size}
+    finally:
+        for shard_file in shards.values():
+            shard_file.close()
+    with open(os.path.join(archive_dir, ARCHIVE_INDEX), 'w') as index_file:
+        json.dump(archive_index, index_file)
+    return archive_index
+
+
+def read_archived_energy_map(archive_dir, mof_name, columns=None):
+    """
+    Reads energy map of a MOF from an energy map archive (only the members of that energy map are read).
+    Archives can be read by many processes at the same time (read-only).
+    - columns: list of column indices to read (all columns are read by default)
+        Columns that are not read are filled with NaN.
+    Returns atom list, energy block (columns, na, nb, nc) and energy map header.
+    """
+    archive_index = read_archive_index(archive_dir)
+    if mof_name not in archive_index['energy_maps']:
+        raise KeyError('Energy map not found in archive: %s' % mof_name)
+    shard = archive_index['energy_maps'][mof_name]['shard']
+    with zipfile.ZipFile(os.path.join(archive_dir, shard), 'r') as shard_file:
+        emap_header = json.loads(shard_file.read(mof_name + '/header.json').decode())
+        emap_block = np.full([emap_header['columns']] + emap_header['shape'], np.nan, dtype='<f4')
+        if columns is None:
+            columns = range(emap_header['columns'])
+        for column_index in columns:
+            column_bytes = shard_file.read('%s/%03i' % (mof_name, column_index))
+            emap_block[column_index] = np.frombuffer(column_bytes, dtype='<f4').reshape(emap_header['shape'])
+    return emap_header['atom_list'], emap_block, emap_header
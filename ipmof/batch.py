@@ -0,0 +1,135 @@
+# IPMOF Batch Energy Map Functions
+# Date: October 2026
+import os
+import math
+import time
+from multiprocessing import Pool
+
+import yaml
+
+from ipmof.crystal import MOF
+from ipmof.energymap import energy_map, append_energy_map, uniq_atom_list, plain_data
+from ipmof.cache import energy_map_key, cached_energy_map, cache_energy_map
+
+# Manifest file name (in energy map directory)
+MANIFEST = 'manifest.yaml'
+# Energy map file extensions of each energy map type
+EMAP_EXTENSIONS = {'numpy': '.npy', 'yaml': '.yaml', 'binary': '.bin'}
+
+
+def energy_map_paths(emap_dir):
+    """
+    Paths of the energy map files (MOF_emap.npy, MOF_emap.yaml or MOF_emap.bin) in a directory, sorted by
+    file name. Other files (e.g. lock files and unfinished temporary files) are skipped.
+    """
+    emap_suffixes = tuple('_emap' + emap_extension for emap_extension in EMAP_EXTENSIONS.values())
+    return [os.path.join(emap_dir, emap_file) for emap_file in sorted(os.listdir(emap_dir))
+            if emap_file.endswith(emap_suffixes)]
+
+
+def energy_map_cost(mof, cut_off, grid_size):
+    """
+    Estimates relative cost of an energy map calculation (number of grid point - atom pairs):
+        grid points (unit cell volume / grid_size^3) x atoms within cut_off of a grid point
+        (number of atoms / unit cell volume x sphere volume)
+    """
+    grid_points = mof.ucv / grid_size ** 3
+    neighbors = len(mof) / mof.ucv * 4 / 3 * math.pi * cut_off ** 3
+    return grid_points * neighbors
+
+
+def read_manifest(emap_dir):
+    """
+    Reads energy map manifest: {mof_name: {'file': file_name, 'key': emap_key, 'cost': cost, 'time': seconds}}
+    """
+    manifest_path = os.path.join(emap_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            return yaml.safe_load(manifest_file) or {}
+    return {}
+
+
+def write_manifest(manifest, emap_dir):
+    """
+    Writes energy map manifest with plain yaml (written to a temporary file first and then replaced).
+    """
+    manifest_path = os.path.join(emap_dir, MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        yaml.safe_dump(plain_data(manifest), manifest_file, default_flow_style=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def mof_atom_list(sim_par, mof_path, atom_list, force_field):
+    """
+    Atom list of the energy map of a MOF (lazy 'full' energy maps start with the atoms of the MOF).
+    """
+    if sim_par['energy_map_lazy'] and sim_par['energy_map_atom_list'] == 'full':
+        return uniq_atom_list([mof_path], force_field)
+    return atom_list
+
+
+def build_energy_maps(sim_par, sim_dir, mof_path_list, atom_list, force_field, processes=1):
+    """
+    Calculates energy maps of a list of MOFs in a process pool, largest energy maps first (see energy_map_cost).
+    Completed energy maps are recorded in a manifest in the energy map directory (after each energy map)
+    together with their cache key (see energy_map_key). MOFs whose energy map is in the manifest with the
+    same key are skipped, so a killed run continues where it stopped and changed inputs are recalculated.
+    Force field and atom list are sent to each worker process once. Each energy map is calculated in a single
+    process ('energy_map_workers' is not used). The manifest and the energy map cache are only updated by
+    this (main) process.
+    Returns manifest.
+    """
+    emap_dir = sim_dir['energy_map_dir']
+    manifest = read_manifest(emap_dir)
+    emap_extension = EMAP_EXTENSIONS[sim_par['energy_map_type']]
+    tasks = []
+    for mof_path in mof_path_list:
+        mof = MOF(mof_path)
+        mof_name = os.path.splitext(os.path.basename(mof_path))[0]
+        emap_path = os.path.join(emap_dir, mof_name + '_emap' + emap_extension)
+        emap_key = energy_map_key(sim_par, mof_path, mof_atom_list(sim_par, mof_path, atom_list, force_field),
+                                  force_field)
+        record = manifest.get(mof_name)
+        if record is not None and record['key'] == emap_key and os.path.exists(emap_path):
+            continue
+        cost = energy_map_cost(mof, sim_par['cut_off'], sim_par['grid_size'])
+        if sim_par['energy_map_cache'] and cached_energy_map(emap_key, sim_dir['energy_map_cache_dir'], emap_path):
+            print('Energy map found in cache ->', mof_name)
+            manifest[mof_name] = {'file': os.path.basename(emap_path), 'key': emap_key, 'cost': cost, 'time': 0.0}
+            write_manifest(manifest, emap_dir)
+            continue
+        tasks.append((cost, mof_path, emap_path, emap_key))
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    print(len(mof_path_list) - len(tasks), 'energy map(s) completed |', len(tasks), 'energy map(s) to calculate')
+
+    initargs = (sim_par, atom_list, force_field)
+    with Pool(processes, initializer=_init_build_worker, initargs=initargs) as pool:
+        for cost, mof_path, emap_path, emap_key, seconds in pool.imap_unordered(_build_worker, tasks, chunksize=1):
+            mof_name = os.path.basename(emap_path).split('_emap')[0]
+            if sim_par['energy_map_cache']:
+                cache_energy_map(emap_key, sim_dir['energy_map_cache_dir'], emap_path, sim_par['energy_map_cache'])
+            manifest[mof_name] = {'file': os.path.basename(emap_path), 'key': emap_key, 'cost': cost,
+                                  'time': seconds}
+            write_manifest(manifest, emap_dir)
+            print('Energy map completed ->', mof_name, '(%.1f s)' % seconds)
+    return manifest
+
+
+_build_worker_data = {}
+
+
+def _init_build_worker(sim_par, atom_list, force_field):
+    _build_worker_data.update(sim_par=sim_par, atom_list=atom_list, force_field=force_field)
+
+
+def _build_worker(task):
+    cost, mof_path, emap_path, emap_key = task
+    sim_par = _build_worker_data['sim_par']
+    force_field = _build_worker_data['force_field']
+    atom_list = mof_atom_list(sim_par, mof_path, _build_worker_data['atom_list'], force_field)
+    start = time.time()
+    if sim_par['energy_map_append'] and os.path.exists(emap_path):
+        append_energy_map(sim_par, mof_path, atom_list, force_field, emap_path)
+    else:
+        energy_map(sim_par, mof_path, atom_list, force_field, export_dir=os.path.dirname(emap_path))
+    return cost, mof_path, emap_path, emap_key, time.time() - start
@@ -0,0 +1,122 @@
+# IPMOF Energy Map Cache Functions
+# Date: October 2026
+import os
+import time
+import shutil
+import hashlib
+
+import yaml
+
+from ipmof.crystal import MOF
+from ipmof.energymap import energy_map_lock, atomic_file
+
+# Simulation parameters that change the energy map (octree parameters are used for octree grids only)
+EMAP_PARAMETERS = ['cut_off', 'grid_size', 'energy_map_grid', 'energy_map_mode', 'energy_map_type',
+                   'energy_map_overlap', 'energy_map_quantize', 'energy_map_sparse', 'energy_map_interpolation',
+                   'energy_map_engine', 'fft_near_field']
+OCTREE_PARAMETERS = ['octree_depth', 'octree_tolerance', 'atom_energy_limit']
+# Cache index file name (in cache directory)
+CACHE_INDEX = 'cache.yaml'
+
+
+def energy_map_key(sim_par, mof_path, atom_list, force_field):
+    """
+    Calculates cache key (sha256 hex digest) of an energy map from its inputs:
+        - Contents of the MOF structure file
+        - Simulation parameters that change the energy map (see EMAP_PARAMETERS)
+        - Force field parameters of the MOF atoms (only used in 'sums' mode if hard-core overlap radii
+          are calculated, see overlap_radii) and the atom list (not used in 'sums' mode)
+    """
+    with open(mof_path, 'rb') as mof_file:
+        mof_hash = hashlib.sha256(mof_file.read()).hexdigest()
+    parameters = EMAP_PARAMETERS + OCTREE_PARAMETERS if sim_par['energy_map_grid'] == 'octree' else EMAP_PARAMETERS
+    emap_inputs = {'mof': mof_hash, 'sim_par': {par: sim_par[par] for par in parameters}}
+    if sim_par['energy_map_mode'] != 'sums' or sim_par['energy_map_overlap']:
+        mof = MOF(mof_path)
+        mof.set_force_field(force_field)
+        emap_inputs['force_field'] = [[atom, float(sig), float(eps)] for atom, sig, eps in
+                                      zip(mof.uniq_atom_names, mof.sigma, mof.epsilon)]
+    if sim_par['energy_map_mode'] != 'sums':
+        emap_inputs['atom_list'] = [[atom, float(sig), float(eps)] for atom, sig, eps in
+                                    zip(atom_list['atom'], atom_list['sigma'], atom_list['epsilon'])]
+    return hashlib.sha256(yaml.dump(emap_inputs).encode()).hexdigest()
+
+
+def read_cache_index(cache_dir):
+    """
+    Reads energy map cache index: {key: {'mof': mof_name, 'file': file_name, 'size': bytes, 'last_used': time}}
+    """
+    index_path = os.path.join(cache_dir, CACHE_INDEX)
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as index_file:
+            return yaml.safe_load(index_file) or {}
+    return {}
+
+
+def write_cache_index(cache_index, cache_dir):
+    """
+    Writes energy map cache index (the index file is replaced atomically, see atomic_file).
+    The cache index is read, modified and written while holding the cache lock (see energy_map_lock),
+    so that concurrent workers do not lose each other's entries.
+    """
+    with atomic_file(os.path.join(cache_dir, CACHE_INDEX), 'w') as index_file:
+        yaml.dump(cache_index, index_file, default_flow_style=False)
+
+
+def copy_energy_map(source_path, target_path):
+    """
+    Copies an energy map file, the target file is replaced atomically (see atomic_file).
+    """
+    with open(source_path, 'rb') as source_file, atomic_file(target_path) as target_file:
+        shutil.copyfileobj(source_file, target_file)
+
+
+def cached_energy_map(key, cache_dir, emap_path):
+    """
+    Copies the energy map with given key from the cache to emap_path.
+    Returns True if the energy map was found in the cache, False otherwise.
+    """
+    if not os.path.isdir(cache_dir):
+        return False
+    with energy_map_lock(os.path.join(cache_dir, CACHE_INDEX)):
+        cache_index = read_cache_index(cache_dir)
+        if key not in cache_index or not os.path.exists(os.path.join(cache_dir, cache_index[key]['file'])):
+            return False
+        copy_energy_map(os.path.join(cache_dir, cache_index[key]['file']), emap_path)
+        cache_index[key]['last_used'] = time.time()
+        write_cache_index(cache_index, cache_dir)
+    return True
+
+
+def cache_energy_map(key, cache_dir, emap_path, cache_size):
+    """
+    Stores a copy of the energy map in emap_path in the cache with given key.
+    Least recently used energy maps are then removed until the cache fits into cache_size (MB, 1024^2 bytes).
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    with energy_map_lock(os.path.join(cache_dir, CACHE_INDEX)):
+        cache_index = read_cache_index(cache_dir)
+        emap_file = key + os.path.splitext(emap_path)[1]
+        copy_energy_map(emap_path, os.path.join(cache_dir, emap_file))
+        cache_index[key] = {'mof': os.path.basename(emap_path).split('_emap')[0],
+                            'file': emap_file,
+                            'size': os.path.getsize(emap_path),
+                            'last_used': time.time()}
+        evict_energy_maps(cache_index, cache_dir, cache_size)
+        write_cache_index(cache_index, cache_dir)
+
+
+def evict_energy_maps(cache_index, cache_dir, cache_size):
+    """
+    Removes least recently used energy maps from the cache (and the cache index) until the total
+    size of the cached energy maps is below cache_size (MB, 1024^2 bytes).
+    """
+    total_size = sum([emap['size'] for emap in cache_index.values()])
+    for key in sorted(cache_index, key=lambda k: cache_index[k]['last_used']):
+        if total_size <= cache_size * 1024 ** 2:
+            break
+        emap_file = os.path.join(cache_dir, cache_index[key]['file'])
+        if os.path.exists(emap_file):
+            os.remove(emap_file)
+        total_size -= cache_index.pop(key)['size']
@@ -0,0 +1,137 @@
+# IPMOF Cell List Functions
+# Date: October 2026
+import math
+
+import numpy as np
+
+
+def to_frac_matrix(to_frac):
+    """
+    Converts 'to_frac' constants of a MOF object to a 3x3 matrix (frac = M @ car).
+    """
+    return np.array([[to_frac[0], to_frac[1], to_frac[2]], [0, to_frac[3], to_frac[4]], [0, 0, to_frac[5]]])
+
+
+def to_car_matrix(to_car):
+    """
+    Converts 'to_car' constants of a MOF object to a 3x3 matrix (car = M @ frac).
+    Columns of the matrix are the unit cell vectors.
+    """
+    return np.array([[to_car[0], to_car[1], to_car[2]], [0, to_car[3], to_car[4]], [0, 0, to_car[5]]])
+
+
+class CellList:
+    """
+    Linked-cell neighbor search for periodic frameworks.
+    Framework atoms are wrapped into the unit cell in fractional coordinates and only the periodic
+    images that are needed for the requested region are generated. Images are then sorted into bins
+    (buckets) whose perpendicular width is at least cut_off / divisions, so that all atoms within
+    cut_off of a point are found in the (2 * divisions + 1)^3 bins around the bin of that point.
+    """
+    def __init__(self, mof, cut_off, frac_range=None, divisions=2):
+        """
+        Initialize cell list for a MOF object (atom_coors, atom_names, uniq_atom_names, to_frac and
+        to_car must be defined) with a given cut_off radius.
+        - frac_range=[[a_min, b_min, c_min], [a_max, b_max, c_max]]
+            Region (in fractional coordinates) that query points are going to be in.
+            Default is a single unit cell: [[0, 0, 0], [1, 1, 1]].
+        - divisions=2
+            Number of bins per cut_off distance (higher values visit less atoms for each point).
+        """
+        if frac_range is None:
+            frac_range = [[0, 0, 0], [1, 1, 1]]
+        self.cut_off = cut_off
+        self.divisions = divisions
+        self.to_frac = to_frac_matrix(mof.to_frac)
+        self.to_car = to_car_matrix(mof.to_car)
+        self.num_species = len(mof.uniq_atom_names)
+
+        # Perpendicular widths of the unit cell (distance between opposite faces)
+        widths = 1 / np.linalg.norm(self.to_frac, axis=1)
+        min_width = cut_off / divisions
+        # Bins divide the unit cell evenly if it is wide enough, otherwise a single bin spans
+        # more than one unit cell in that direction
+        self.bin_width = np.array([1 / math.floor(w / min_width) if w >= min_width else min_width / w
+                                   for w in widths])
+
+        # Number of bins required to cover the query region and the surrounding image atoms
+        self.origin = np.array(frac_range[0], dtype=float)
+        frac_max = np.array(frac_range[1], dtype=float)
+        self.point_bins = np.floor((frac_max - self.origin) / self.bin_width).astype(int) + 1
+        self.num_bins = self.point_bins + 2 * divisions
+
+        # Wrap framework atoms into the unit cell
+        species = np.array([mof.uniq_atom_names.index(name) for name in mof.atom_names])
+        frac = np.array(mof.atom_coors, dtype=float).reshape(-1, 3) @ self.to_frac.T
+        frac -= np.floor(frac)
+
+        # Generate only the periodic images that fall into the bins
+        image_min = self.origin - divisions * self.bin_width
+        image_max = self.origin + (self.point_bins + divisions) * self.bin_width
+        shift_range = [range(int(math.floor(lo)), int(math.ceil(hi))) for lo, hi in zip(image_min, image_max)]
+        image_frac, image_species = [], []
+        for sa in shift_range[0]:
+            for sb in shift_range[1]:
+                for sc in shift_range[2]:
+                    shifted = frac + [sa, sb, sc]
+                    inside = np.all((shifted >= image_min) & (shifted < image_max), axis=1)
+                    image_frac.append(shifted[inside])
+                    image_species.append(species[inside])
+        image_frac = np.concatenate(image_frac)
+        image_species = np.concatenate(image_species)
+
+        # Sort image atoms by bin and then by species
+        bins = np.floor((image_frac - image_min) / self.bin_width).astype(int)
+        bins = np.minimum(bins, self.num_bins - 1)
+        bin_id = (bins[:, 0] * self.num_bins[1] + bins[:, 1]) * self.num_bins[2] + bins[:, 2]
+        order = np.lexsort((image_species, bin_id))
+        self.atom_coors = image_frac[order] @ self.to_car.T
+        self.atom_species = image_species[order]
+        self.bin_start = np.searchsorted(bin_id[order], np.arange(np.prod(self.num_bins) + 1))
+
+    def __len__(self):
+        return len(self.atom_coors)
+
+    def point_bins_of(self, points):
+        """
+        Returns bin indices of given cartesian points in the query region.
+        """
+        frac = np.asarray(points, dtype=float).reshape(-1, 3) @ self.to_frac.T
+        bins = (frac - self.origin) / self.bin_width
+        if np.any(bins < -1e-6) or np.any(bins > self.point_bins + 1e-6):
+            raise ValueError('Points are outside of the cell list region')
+        return np.clip(np.floor(bins).astype(int), 0, self.point_bins - 1)
+
+    def neighbors(self, bin_index):
+        """
+        Returns coordinates of image atoms in the bins surrounding the given point bin together with
+        a list of slices giving the range of each species (atoms are sorted by species).
+        """
+        nb, nc = self.num_bins[1], self.num_bins[2]
+        ba, bb, bc = bin_index
+        window = 2 * self.divisions + 1
+        ranges = []
+        for ia in range(ba, ba + window):
+            for ib in range(bb, bb + window):
+                first = (ia * nb + ib) * nc + bc
+                ranges.append(np.arange(self.bin_start[first], self.bin_start[first + window]))
+        atom_index = np.concatenate(ranges)
+        atom_index = atom_index[np.argsort(self.atom_species[atom_index], kind='stable')]
+        bounds = np.searchsorted(self.atom_species[atom_index], np.arange(self.num_species + 1))
+        species_slices = [slice(bounds[i], bounds[i + 1]) for i in range(self.num_species)]
+        return self.atom_coors[atom_index], species_slices
+
+    def groups(self, points):
+        """
+        Groups given cartesian points by bins.
+        Yields point indices in each occupied bin together with its neighbor atoms and species slices.
+        """
+        bins = self.point_bins_of(points)
+        bin_id = (bins[:, 0] * self.point_bins[1] + bins[:, 1]) * self.point_bins[2] + bins[:, 2]
+        order = np.argsort(bin_id, kind='stable')
+        uniq_id, first = np.unique(bin_id[order], return_index=True)
+        last = np.append(first[1:], len(order))
+        for start, end in zip(first, last):
+            point_index = order[start:end]
+            atom_coors, species_slices = self.neighbors(bins[point_index[0]])
+            yield point_index, atom_coors, species_slices
@@ -127,11 +127,12 @@ def core_mof_vf_list(target_vf, vf_list_path, limit=math.inf):
     return vf_mofs
 
 
-def core_interpenetration_list(sim_dir, limit=math.inf, target_vf=1.0):
+def core_interpenetration_list(sim_dir, limit=math.inf, target_vf=1.0, emap_dir=None):
     """ Generate interpenetration list from a given MOF combination list """
     vf_list_path = os.path.join(sim_dir['main_dir'], 'doc', 'core_mof_vf_list.yaml')
     mof_list = core_mof_vf_list(target_vf, vf_list_path, limit=limit)
-    emap_dir = sim_dir['energy_map_dir']
+    if emap_dir is None:
+        emap_dir = sim_dir['energy_map_dir']
     mof_dir = sim_dir['mof_dir']
     interpenetration_list = []
     for mof in mof_list:
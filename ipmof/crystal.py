@@ -34,6 +34,7 @@ class MOF:
             self.atom_names = molecule['atom_names']
             self.uc_size = molecule['uc_size']
             self.uc_angle = molecule['uc_angle']
+            self.spacegroup = molecule['spacegroup']
             self.separate_atoms()
             self.unit_cell_volume()
             self.pbc_parameters()
@@ -2,41 +2,531 @@
 # Date: June 2016
 # Author: Kutay B. Sezginel
 import os
-from math import floor, ceil, inf, sqrt
+import json
+import struct
+import tempfile
+import itertools
+from math import floor, ceil, sqrt
+from contextlib import contextmanager
+from multiprocessing import Pool, RawArray
+try:
+    import fcntl
+except ImportError:
+    # File locks are not available (Windows), energy maps should not be appended concurrently
+    fcntl = None
 
 import xlrd
 import numpy as np
 import yaml
 
-from ipmof.forcefield import lorentz_berthelot_mix, lennard_jones
+from ipmof.forcefield import lorentz_berthelot_mix, get_ff_parameters
 from ipmof.crystal import MOF
+from ipmof.celllist import CellList, to_frac_matrix, to_car_matrix
+from ipmof.octree import build_octree
+from ipmof.archive import write_energy_map_archive, read_archived_energy_map, is_energy_map_archive
 from ipmof.parameters import sim_dir_data as sim_dir    # Import simulation directories
 from ipmof.core import core_mof_properties, core_mof_sort, core_mof_dir
 
+# Maximum number of grid point - atom pairs evaluated at once (memory usage per array: 8 bytes each)
+BLOCK_ELEMENTS = 2 ** 21
+# Number of tasks per worker process for parallel energy map calculation (see parallel_tasks)
+PARALLEL_TASKS_PER_WORKER = 4
+# Number of point - atom arrays allocated at the same time by lj_sums (r^2, r^-6, r^-12, mask and temporaries)
+LJ_SCRATCH_ARRAYS = 6
+# Saturated energy value for grid points overlapping with framework atoms (hard-core overlap)
+OVERLAP_ENERGY = 1E30
+# Framework atoms closer than this to a grid point saturate it (OVERLAP_ENERGY) and atoms up to cut_off plus this
+# distance are included (Angstrom), so that symmetry equivalent grid points (rounding errors) get the same sums
+DISTANCE_TOLERANCE = 1E-6
+# Width of the near field switching region of the FFT energy map engine: min. width (Angstrom) and
+# min. number of grid spacings (the far field is spread onto the grid, so it must be smooth on the grid scale)
+FFT_SWITCH_WIDTH = 1.0
+FFT_SWITCH_POINTS = 4
+# Binary energy map format: magic bytes, version and bytes reserved for header updates
+BINARY_MAGIC = b'IPMOFMAP'
+BINARY_VERSION = 1
+BINARY_HEADER_SLACK = 4096
+# Quantized energy maps: code types and max. energy of the log-energy scale (higher energies are clipped)
+QUANTIZE_DTYPES = {'uint8': '<u1', 'uint16': '<u2'}
+QUANTIZE_ENERGY_MAX = 1E10
 
-def energy_map(sim_par, mof_path, atom_list, force_field, export=True, export_dir=sim_dir['energy_map_dir']):
+
+def energy_map(sim_par, mof_path, atom_list, force_field, export=True, export_dir=sim_dir['energy_map_dir'],
+               workers=1):
     """
     Calculate energy map for given simulations parameters, MOF class, atom list and export options.
     Simulation parameters used:
-        - cut_off       - grid_size
+        - cut_off       - grid_size     - energy_map_grid
     MOF class should have following properties:
-        - edge_points   - uniq_atom_names   - atom_names    - packed_coors
+        - edge_points   - uniq_atom_names   - atom_names    - to_frac   - to_car
         - sigma         - epsilon
-        * Packed coordinates for MOF must be defined before running the function.
     Atom list dictionary with sigma and epsilon keys:
         -> atom_list = {'sigma': [], 'epsilon':[]}
     Export info:
         -> export=[True, sim_dir]
     Resulting energy map is structured as follows:
         emap[0] = [x, y, z, atom1_energy, atom2_energy, atom3_energy, ...]
+    Grid types ('energy_map_grid'):
+        - 'fractional': na x nb x nc grid covering exactly one unit cell (see fractional_grid)
+        - 'cartesian': Rectangular bounding box grid around the unit cell (see cartesian_grid)
+        - 'octree': Adaptive grid refined only near the framework surface (see octree_energy_map),
+                    cannot be exported in binary format (raises ValueError before the calculation)
+    Energy map modes ('energy_map_mode'):
+        - 'energy': Energy values for each atom in the atom list (structure given above)
+        - 'sums': Force field independent r^-6 and r^-12 sums for each framework species
+            emap[0] = [x, y, z, S6_species1, S6_species2, ..., S12_species1, S12_species2, ...]
+            Energy values for any atom list / force field are derived using energy_map_from_sums.
+    Neighbor atoms for each grid point are found using a periodic cell list (see ipmof.celllist).
+    If 'energy_map_overlap' is given, grid points closer than energy_map_overlap * sigma to a framework
+    atom are detected first and their energy is set to OVERLAP_ENERGY without summing (see overlap_radii).
+    For fractional grids the space group of the MOF is used to calculate only the asymmetric unit
+    of the grid ('energy_map_symmetry', see grid_symmetry).
+    Fractional grids can also be calculated as a periodic convolution using FFT ('energy_map_engine': 'fft',
+    see fft_energy_map_sums) instead of summing over neighbor atoms of each grid point ('direct').
+    Calculation is distributed to given number of worker processes (workers=1 -> serial).
+    Binary fractional energy maps larger than 'energy_map_memory' are written tile by tile (see tiled_energy_map).
+    If 'energy_map_append' is set, r^-6 and r^-12 sums of energy maps in 'energy' mode are stored in the header
+    ('sums' with shape (2 * species, grid points), numpy and binary energy maps only), so that new atoms are
+    appended without summing over neighbor atoms again (see append_energy_map).
     """
-    # Initialize MOF and extend structure for energy map calculation
+    if export and sim_par['energy_map_grid'] == 'octree' and sim_par['energy_map_type'] == 'binary':
+        raise ValueError('Binary energy map format requires energy map grid: fractional or cartesian')
+    # Initialize MOF and unit cell vectors for energy map calculation
     mof = MOF(mof_path)
     mof.set_force_field(force_field)
-    extended_structure = mof.extend_unit_cell(cut_off=sim_par['cut_off'])
+    mof.calculate_vectors()
     # Read cut-off and grid size from simulation parameters
     cut_off = sim_par['cut_off']
     grid_size = sim_par['grid_size']
+
+    if export and tiled_energy_map_required(sim_par, mof, atom_list, workers=workers):
+        # Energy map does not fit into the memory budget, it is calculated and written tile by tile
+        tiled_energy_map(sim_par, mof, atom_list, os.path.join(export_dir, mof.name + '_emap.bin'), workers=workers)
+        return
+
+    if sim_par['energy_map_grid'] == 'octree':
+        # Adaptive grids are always calculated in 'energy' mode (refinement depends on energy values)
+        energy_map, emap_header = octree_energy_map(sim_par, mof, atom_list, workers=workers)
+    else:
+        if sim_par['energy_map_grid'] == 'fractional':
+            grid_shape, grid_points = fractional_grid(mof, grid_size)
+            frac_range = None
+        else:
+            grid_shape, grid_points = cartesian_grid(mof, grid_size)
+            # Bounding box grid extends beyond the unit cell, cell list must cover all grid points
+            grid_frac = grid_points @ to_frac_matrix(mof.to_frac).T
+            frac_range = [grid_frac.min(axis=0), grid_frac.max(axis=0)]
+        emap_header = energy_map_header(sim_par, mof, grid_shape)
+
+        cell_list = CellList(mof, cut_off, frac_range=frac_range)
+        overlap = overlap_radii(sim_par, mof, atom_list, frac_range=frac_range)
+        if sim_par['energy_map_engine'] == 'fft' and sim_par['energy_map_grid'] == 'fractional':
+            # Periodic convolution of the framework atoms with the LJ kernel (all grid points are calculated)
+            s6, s12 = fft_energy_map_sums(mof, grid_shape, grid_points, cut_off, sim_par['fft_near_field'],
+                                          workers=workers, overlap=overlap)
+        elif sim_par['energy_map_symmetry'] and sim_par['energy_map_grid'] == 'fractional' and \
+                mof.spacegroup is not None:
+            # Calculate only the asymmetric unit of the grid and fill the rest using symmetry operations
+            representative = grid_symmetry(grid_shape, mof.spacegroup.get_symop())
+            asym_index, grid_index = np.unique(representative, return_inverse=True)
+            s6, s12 = energy_map_sums(grid_points[asym_index], cell_list, workers=workers, overlap=overlap)
+            s6, s12 = s6[grid_index], s12[grid_index]
+        else:
+            s6, s12 = energy_map_sums(grid_points, cell_list, workers=workers, overlap=overlap)
+
+        if sim_par['energy_map_mode'] == 'sums':
+            # Framework species are stored as atom list (sigma and epsilon are given for reference)
+            atom_list = {'atom': mof.uniq_atom_names, 'sigma': mof.sigma, 'epsilon': mof.epsilon}
+            energy_map = np.concatenate([grid_points, s6, s12], axis=1)
+        else:
+            num_atoms = len(atom_list['sigma'])
+
+            # Initialize energy map according to grid size and coordinates plus number of unique atoms
+            energy_map = np.zeros([len(grid_points), num_atoms + 3])
+            energy_map[:, 0:3] = grid_points
+
+            c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list)
+            energy_map[:, 3:] = lj_energy(s6, s12, c6, c12)
+            energy_map[~np.isfinite(energy_map[:, 3]), 3:] = OVERLAP_ENERGY
+            if sim_par['energy_map_append'] and sim_par['energy_map_type'] != 'yaml':
+                emap_header['sums'] = np.concatenate([s6, s12], axis=1).T
+
+    if export:
+        export_energy_map(energy_map, atom_list, sim_par, export_dir, mof.name, emap_header=emap_header)
+    else:
+        return energy_map
+
+
+def tiled_energy_map_required(sim_par, mof, atom_list, workers=1):
+    """
+    Checks if an energy map is calculated tile by tile: binary energy maps on fractional grids whose
+    calculation requires more memory than 'energy_map_memory' (MB, see tile_layers).
+    """
+    if not sim_par['energy_map_memory'] or sim_par['energy_map_type'] != 'binary' or \
+       sim_par['energy_map_grid'] != 'fractional':
+        return False
+    grid_shape = fractional_grid_shape(mof, sim_par['grid_size'])
+    return tile_layers(sim_par, mof, atom_list, grid_shape, workers=workers) < grid_shape[0]
+
+
+def tile_layers(sim_par, mof, atom_list, grid_shape, workers=1):
+    """
+    Number of grid layers (along a) of each tile that fit into 'energy_map_memory' (MB).
+    Memory of each grid point is estimated from the coordinates and grid indices, cell list bins (fractional
+    coordinates, bin indices, bin ids and sort order), r^-6 and r^-12 sums (and their copies) and energy values
+    (float64 and float32) of the grid point.
+    Memory that does not depend on the tile size is subtracted from the budget first: scratch arrays of the
+    point - atom blocks of each worker (LJ_SCRATCH_ARRAYS arrays of BLOCK_ELEMENTS, see lj_sums) and the periodic
+    images of the framework atoms stored in the cell list (coordinates, species, bins, bin ids and sort order).
+    """
+    num_species = len(mof.uniq_atom_names)
+    columns = 2 * num_species if sim_par['energy_map_mode'] == 'sums' else len(atom_list['sigma'])
+    layer_bytes = grid_shape[1] * grid_shape[2] * 8 * (6 + 8 + 4 * num_species + 2 * columns)
+    # Image atoms are generated within (about) cut_off of the unit cell faces
+    widths = 1 / np.linalg.norm(to_frac_matrix(mof.to_frac), axis=1)
+    image_atoms = len(mof.atom_names) * np.prod(1 + 2 * sim_par['cut_off'] / widths)
+    fixed_bytes = workers * LJ_SCRATCH_ARRAYS * BLOCK_ELEMENTS * 8 + image_atoms * 8 * 10
+    return max(1, int((sim_par['energy_map_memory'] * 1024 ** 2 - fixed_bytes) // layer_bytes))
+
+
+def tiled_energy_map(sim_par, mof, atom_list, emap_file_path, workers=1):
+    """
+    Calculates fractional energy map tile by tile (layers along a) and writes each tile directly into a binary
+    energy map file (see write_binary_energy_map), so that memory usage stays within 'energy_map_memory'.
+    The file is allocated with the full energy block first and the number of completed tiles is stored in the
+    header ('tiles') after each tile is written. If the calculation is interrupted, the partially written energy
+    map (calculated with the same header) is completed starting from the first missing tile.
+    Grid symmetry is not used and quantization, sparse storage or B-spline coefficients (calculated when the
+    energy map is read) are not stored for tiled energy maps.
+    """
+    if sim_par['energy_map_quantize'] is not None:
+        raise ValueError('Quantized energy maps cannot be calculated tile by tile')
+    if sim_par['energy_map_sparse'] is not None:
+        raise ValueError('Sparse energy maps cannot be calculated tile by tile')
+    grid_shape = fractional_grid_shape(mof, sim_par['grid_size'])
+    na, nb, nc = grid_shape
+    emap_header = energy_map_header(sim_par, mof, grid_shape)
+    emap_header.update(energy_map_lattice(None, emap_header))
+    if sim_par['energy_map_mode'] == 'sums':
+        atom_list = {'atom': mof.uniq_atom_names, 'sigma': mof.sigma, 'epsilon': mof.epsilon}
+        columns = 2 * len(mof.uniq_atom_names)
+    else:
+        columns = len(atom_list['sigma'])
+        c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list)
+    layers = tile_layers(sim_par, mof, atom_list, grid_shape, workers=workers)
+    binary_header = dict(emap_header, version=BINARY_VERSION, layout='block', dtype='<f4', columns=columns,
+                         tiles={'layers': layers, 'done': 0})
+    binary_header['atom_list'] = {key: [str(i) if key == 'atom' else float(i) for i in atom_list[key]]
+                                  for key in ['atom', 'sigma', 'epsilon']}
+    binary_header = json.loads(json.dumps(binary_header))
+
+    # Continue partially written energy map with the same header
+    header_size = None
+    if os.path.exists(emap_file_path):
+        try:
+            existing_header, existing_size = read_binary_header(emap_file_path)
+        except ValueError:
+            existing_header = None
+        if existing_header is not None and existing_header.get('tiles', {}).get('layers') == layers and \
+           dict(existing_header, tiles=None) == dict(binary_header, tiles=None):
+            binary_header['tiles']['done'] = existing_header['tiles']['done']
+            header_size = existing_size
+            print('Continuing tiled energy map from tile', binary_header['tiles']['done'] + 1)
+    if header_size is None:
+        header_size = len(json.dumps(binary_header).encode()) + BINARY_HEADER_SLACK
+        header_size += -(16 + header_size) % 64
+        with open(emap_file_path, 'wb') as emap_file:
+            emap_file.write(BINARY_MAGIC + struct.pack('<II', BINARY_VERSION, header_size))
+            emap_file.write(json.dumps(binary_header).encode().ljust(header_size))
+            emap_file.truncate(16 + header_size + columns * na * nb * nc * 4)
+
+    cell_list = CellList(mof, sim_par['cut_off'])
+    overlap = overlap_radii(sim_par, mof, atom_list)
+    emap_block = np.memmap(emap_file_path, dtype='<f4', mode='r+', offset=16 + header_size,
+                           shape=(columns, na, nb, nc))
+    num_tiles = -(-na // layers)
+    for tile_index in range(binary_header['tiles']['done'], num_tiles):
+        a0, a1 = tile_index * layers, min(na, (tile_index + 1) * layers)
+        tile_index_grid = np.indices([a1 - a0, nb, nc]).reshape(3, -1).T + [a0, 0, 0]
+        points = np.array(emap_header['origin']) + tile_index_grid @ np.array(emap_header['lattice'])
+        s6, s12 = energy_map_sums(points, cell_list, workers=workers, overlap=overlap)
+        if sim_par['energy_map_mode'] == 'sums':
+            values = np.concatenate([s6, s12], axis=1)
+        else:
+            values = lj_energy(s6, s12, c6, c12)
+            values[~np.isfinite(values[:, 0])] = OVERLAP_ENERGY
+        emap_block[:, a0:a1] = values.T.reshape(columns, a1 - a0, nb, nc)
+        emap_block.flush()
+        binary_header['tiles']['done'] = tile_index + 1
+        update_binary_header(emap_file_path, binary_header, header_size)
+        print('Energy map tile %i / %i completed' % (tile_index + 1, num_tiles))
+    del emap_block
+    binary_header.pop('tiles')
+    update_binary_header(emap_file_path, binary_header, header_size)
+    print('Energy map exported as', emap_file_path)
+
+
+def energy_map_from_sums(emap, emap_header, atom_list, force_field):
+    """
+    Derives energy map for a given atom list from an energy map in 'sums' mode.
+    Framework species parameters are read from the given force field and mixed with the atom list
+    (Lorentz-Berthelot), energies are then a linear combination of the r^-6 and r^-12 sums:
+        E_atom = sum over species (c12 * S12_species - c6 * S6_species)
+    Returns energy map in 'energy' mode (emap[0] = [x, y, z, atom1_energy, ...]) and its header.
+    Binary energy maps (energy blocks) are returned as energy blocks.
+    """
+    if emap_header.get('layout') == 'block':
+        emap = energy_map_rows(emap, emap_header)
+    species = emap_header['species']
+    num_species = len(species)
+    ff_parameters = get_ff_parameters(species, force_field)
+    sigma = [ff[1] for ff in ff_parameters]
+    epsilon = [ff[2] for ff in ff_parameters]
+    c6, c12 = lj_coefficients(sigma, epsilon, atom_list)
+
+    emap = np.asarray(emap)
+    energy_map = np.zeros([len(emap), len(atom_list['sigma']) + 3])
+    energy_map[:, 0:3] = emap[:, 0:3]
+    energy_map[:, 3:] = lj_energy(emap[:, 3:3 + num_species], emap[:, 3 + num_species:], c6, c12)
+    # Sums of saturated grid points are stored as NaN (hard-core overlap) or infinite S12 (on a framework atom)
+    overlap_energy = emap_header.get('overlap_energy') or OVERLAP_ENERGY
+    energy_map[~np.isfinite(energy_map[:, 3]), 3:] = overlap_energy
+
+    energy_header = dict(emap_header, mode='energy', overlap_energy=overlap_energy)
+    if emap_header.get('layout') == 'block':
+        energy_header['columns'] = len(atom_list['sigma'])
+        energy_map = energy_map_block(energy_map, energy_header)
+    return energy_map, energy_header
+
+
+def append_energy_map(sim_par, mof_path, atom_list, force_field, emap_path, workers=1):
+    """
+    Appends energy values for atoms of the atom list that are missing in an existing energy map.
+    Only the missing columns are calculated at the grid points of the existing energy map and the
+    stored atom list is extended (existing columns are not modified):
+        emap[0] = [x, y, z, atom1_energy, ..., atomN_energy, new_atom1_energy, new_atom2_energy, ...]
+    New columns are derived from the r^-6 and r^-12 sums stored with the energy map ('sums' in header, see
+    energy_map), otherwise the sums are calculated at the grid points of the energy map first.
+    Energy maps in 'sums' mode are force field independent therefore they are not modified.
+    If the energy map was calculated with different settings than given in simulation parameters (see
+    energy_map_settings), it is calculated from scratch using energy_map with the atoms of the existing
+    energy map followed by the missing atoms of the atom list (see union_atom_list).
+    Partially written tiled energy maps (see tiled_energy_map) are completed the same way.
+    The energy map file is locked while it is read, extended and written back (see energy_map_lock), so
+    that processes appending to the same energy map (see LazyEnergyMap) do not overwrite each other.
+    Returns list of appended atom names.
+    """
+    with energy_map_lock(emap_path):
+        return _append_energy_map(sim_par, mof_path, atom_list, force_field, emap_path, workers)
+
+
+def _append_energy_map(sim_par, mof_path, atom_list, force_field, emap_path, workers):
+    export_dir = os.path.dirname(emap_path)
+    if incomplete_energy_map(emap_path):
+        # Partially written (tiled) energy map is completed
+        emap_atom_list = read_binary_header(emap_path)[0]['atom_list']
+        full_atom_list = union_atom_list(emap_atom_list, atom_list, force_field)
+        energy_map(sim_par, mof_path, full_atom_list, force_field, export_dir=export_dir, workers=workers)
+        return list(full_atom_list['atom'])
+    emap_atom_list, emap, emap_header = import_energy_map(emap_path, header=True)
+    emap_type = {'npy': 'numpy', 'yaml': 'yaml', 'bin': 'binary'}[os.path.splitext(emap_path)[1][1:]]
+    if energy_map_settings(emap_header, emap_type) != energy_map_settings(sim_par, emap_type):
+        if emap_header['mode'] != 'energy':
+            # Atom list of energy maps in 'sums' mode holds the framework species
+            emap_atom_list = {'atom': [], 'sigma': [], 'epsilon': []}
+        full_atom_list = union_atom_list(emap_atom_list, atom_list, force_field)
+        energy_map(sim_par, mof_path, full_atom_list, force_field, export_dir=export_dir, workers=workers)
+        return list(full_atom_list['atom'])
+    if emap_header['mode'] == 'sums':
+        return []
+
+    new_index = [i for i, atom in enumerate(atom_list['atom']) if atom not in emap_atom_list['atom']]
+    if len(new_index) == 0:
+        return []
+    new_atom_list = {key: [atom_list[key][i] for i in new_index] for key in ['atom', 'sigma', 'epsilon']}
+
+    if emap_header.get('layout') == 'block':
+        emap = energy_map_rows(emap, emap_header)
+    emap = np.asarray(emap, dtype=float)
+    emap_header = dict(emap_header)
+    # Saturated grid points (hard-core overlap or on a framework atom) stay saturated for the new atoms
+    overlap_energy = emap_header.get('overlap_energy') or OVERLAP_ENERGY
+    saturated = emap[:, 3] >= overlap_energy
+
+    if emap_header.get('sums') is not None:
+        sums = np.asarray(emap_header['sums'], dtype=float)
+        mof_name = os.path.basename(emap_path).split('_emap')[0]
+        sigma, epsilon = emap_header['species_sigma'], emap_header['species_epsilon']
+    else:
+        mof = MOF(mof_path)
+        mof.set_force_field(force_field)
+        mof.calculate_vectors()
+        mof_name, sigma, epsilon = mof.name, mof.sigma, mof.epsilon
+        grid_points = emap[:, 0:3]
+        grid_frac = grid_points @ to_frac_matrix(mof.to_frac).T
+        cell_list = CellList(mof, sim_par['cut_off'], frac_range=[grid_frac.min(axis=0), grid_frac.max(axis=0)])
+        calc_index = np.flatnonzero(~saturated)
+        grid_index = np.arange(len(calc_index))
+        if sim_par['energy_map_symmetry'] and emap_header['grid'] == 'fractional' and mof.spacegroup is not None:
+            representative = grid_symmetry(emap_header['shape'], mof.spacegroup.get_symop())
+            calc_index, grid_index = np.unique(representative[calc_index], return_inverse=True)
+        s6, s12 = energy_map_sums(grid_points[calc_index], cell_list, workers=workers)
+        sums = np.full([2 * cell_list.num_species, len(emap)], np.nan)
+        sums[:, ~saturated] = np.concatenate([s6, s12], axis=1)[grid_index].T
+        if sim_par['energy_map_append'] and emap_type != 'yaml':
+            emap_header['sums'] = sums
+
+    num_species = len(sums) // 2
+    c6, c12 = lj_coefficients(sigma, epsilon, new_atom_list)
+    new_columns = np.full([len(emap), len(new_index)], overlap_energy)
+    new_columns[~saturated] = lj_energy(sums[:num_species, ~saturated].T, sums[num_species:, ~saturated].T, c6, c12)
+
+    appended_map = np.concatenate([emap, new_columns], axis=1)
+    energy_map_atoms = {key: list(emap_atom_list[key]) + new_atom_list[key] for key in ['atom', 'sigma', 'epsilon']}
+    export_energy_map(appended_map, energy_map_atoms, dict(sim_par, energy_map_type=emap_type), export_dir, mof_name,
+                      emap_header=emap_header)
+    return new_atom_list['atom']
+
+
+@contextmanager
+def energy_map_lock(emap_path):
+    """
+    Exclusive lock of an energy map for read-modify-write updates, held on a lock file next to the energy map
+    (emap_path + '.lock'). Processes wait until the lock is released. Readers do not need the lock since
+    energy map files are replaced atomically (see atomic_file).
+    """
+    with open(emap_path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_file(file_path, mode='wb'):
+    """
+    Opens a temporary file in the directory of file_path which replaces file_path when it is closed without
+    errors (the temporary file is removed otherwise), so that readers never see a partially written file.
+     >>> with atomic_file(emap_file_path) as emap_file:
+     ...     emap_file.write(emap_bytes)
+    """
+    file_dir, file_name = os.path.split(os.path.abspath(file_path))
+    file_descriptor, temp_path = tempfile.mkstemp(prefix=file_name + '.', suffix='.tmp', dir=file_dir)
+    try:
+        with os.fdopen(file_descriptor, mode) as temp_file:
+            yield temp_file
+        # Temporary files are only readable by the owner, use default permissions instead
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def energy_map_settings(settings, emap_type):
+    """
+    Settings an energy map depends on, read from simulation parameters or from an energy map header:
+        [grid, grid size, cut-off, force field, mode, hard-core overlap, (quantization, sparse ceiling)]
+    Quantization and sparse ceiling are only included for binary energy maps (emap_type='binary').
+    Energy maps can only be extended (see append_energy_map) if they match the simulation parameters.
+    """
+    if 'energy_map_grid' in settings:
+        values = [settings['energy_map_grid'], settings['grid_size'], settings['cut_off'], settings['force_field'],
+                  settings['energy_map_mode'], settings['energy_map_overlap']]
+        if emap_type == 'binary':
+            values += [settings['energy_map_quantize'], settings['energy_map_sparse']]
+    else:
+        # Headers without overlap distance: overlap was not used unless there is an overlap energy
+        overlap = settings.get('overlap', 0 if settings.get('overlap_energy') is None else None)
+        values = [settings['grid'], settings.get('grid_size'), settings.get('cut_off'), settings.get('force_field'),
+                  settings['mode'], overlap]
+        if emap_type == 'binary':
+            values += [settings.get('quantization', {}).get('dtype'), settings.get('sparse', {}).get('ceiling')]
+    return values
+
+
+def union_atom_list(emap_atom_list, atom_list, force_field):
+    """
+    Atoms of an existing energy map followed by the atoms of the atom list that are missing in it.
+    Force field parameters of the existing atoms are read from the force field (stored parameters are kept
+    for atoms that are not in the force field, e.g. dummy atoms).
+    """
+    ff_parameters = {ff[0]: ff[1:] for ff in get_ff_parameters(emap_atom_list['atom'], force_field)}
+    full_atom_list = {'atom': [], 'sigma': [], 'epsilon': []}
+    for i, atom in enumerate(emap_atom_list['atom']):
+        sigma, epsilon = ff_parameters.get(atom, [emap_atom_list['sigma'][i], emap_atom_list['epsilon'][i]])
+        full_atom_list['atom'].append(atom)
+        full_atom_list['sigma'].append(sigma)
+        full_atom_list['epsilon'].append(epsilon)
+    for i, atom in enumerate(atom_list['atom']):
+        if atom not in full_atom_list['atom']:
+            for key in ['atom', 'sigma', 'epsilon']:
+                full_atom_list[key].append(atom_list[key][i])
+    return full_atom_list
+
+
+class LazyEnergyMap:
+    """
+    Energy map whose probe atom columns are calculated the first time they are requested.
+    Energy maps of a 'full' atom list ('energy_map_lazy') are exported with the atoms of the MOF only and the
+    columns of any other atom in the force field are appended (see append_energy_map) and stored back to the
+    energy map file when energy_map_atom_index would resolve to them:
+     >>> lazy_emap = LazyEnergyMap(sim_par, emap_path, mof_path, force_field)
+     >>> lazy_emap.add_atoms(mobile_mof.uniq_atom_names)
+     >>> atom_list, emap, emap_header = lazy_emap.atom_list, lazy_emap.emap, lazy_emap.header
+    Energy maps in 'sums' mode already support any atom and are not modified.
+    Processes running interpenetration jobs with the same energy map append their atoms one after another
+    (the energy map file is locked while it is extended, see append_energy_map).
+    """
+    def __init__(self, sim_par, emap_path, mof_path, force_field, workers=1):
+        self.sim_par = sim_par
+        self.emap_path = emap_path
+        self.mof_path = mof_path
+        self.force_field = force_field
+        self.workers = workers
+        self.load()
+
+    def load(self):
+        """
+        (Re)reads atom list, energy map and header from the energy map file.
+        """
+        self.atom_list, self.emap, self.header = import_energy_map(self.emap_path, header=True)
+
+    def atom_index(self, atom_name):
+        """
+        Energy map index of an atom (see energy_map_atom_index), its column is calculated if it is missing.
+        """
+        self.add_atoms([atom_name])
+        return energy_map_atom_index(atom_name, self.atom_list)
+
+    def add_atoms(self, atom_names):
+        """
+        Calculates and stores energy map columns of the given atoms that are missing in the energy map.
+        Force field parameters of the atoms are read from the force field. Returns list of added atom names.
+        """
+        missing = [atom for atom in sorted(set(atom_names)) if atom not in self.atom_list['atom']]
+        if len(missing) == 0 or self.header.get('mode') == 'sums':
+            return []
+        ff_parameters = get_ff_parameters(missing, self.force_field)
+        atom_list = {'atom': [ff[0] for ff in ff_parameters], 'sigma': [ff[1] for ff in ff_parameters],
+                     'epsilon': [ff[2] for ff in ff_parameters]}
+        new_atoms = append_energy_map(self.sim_par, self.mof_path, atom_list, self.force_field, self.emap_path,
+                                      workers=self.workers)
+        self.load()
+        return new_atoms
+
+
+def cartesian_grid(mof, grid_size):
+    """
+    Rectangular grid with given grid size surrounding the unit cell (bounding box of edge points).
+    Grid points are ordered as x -> y -> z (z changes fastest).
+    Returns grid shape [nx, ny, nz] and grid point coordinates.
+    """
     # Determine max and min coordinates for the unit cell to construct bounding box grid
     sorted_x = sorted(mof.edge_points, key=lambda x: x[0], reverse=True)
     sorted_y = sorted(mof.edge_points, key=lambda y: y[1], reverse=True)
@@ -44,49 +534,369 @@ def energy_map(sim_par, mof_path, atom_list, force_field, export=True, export_di
     emap_max = [ceil(sorted_x[0][0]), ceil(sorted_y[0][1]), ceil(sorted_z[0][2])]
     emap_min = [floor(sorted_x[-1][0]), floor(sorted_y[-1][1]), floor(sorted_z[-1][2])]
 
-    x_grid = np.linspace(emap_min[0], emap_max[0], (emap_max[0] - emap_min[0]) / grid_size + 1)
-    y_grid = np.linspace(emap_min[1], emap_max[1], (emap_max[1] - emap_min[1]) / grid_size + 1)
-    z_grid = np.linspace(emap_min[2], emap_max[2], (emap_max[2] - emap_min[2]) / grid_size + 1)
-
-    num_atoms = len(atom_list['sigma'])
-
-    # Initialize energy map according to grid size and coordinates plus number of unique atoms
-    energy_map = np.zeros([len(x_grid) * len(y_grid) * len(z_grid), num_atoms + 3])
-
-    sig, eps = lorentz_berthelot_mix(mof.sigma, atom_list['sigma'], mof.epsilon, atom_list['epsilon'])
-
-    map_index = 0
-    v = np.zeros([num_atoms])
-
-    for x in x_grid:
-        for y in y_grid:
-            for z in z_grid:
-                energy_map[map_index][0:3] = [x, y, z]
-                v_total = np.zeros([num_atoms])
-                for unit_cell in mof.packed_coors:
-                    mof_index = 0
-                    for atom_coor in unit_cell:
-                        # Determine the index of atom in MOF to calculate the energy value
-                        atom_index_1 = mof.uniq_atom_names.index(mof.atom_names[mof_index])
-                        mof_index += 1
-                        dist = coor_dist(atom_coor, [x, y, z])
-                        if dist > cut_off:
-                            continue
-                        if dist == 0:
-                            energy_map[map_index][3:(num_atoms + 3)] = np.ones([1, num_atoms]) * inf
-                        else:
-                            for atom_index_2 in range(num_atoms):
-                                sig_mix = sig[atom_index_1][atom_index_2]
-                                eps_mix = eps[atom_index_1][atom_index_2]
-                                v[atom_index_2] = lennard_jones(dist, sig_mix, eps_mix)
-                                v_total[atom_index_2] = v_total[atom_index_2] + v[atom_index_2]
-                energy_map[map_index][3:(num_atoms + 3)] = v_total
-                map_index += 1
+    x_grid = np.linspace(emap_min[0], emap_max[0], int((emap_max[0] - emap_min[0]) / grid_size + 1))
+    y_grid = np.linspace(emap_min[1], emap_max[1], int((emap_max[1] - emap_min[1]) / grid_size + 1))
+    z_grid = np.linspace(emap_min[2], emap_max[2], int((emap_max[2] - emap_min[2]) / grid_size + 1))
 
-    if export:
-        export_energy_map(energy_map, atom_list, sim_par, export_dir, mof.name)
+    grid = np.meshgrid(x_grid, y_grid, z_grid, indexing='ij')
+    grid_points = np.stack([g.ravel() for g in grid], axis=1)
+    return [len(x_grid), len(y_grid), len(z_grid)], grid_points
+
+
+def fractional_grid_shape(mof, grid_size):
+    """
+    Shape of the fractional grid of a MOF (see fractional_grid): n = ceil(length / grid_size) for a, b and c.
+    """
+    return [max(1, int(ceil(length / grid_size - 1e-9))) for length in mof.uc_size]
+
+
+def fractional_grid(mof, grid_size):
+    """
+    Periodic grid in fractional coordinates covering exactly one unit cell.
+    Each unit cell vector is divided into n = ceil(length / grid_size) segments, so that the spacing
+    along a, b and c never exceeds grid_size. Grid points are ordered as a -> b -> c (c changes fastest)
+    and the points at fractional coordinate 1 are not included (they are periodic images of 0).
+    Returns grid shape [na, nb, nc] and grid point coordinates (cartesian).
+    """
+    grid_shape = fractional_grid_shape(mof, grid_size)
+    axes = [np.arange(n) / n for n in grid_shape]
+    grid = np.meshgrid(*axes, indexing='ij')
+    grid_frac = np.stack([g.ravel() for g in grid], axis=1)
+    grid_points = grid_frac @ to_car_matrix(mof.to_car).T
+    return grid_shape, grid_points
+
+
+def octree_energy_map(sim_par, mof, atom_list, workers=1):
+    """
+    Calculates adaptive (octree) energy map for a MOF object (see ipmof.octree.build_octree).
+    The finest grid spacing is grid_size and root cells are 2^octree_depth times larger. Cells are
+    refined if interpolation error at the cell center exceeds octree_tolerance or if the energy
+    crosses atom_energy_limit inside the cell.
+    Simulation parameters used:
+        - cut_off   - grid_size     - octree_depth  - octree_tolerance  - atom_energy_limit
+        - energy_map_overlap
+    Returns energy map (emap[i] = [x, y, z, atom1_energy, ...] for each octree grid point) and header.
+    Octree structure is stored in the header ('tree') together with root grid shape ('shape').
+    """
+    depth = sim_par['octree_depth']
+    root_size = sim_par['grid_size'] * 2 ** depth
+    root_shape = [max(1, int(ceil(length / root_size - 1e-9))) for length in mof.uc_size]
+
+    cell_list = CellList(mof, sim_par['cut_off'])
+    overlap = overlap_radii(sim_par, mof, atom_list)
+    c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list)
+
+    def energy(points):
+        s6, s12 = energy_map_sums(points, cell_list, workers=workers, overlap=overlap)
+        point_energy = lj_energy(s6, s12, c6, c12)
+        point_energy[~np.isfinite(point_energy[:, 0])] = OVERLAP_ENERGY
+        return point_energy
+
+    grid_frac, grid_energy, tree = build_octree(energy, mof.to_car, root_shape, depth,
+                                                sim_par['atom_energy_limit'], sim_par['octree_tolerance'])
+    energy_map = np.zeros([len(grid_frac), len(atom_list['sigma']) + 3])
+    energy_map[:, 0:3] = grid_frac @ to_car_matrix(mof.to_car).T
+    energy_map[:, 3:] = grid_energy
+
+    emap_header = energy_map_header(sim_par, mof, root_shape)
+    emap_header.update(mode='energy', depth=depth, tree=tree)
+    return energy_map, emap_header
+
+
+def grid_symmetry(grid_shape, symmetry_operations):
+    """
+    Finds symmetry equivalent points of a fractional grid for given symmetry operations
+    (list of [rotation, translation] in fractional coordinates, e.g. Spacegroup.get_symop()).
+    An operation is used only if it maps the grid onto itself; for [na, nb, nc] grid and
+    f' = R * f + t this requires R[i][j] * n[i] / n[j] and t[i] * n[i] to be integers.
+    Returns index of the representative (lowest index equivalent) grid point for each grid point.
+    """
+    n = np.array(grid_shape)
+    grid_index = np.indices(grid_shape).reshape(3, -1)
+    representative = np.arange(grid_index.shape[1])
+    for rotation, translation in symmetry_operations:
+        index_rotation = np.array(rotation) * n[:, None] / n[None, :]
+        index_translation = np.array(translation) * n
+        if not (np.allclose(index_rotation, np.rint(index_rotation), atol=1e-6) and
+                np.allclose(index_translation, np.rint(index_translation), atol=1e-6)):
+            continue
+        mapped = np.rint(index_rotation).astype(int) @ grid_index
+        mapped += np.rint(index_translation).astype(int)[:, None]
+        mapped %= n[:, None]
+        np.minimum(representative, (mapped[0] * n[1] + mapped[1]) * n[2] + mapped[2], out=representative)
+    return representative
+
+
+def energy_map_header(sim_par, mof, grid_shape):
+    """
+    Energy map header with the information required to interpret the grid:
+        - grid: 'fractional', 'cartesian' or 'octree'   - shape: [na, nb, nc] or [nx, ny, nz]
+        - mode: 'energy' or 'sums'              - species: framework species (for 'sums' mode)
+        - uc_size / uc_angle / to_frac / to_car: unit cell of the MOF
+        - grid_size / cut_off: simulation parameters used
+        - force_field / species_sigma / species_epsilon: force field parameters of framework species
+        - spacegroup: space group symbol of the MOF (None if not available)
+        - overlap: hard-core overlap distance used ('energy_map_overlap')
+        - overlap_energy: energy of saturated grid points (hard-core overlap or grid points on a framework atom)
+            Interpolation returns this value if any of the surrounding grid points is saturated.
+    """
+    emap_header = {'grid': sim_par['energy_map_grid'],
+                   'mode': sim_par['energy_map_mode'],
+                   'species': list(mof.uniq_atom_names),
+                   'shape': [int(n) for n in grid_shape],
+                   'uc_size': [float(i) for i in mof.uc_size],
+                   'uc_angle': [float(i) for i in mof.uc_angle],
+                   'to_frac': [float(i) for i in mof.to_frac],
+                   'to_car': [float(i) for i in mof.to_car],
+                   'grid_size': sim_par['grid_size'],
+                   'cut_off': sim_par['cut_off'],
+                   'force_field': sim_par['force_field'],
+                   'species_sigma': [float(i) for i in mof.sigma],
+                   'species_epsilon': [float(i) for i in mof.epsilon],
+                   'spacegroup': mof.spacegroup.symbol if mof.spacegroup is not None else None,
+                   'overlap': sim_par['energy_map_overlap'],
+                   'overlap_energy': OVERLAP_ENERGY}
+    return emap_header
+
+
+def energy_map_sums(points, cell_list, workers=1, overlap=None, switch_on=None):
+    """
+    Calculates sum of r^-6 and r^-12 terms for each framework species at given points
+    using neighbor atoms from a cell list. Points in each bin are evaluated in blocks.
+    If workers > 1 the points are split into tasks (groups of whole cell list bins, see parallel_tasks) which are
+    evaluated in a process pool (see parallel_energy_map_sums).
+    If overlap=[overlap_cell_list, radii] is given, points overlapping with framework atoms are
+    skipped and their sums are set to NaN (see overlap_points).
+    If switch_on is given, terms are multiplied by the near field switching function (see lj_sums).
+    Returns two arrays with shape (number of points, number of species).
+    """
+    if overlap is not None:
+        saturated = overlap_points(points, *overlap)
+        s6 = np.full([len(points), cell_list.num_species], np.nan)
+        s12 = np.full([len(points), cell_list.num_species], np.nan)
+        s6[~saturated], s12[~saturated] = energy_map_sums(points[~saturated], cell_list, workers=workers,
+                                                          switch_on=switch_on)
+        return s6, s12
+    if workers > 1:
+        return parallel_energy_map_sums(points, cell_list, workers, switch_on=switch_on)
+    s6 = np.zeros([len(points), cell_list.num_species])
+    s12 = np.zeros([len(points), cell_list.num_species])
+    for point_index, atom_coors, species_slices in cell_list.groups(points):
+        block_size = max(1, BLOCK_ELEMENTS // max(len(atom_coors), 1))
+        for start in range(0, len(point_index), block_size):
+            block = point_index[start:start + block_size]
+            s6[block], s12[block] = lj_sums(points[block], atom_coors, species_slices, cell_list.cut_off,
+                                            switch_on=switch_on)
+    return s6, s12
+
+
+def parallel_energy_map_sums(points, cell_list, workers, switch_on=None):
+    """
+    Process parallel version of energy_map_sums.
+    Each worker evaluates tasks of whole cell list bins (see parallel_tasks) and writes the sums directly into
+    a shared memory array, therefore only task indices are sent to the workers and nothing is sent back.
+    Bins (and blocks within bins) are the same as the serial calculation so the results are identical.
+    """
+    num_species = cell_list.num_species
+    tasks = parallel_tasks(points, cell_list, workers)
+    shared_sums = RawArray('d', len(points) * 2 * num_species)
+    initargs = (points, cell_list, tasks, shared_sums, switch_on)
+    with Pool(workers, initializer=_init_sums_worker, initargs=initargs) as pool:
+        pool.map(_sums_worker, np.unique(tasks).tolist(), chunksize=1)
+    sums = np.frombuffer(shared_sums).reshape(len(points), 2 * num_species)
+    return sums[:, :num_species].copy(), sums[:, num_species:].copy()
+
+
+# Energy map data for worker processes (set once per process by _init_sums_worker)
+_sums_worker_data = {}
+
+
+def parallel_tasks(points, cell_list, workers):
+    """
+    Splits points into tasks for parallel_energy_map_sums: occupied cell list bins are divided into
+    PARALLEL_TASKS_PER_WORKER * workers groups of consecutive bins (at most one task per bin) with about the
+    same number of points. Points of a bin are never split, so each point is evaluated in the same block as in
+    the serial calculation.
+    Returns task index of each point.
+    """
+    bins = cell_list.point_bins_of(points)
+    bin_id = (bins[:, 0] * cell_list.point_bins[1] + bins[:, 1]) * cell_list.point_bins[2] + bins[:, 2]
+    uniq_id, bin_index, bin_count = np.unique(bin_id, return_inverse=True, return_counts=True)
+    num_tasks = min(len(uniq_id), PARALLEL_TASKS_PER_WORKER * workers)
+    # Task of each bin from the cumulative number of points before the bin
+    points_before = np.cumsum(bin_count) - bin_count
+    bin_task = np.minimum(points_before * num_tasks // len(points), num_tasks - 1)
+    return bin_task[bin_index.ravel()]
+
+
+def _init_sums_worker(points, cell_list, tasks, shared_sums, switch_on):
+    _sums_worker_data.update(points=points, cell_list=cell_list, tasks=tasks, shared_sums=shared_sums,
+                             switch_on=switch_on)
+
+
+def _sums_worker(task):
+    points = _sums_worker_data['points']
+    cell_list = _sums_worker_data['cell_list']
+    num_species = cell_list.num_species
+    point_index = np.flatnonzero(_sums_worker_data['tasks'] == task)
+    s6, s12 = energy_map_sums(points[point_index], cell_list, switch_on=_sums_worker_data['switch_on'])
+    sums = np.frombuffer(_sums_worker_data['shared_sums']).reshape(len(points), 2 * num_species)
+    sums[point_index, :num_species] = s6
+    sums[point_index, num_species:] = s12
+
+
+def overlap_radii(sim_par, mof, atom_list, frac_range=None):
+    """
+    Hard-core overlap radius for each framework species: energy_map_overlap times the smallest
+    (Lorentz-Berthelot) mixed sigma of that species with the atom list. For energy maps in 'sums' mode
+    sigma of the framework species is used.
+    Returns [overlap_cell_list, radii] to be used with energy_map_sums, or None if overlap detection
+    is not used (energy_map_overlap = 0).
+    """
+    if not sim_par['energy_map_overlap']:
+        return None
+    if sim_par['energy_map_mode'] == 'sums':
+        sigma = np.array(mof.sigma, dtype=float)
     else:
-        return energy_map
+        sigma = lorentz_berthelot_mix(mof.sigma, atom_list['sigma'], mof.epsilon, atom_list['epsilon'])[0]
+        sigma = sigma.min(axis=1)
+    radii = sim_par['energy_map_overlap'] * sigma
+    # Very small bins make the search slower (more bins to visit), bins are at least cut_off / 4 wide
+    overlap_cut_off = max(radii.max(), sim_par['cut_off'] / 4)
+    return [CellList(mof, overlap_cut_off, frac_range=frac_range, divisions=1), radii]
+
+
+def overlap_points(points, cell_list, radii):
+    """
+    Finds points that are closer to any framework atom than the overlap radius of its species.
+    Cell list cut_off must be at least as large as the largest radius.
+    Returns a boolean array (True for overlapping points).
+    """
+    overlap = np.zeros(len(points), dtype=bool)
+    for point_index, atom_coors, species_slices in cell_list.groups(points):
+        r2 = (points[point_index, 0, None] - atom_coors[:, 0]) ** 2
+        r2 += (points[point_index, 1, None] - atom_coors[:, 1]) ** 2
+        r2 += (points[point_index, 2, None] - atom_coors[:, 2]) ** 2
+        for species_index, species in enumerate(species_slices):
+            overlap[point_index] |= np.any(r2[:, species] < radii[species_index] ** 2, axis=1)
+    return overlap
+
+
+def lj_coefficients(mof_sigma, mof_epsilon, atom_list):
+    """
+    Calculates Lennard-Jones coefficients for each framework species (rows) and probe atom (columns)
+    using Lorentz-Berthelot mixing rules:
+        V(r) = c12 / r^12 - c6 / r^6  ->  c12 = 4 * eps * sig^12 , c6 = 4 * eps * sig^6
+    """
+    sig, eps = lorentz_berthelot_mix(mof_sigma, atom_list['sigma'], mof_epsilon, atom_list['epsilon'])
+    c6 = 4 * eps * sig ** 6
+    c12 = 4 * eps * sig ** 12
+    return c6, c12
+
+
+def lj_sums(points, atom_coors, species_slices, cut_off, switch_on=None):
+    """
+    Calculates sum of r^-6 and r^-12 terms between given points and framework atoms of each species.
+    Atoms further than cut_off are excluded. Points on a framework atom (closer than DISTANCE_TOLERANCE) are
+    saturated: the r^-12 sum of that species is infinite (energy map points are set to OVERLAP_ENERGY).
+    If switch_on is given, terms are multiplied by near_field_switch(r, switch_on, cut_off).
+    Returns two arrays with shape (number of points, number of species).
+    """
+    r2 = (points[:, 0, None] - atom_coors[:, 0]) ** 2
+    r2 += (points[:, 1, None] - atom_coors[:, 1]) ** 2
+    r2 += (points[:, 2, None] - atom_coors[:, 2]) ** 2
+    inv6 = np.zeros(r2.shape)
+    within = (r2 <= (cut_off + DISTANCE_TOLERANCE) ** 2) & (r2 >= DISTANCE_TOLERANCE ** 2)
+    inv6[within] = 1 / r2[within] ** 3
+    inv12 = inv6 ** 2
+    inv12[r2 < DISTANCE_TOLERANCE ** 2] = np.inf
+    if switch_on is not None:
+        switch = near_field_switch(np.sqrt(r2), switch_on, cut_off)
+        inv6 *= switch
+        inv12 *= switch
+
+    s6 = np.zeros([len(points), len(species_slices)])
+    s12 = np.zeros([len(points), len(species_slices)])
+    for species_index, species in enumerate(species_slices):
+        s6[:, species_index] = inv6[:, species].sum(axis=1)
+        s12[:, species_index] = inv12[:, species].sum(axis=1)
+    return s6, s12
+
+
+def near_field_switch(r, switch_on, switch_off):
+    """
+    Smooth (C2) switching function: 1 for r <= switch_on, 0 for r >= switch_off and
+    1 - (10 x^3 - 15 x^4 + 6 x^5) in between, where x = (r - switch_on) / (switch_off - switch_on).
+    """
+    x = np.clip((np.asarray(r) - switch_on) / (switch_off - switch_on), 0, 1)
+    return 1 - x ** 3 * (10 - 15 * x + 6 * x ** 2)
+
+
+def fft_energy_map_sums(mof, grid_shape, grid_points, cut_off, near_field, workers=1, overlap=None):
+    """
+    Calculates sum of r^-6 and r^-12 terms for each framework species on a fractional grid (see fractional_grid)
+    as periodic convolutions using FFT. The kernel f(r) is split using near_field_switch s(r), which goes from 1 at
+    (near_field - FFT_SWITCH_WIDTH) to 0 at least FFT_SWITCH_WIDTH and FFT_SWITCH_POINTS grid spacings later
+    (the near field extends beyond near_field for coarse grids):
+        - far field f(r) * (1 - s(r)): smooth part, framework atoms of each species are spread onto the grid
+          (trilinear weights) and convolved with the kernel of all grid displacements (periodic images within
+          cut_off are included), cost scales with N log N for N grid points
+        - near field f(r) * s(r): singular part, summed directly over the atoms within near_field of each grid
+          point using a cell list (see energy_map_sums), overlapping grid points (overlap) are set to NaN
+    Returns two arrays with shape (number of grid points, number of species), same as energy_map_sums.
+    """
+    to_frac = to_frac_matrix(mof.to_frac)
+    to_car = to_car_matrix(mof.to_car)
+    n = np.array(grid_shape)
+    grid_spacing = np.max(np.linalg.norm(to_car, axis=0) / n)
+    switch_on = max(min(near_field, cut_off) - FFT_SWITCH_WIDTH, 0.0)
+    near_field = min(switch_on + max(FFT_SWITCH_WIDTH, FFT_SWITCH_POINTS * grid_spacing), cut_off)
+    num_species = len(mof.uniq_atom_names)
+
+    # Far field kernel for each grid displacement (wrapped to [-0.5, 0.5)) and its periodic images
+    disp = np.stack(np.meshgrid(*[np.arange(k) / k for k in grid_shape], indexing='ij'), axis=-1)
+    disp -= np.round(disp)
+    image_range = np.ceil(cut_off * np.linalg.norm(to_frac, axis=1) + 0.5).astype(int)
+    kernel6 = np.zeros(grid_shape)
+    kernel12 = np.zeros(grid_shape)
+    for shift in itertools.product(*[range(-m, m + 1) for m in image_range]):
+        r2 = (((disp + shift) @ to_car.T) ** 2).sum(axis=-1)
+        # Far field vanishes at zero distance (grid points on a framework atom are saturated by the near field)
+        within = (r2 <= (cut_off + DISTANCE_TOLERANCE) ** 2) & (r2 > 0)
+        far = 1 - near_field_switch(np.sqrt(r2[within]), switch_on, near_field)
+        kernel6[within] += far / r2[within] ** 3
+        kernel12[within] += far / r2[within] ** 6
+
+    # Spread framework atoms of each species onto the grid (trilinear weights)
+    species = np.array([mof.uniq_atom_names.index(name) for name in mof.atom_names])
+    frac = np.array(mof.atom_coors, dtype=float).reshape(-1, 3) @ to_frac.T
+    grid_frac = (frac - np.floor(frac)) * n
+    corner0 = np.floor(grid_frac).astype(int)
+    t = grid_frac - corner0
+    density = np.zeros([num_species] + list(grid_shape))
+    for corner in itertools.product([0, 1], repeat=3):
+        weight = np.prod(np.where(corner, t, 1 - t), axis=1)
+        index = (corner0 + corner) % n
+        np.add.at(density, (species, index[:, 0], index[:, 1], index[:, 2]), weight)
+
+    density_ft = np.fft.rfftn(density, axes=(1, 2, 3))
+    far6 = np.fft.irfftn(density_ft * np.fft.rfftn(kernel6), s=grid_shape, axes=(1, 2, 3))
+    far12 = np.fft.irfftn(density_ft * np.fft.rfftn(kernel12), s=grid_shape, axes=(1, 2, 3))
+
+    near_cell_list = CellList(mof, near_field)
+    s6, s12 = energy_map_sums(grid_points, near_cell_list, workers=workers, overlap=overlap, switch_on=switch_on)
+    return s6 + far6.reshape(num_species, -1).T, s12 + far12.reshape(num_species, -1).T
+
+
+def lj_energy(s6, s12, c6, c12):
+    """
+    Combines r^-6 and r^-12 sums of each framework species with LJ coefficients of the probe atoms.
+    Returns energies with shape (number of points, number of probe atoms).
+    """
+    energy = np.zeros([len(s6), c6.shape[1]])
+    for species_index in range(c6.shape[0]):
+        energy += s12[:, species_index, None] * c12[species_index] - s6[:, species_index, None] * c6[species_index]
+    return energy
 
 
 def energy_map_index(coor, x_length, y_length):
@@ -115,47 +925,598 @@ def energy_map_atom_index(atom_name, atom_list):
     return int(atom_list['atom'].index(atom_name) + 3) if atom_name in atom_list['atom'] else 3
 
 
-def export_energy_map(emap, atom_list, sim_par, emap_export_dir, mof_name):
+def export_energy_map(emap, atom_list, sim_par, emap_export_dir, mof_name, emap_header=None):
     """
-    Exports energy map array into a npy or yaml file.
+    Exports energy map array into a npy, yaml or binary (see write_binary_energy_map) file.
+    If an energy map header is given it is stored together with the energy map.
+    Binary energy maps are quantized according to 'energy_map_quantize' simulation parameter and only grid
+    points below 'energy_map_sparse' are stored if it is set (see sparse_energy_block).
+    If 'energy_map_interpolation' is 'cubic', B-spline coefficients of fractional energy maps (see cubic_coefficients)
+    are stored together with numpy and binary energy maps (yaml energy maps are calculated when they are read).
     """
+    if emap_header is not None:
+        emap_header = {key: emap_header[key] for key in emap_header if key != 'coefficients'}
+        if sim_par['energy_map_interpolation'] == 'cubic' and emap_header['grid'] == 'fractional' and \
+           emap_header['mode'] == 'energy':
+            emap_header['coefficients'] = cubic_coefficients(emap, emap_header)
     if sim_par['energy_map_type'] == 'yaml':
         emap_file_path = os.path.join(emap_export_dir, mof_name + '_emap.yaml')
-        if os.path.exists(emap_file_path):
-            os.remove(emap_file_path)
         emap_dict = {'energy_map': emap.tolist(), 'atom_list': atom_list}
-        with open(emap_file_path, 'w') as emap_file:
-            yaml.dump(emap_dict, emap_file)
+        if emap_header is not None:
+            emap_dict['header'] = {key: emap_header[key] for key in emap_header if key not in ['coefficients', 'sums']}
+        with atomic_file(emap_file_path, 'w') as emap_file:
+            yaml.safe_dump(plain_data(emap_dict), emap_file)
         print('Energy map exported as', emap_file_path)
 
     if sim_par['energy_map_type'] == 'numpy':
-        emap_file_path = os.path.join(emap_export_dir, mof_name + '_emap')
-        if os.path.exists(emap_file_path):
-            os.remove(emap_file_path)
-        emap_numpy = np.array([atom_list['atom'], atom_list['sigma'], atom_list['epsilon'], emap])
-        np.save(emap_file_path, emap_numpy)
+        emap_file_path = os.path.join(emap_export_dir, mof_name + '_emap.npy')
+        emap_items = [atom_list['atom'], atom_list['sigma'], atom_list['epsilon'], emap]
+        if emap_header is not None:
+            emap_items.append(emap_header)
+        emap_numpy = np.empty(len(emap_items), dtype=object)
+        for item_index, item in enumerate(emap_items):
+            emap_numpy[item_index] = item
+        with atomic_file(emap_file_path) as emap_file:
+            np.save(emap_file, emap_numpy)
+        print('Energy map exported as', emap_file_path)
+
+    if sim_par['energy_map_type'] == 'binary':
+        emap_file_path = os.path.join(emap_export_dir, mof_name + '_emap.bin')
+        write_binary_energy_map(emap_file_path, emap, atom_list, emap_header,
+                                quantize=sim_par['energy_map_quantize'], sparse=sim_par['energy_map_sparse'])
         print('Energy map exported as', emap_file_path)
 
 
-def import_energy_map(emap_file_path):
+def plain_data(data):
     """
-    Reads energy map (yaml or numpy) from a given directory and returns both atom list and energy map.
+    Converts numpy arrays and numbers in (nested) dictionaries and lists to Python lists and numbers,
+    so that they can be written with yaml.safe_dump (e.g. the octree 'tree' of an energy map header).
+    """
+    if isinstance(data, dict):
+        return {key: plain_data(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [plain_data(value) for value in data]
+    if isinstance(data, (np.ndarray, np.generic)):
+        return plain_data(data.tolist())
+    return data
+
+
+def import_energy_map(emap_file_path, header=False):
+    """
+    Reads energy map (yaml, numpy or binary) from a given directory and returns both atom list and energy map.
+    The format is given by the file extension (.yaml, .npy or .bin), other extensions raise ValueError.
+    If header=True the energy map header is returned as well:
+     >>> atom_list, emap, emap_header = import_energy_map(emap_file_path, header=True)
+    Energy maps without a header are assumed to be cartesian grids (grid size of 1).
+    Binary energy maps are memory-mapped energy blocks (see read_binary_energy_map).
+    If the file does not exist but its directory is an energy map archive, the energy map of the MOF
+    is read from the archive (see archive_energy_maps).
     """
     emap_format = os.path.splitext(emap_file_path)[1][1:]
+    emap_header = {'grid': 'cartesian', 'mode': 'energy'}
+
+    emap_dir = os.path.dirname(emap_file_path)
+    if not os.path.exists(emap_file_path) and is_energy_map_archive(emap_dir):
+        mof_name = os.path.basename(emap_file_path).split('_emap')[0]
+        atom_list, energy_map, emap_header = read_archived_energy_map(emap_dir, mof_name)
+        emap_format = 'archive'
 
     if emap_format == 'yaml':
-        emap = yaml.load(open(emap_file_path, 'r'))
+        with open(emap_file_path, 'r') as emap_file:
+            emap = yaml.safe_load(emap_file)
         atom_list = emap['atom_list']
         energy_map = emap['energy_map']
-        return atom_list, energy_map
+        if 'header' in emap:
+            emap_header = emap['header']
+            energy_map = np.array(energy_map)
 
     if emap_format == 'npy':
-        emap = np.load(emap_file_path)
-        atom_list = {'atom': emap[0], 'sigma': emap[1], 'epsilon': emap[2]}
+        emap = np.load(emap_file_path, allow_pickle=True)
+        atom_list = {'atom': list(emap[0]), 'sigma': list(emap[1]), 'epsilon': list(emap[2])}
         energy_map = emap[3]
+        if len(emap) > 4:
+            emap_header = emap[4]
+
+    if emap_format == 'bin':
+        atom_list, energy_map, emap_header = read_binary_energy_map(emap_file_path)
+
+    if emap_format not in ['yaml', 'npy', 'bin', 'archive']:
+        raise ValueError('Unknown energy map format: %s (yaml, npy or bin)' % emap_file_path)
+
+    if header:
+        return atom_list, energy_map, emap_header
+    else:
         return atom_list, energy_map
 
 
+def archive_energy_maps(emap_path_list, archive_dir, num_shards=16):
+    """
+    Stores given energy maps (numpy, yaml or binary) in a single chunked and compressed archive
+    split into num_shards files (see ipmof.archive.write_energy_map_archive).
+    Energy maps are read one at a time and stored as energy blocks; energy maps without a regular
+    grid header (old cartesian energy maps and octree energy maps) are skipped.
+    Energy maps in the archive are read using import_energy_map with the archive directory:
+     >>> atom_list, emap, emap_header = import_energy_map(os.path.join(archive_dir, 'MOF_emap.bin'), header=True)
+    Returns archive index.
+    """
+    def energy_maps():
+        for emap_path in emap_path_list:
+            mof_name = os.path.basename(emap_path).split('_emap')[0]
+            atom_list, emap, emap_header = import_energy_map(emap_path, header=True)
+            if emap_header.get('layout') == 'block':
+                emap_block = decode_energy_block(emap, emap_header).astype('<f4')
+                emap_header = {key: emap_header[key] for key in emap_header
+                               if key not in ['quantization', 'coefficients', 'sparse', 'values_offset', 'sums',
+                                              'coefficients_offset', 'sums_offset']}
+                emap_header['dtype'] = '<f4'
+            elif 'shape' in emap_header and emap_header['grid'] in ['fractional', 'cartesian']:
+                emap = np.asarray(emap, dtype=float)
+                emap_header = {key: emap_header[key] for key in emap_header if key not in ['coefficients', 'sums']}
+                emap_header.update(energy_map_lattice(emap, emap_header))
+                emap_block = energy_map_block(emap, emap_header)
+            else:
+                print('Energy map skipped (no regular grid header) ->', emap_path)
+                continue
+            atom_list = {key: [str(i) if key == 'atom' else float(i) for i in atom_list[key]]
+                         for key in ['atom', 'sigma', 'epsilon']}
+            yield mof_name, atom_list, emap_block, emap_header
+
+    return write_energy_map_archive(archive_dir, energy_maps(), num_shards=num_shards)
+
+
+def write_binary_energy_map(emap_file_path, emap, atom_list, emap_header, quantize=None, sparse=None):
+    """
+    Writes energy map in binary format (version 1) which can be memory-mapped:
+        - magic bytes (8, 'IPMOFMAP') | version (uint32) | header size (uint32)
+        - header: JSON encoded energy map header with atom list, grid origin and lattice, padded with
+          spaces (BINARY_HEADER_SLACK bytes are reserved for in-place updates of the header)
+        - energy block: float32 (little endian) array with shape (columns, na, nb, nc)
+    Energy values of grid point [i, j, k] are stored in block[:, i, j, k] and its coordinates are:
+        origin + i * lattice[0] + j * lattice[1] + k * lattice[2]
+    Only regular grids ('fractional' or 'cartesian') can be stored in binary format.
+    If quantize is given ('uint8' or 'uint16') energy block is stored as quantized energy codes
+    (see quantize_energy_block), this is only possible for energy maps in 'energy' mode.
+    If sparse (energy ceiling) is given only grid points with energy <= sparse (for any atom) are stored
+    (see sparse_energy_block): the energy block is replaced by the occupancy mask (uint64 words) followed by
+    the float32 values with shape (columns, stored points) starting at 'values_offset'. Excluded grid points
+    are read as saturated ('overlap_energy' in header), this is only possible for energy maps in 'energy' mode.
+    B-spline coefficients in the header (see cubic_coefficients) are stored as a float32 block with the same
+    shape after the energy block (starting at 'coefficients_offset', a multiple of 64 bytes).
+    Stored r^-6 and r^-12 sums in the header (see energy_map) are written last as a float64 block with shape
+    (2 * species, grid points) starting at 'sums_offset'.
+    """
+    if emap_header is None or emap_header['grid'] not in ['fractional', 'cartesian']:
+        raise ValueError('Binary energy map format requires a fractional or cartesian grid header')
+    if quantize is not None and emap_header['mode'] != 'energy':
+        raise ValueError('Quantized energy maps require energy map mode: energy')
+    if sparse is not None and (emap_header['mode'] != 'energy' or quantize is not None):
+        raise ValueError('Sparse energy maps require energy map mode: energy (without quantization)')
+    emap = np.asarray(emap, dtype=float)
+    binary_header = dict(emap_header, version=BINARY_VERSION, layout='block', dtype='<f4',
+                         columns=emap.shape[1] - 3, **energy_map_lattice(emap, emap_header))
+    for key in ['quantization', 'sparse', 'values_offset', 'coefficients_offset', 'sums_offset']:
+        binary_header.pop(key, None)
+    coefficients = binary_header.pop('coefficients', None)
+    sums = binary_header.pop('sums', None)
+    binary_header['atom_list'] = {key: [str(i) if key == 'atom' else float(i) for i in atom_list[key]]
+                                  for key in ['atom', 'sigma', 'epsilon']}
+    emap_block = energy_map_block(emap, binary_header)
+    if quantize is not None:
+        emap_block, binary_header['quantization'] = quantize_energy_block(emap_block, quantize,
+                                                                          emap_header.get('overlap_energy'))
+        binary_header['dtype'] = QUANTIZE_DTYPES[quantize]
+    mask = None
+    if sparse is not None:
+        mask, emap_block = sparse_energy_block(emap_block, sparse)
+        binary_header['overlap_energy'] = OVERLAP_ENERGY
+        binary_header['sparse'] = {'ceiling': float(sparse), 'words': len(mask), 'points': emap_block.shape[1],
+                                   'excluded_energy': OVERLAP_ENERGY}
+    header_bytes = json.dumps(binary_header).encode()
+    # Energy block starts at a multiple of 64 bytes
+    header_size = len(header_bytes) + BINARY_HEADER_SLACK
+    header_size += -(16 + header_size) % 64
+    block_end = 16 + header_size
+    if mask is not None:
+        block_end += mask.nbytes
+        binary_header['values_offset'] = block_end + -block_end % 64
+        block_end = binary_header['values_offset']
+    block_end += emap_block.nbytes
+    if coefficients is not None:
+        binary_header['coefficients_offset'] = block_end + -block_end % 64
+        block_end = binary_header['coefficients_offset'] + 4 * int(np.prod(np.shape(coefficients)))
+    if sums is not None:
+        binary_header['sums_offset'] = block_end + -block_end % 64
+    header_bytes = json.dumps(binary_header).encode()
+    # Written to a temporary file first so that readers (memory-mapped) never see a partial energy map
+    with atomic_file(emap_file_path) as emap_file:
+        emap_file.write(BINARY_MAGIC + struct.pack('<II', BINARY_VERSION, header_size))
+        emap_file.write(header_bytes.ljust(header_size))
+        if mask is not None:
+            emap_file.write(mask.tobytes())
+            emap_file.write(bytes(binary_header['values_offset'] - emap_file.tell()))
+        emap_file.write(emap_block.tobytes())
+        if coefficients is not None:
+            emap_file.write(bytes(binary_header['coefficients_offset'] - emap_file.tell()))
+            emap_file.write(np.ascontiguousarray(coefficients, dtype='<f4').tobytes())
+        if sums is not None:
+            emap_file.write(bytes(binary_header['sums_offset'] - emap_file.tell()))
+            emap_file.write(np.ascontiguousarray(sums, dtype='<f8').tobytes())
+
+
+def read_binary_header(emap_file_path):
+    """
+    Reads header of an energy map in binary format (see write_binary_energy_map).
+    Returns energy map header and header size (bytes reserved for the header).
+    """
+    with open(emap_file_path, 'rb') as emap_file:
+        magic = emap_file.read(8)
+        version, header_size = struct.unpack('<II', emap_file.read(8))
+        if magic != BINARY_MAGIC or version > BINARY_VERSION:
+            raise ValueError('Unknown energy map format: %s' % emap_file_path)
+        emap_header = json.loads(emap_file.read(header_size).decode())
+    return emap_header, header_size
+
+
+def update_binary_header(emap_file_path, emap_header, header_size):
+    """
+    Overwrites header of an energy map in binary format in place (header must fit into header size).
+    """
+    header_bytes = json.dumps(emap_header).encode()
+    if len(header_bytes) > header_size:
+        raise ValueError('Energy map header does not fit into reserved header size: %s' % emap_file_path)
+    with open(emap_file_path, 'r+b') as emap_file:
+        emap_file.seek(16)
+        emap_file.write(header_bytes.ljust(header_size))
+
+
+def incomplete_energy_map(emap_file_path):
+    """
+    Checks if given energy map is a partially written binary energy map (see tiled_energy_map).
+    """
+    if not emap_file_path.endswith('.bin') or not os.path.exists(emap_file_path):
+        return False
+    return 'tiles' in read_binary_header(emap_file_path)[0]
+
+
+def read_binary_energy_map(emap_file_path, mmap=True):
+    """
+    Reads energy map in binary format (see write_binary_energy_map).
+    Returns atom list, energy block (memory-mapped read-only if mmap=True) and energy map header.
+    Energy block of an atom is block[atom_index - 3] where atom_index is given by energy_map_atom_index.
+    Quantized energy blocks are returned as energy codes (see decode_energy_block) and sparse energy maps
+    as a SparseEnergyBlock (memory-mapped mask and values).
+    Stored B-spline coefficients and r^-6 / r^-12 sums are returned in the header (emap_header['coefficients']
+    and emap_header['sums'], memory-mapped as well).
+    """
+    emap_header, header_size = read_binary_header(emap_file_path)
+    if 'tiles' in emap_header:
+        raise ValueError('Energy map is not complete (tiled energy map calculation not finished): %s' % emap_file_path)
+    block_shape = tuple([emap_header['columns']] + emap_header['shape'])
+
+    def read_array(dtype, offset, shape):
+        if mmap:
+            return np.memmap(emap_file_path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        return np.fromfile(emap_file_path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+    if 'sparse' in emap_header:
+        sparse = emap_header['sparse']
+        mask = read_array('<u8', 16 + header_size, (sparse['words'],))
+        values = read_array(emap_header['dtype'], emap_header['values_offset'], (block_shape[0], sparse['points']))
+        emap_block = SparseEnergyBlock(mask, values, emap_header['shape'], sparse['excluded_energy'])
+    else:
+        emap_block = read_array(emap_header['dtype'], 16 + header_size, block_shape)
+    if 'coefficients_offset' in emap_header:
+        emap_header['coefficients'] = read_array('<f4', emap_header['coefficients_offset'], block_shape)
+    if 'sums_offset' in emap_header:
+        emap_header['sums'] = read_array('<f8', emap_header['sums_offset'],
+                                         (2 * len(emap_header['species']), int(np.prod(emap_header['shape']))))
+    atom_list = emap_header['atom_list']
+    return atom_list, emap_block, emap_header
+
+
+def energy_map_lattice(emap, emap_header):
+    """
+    Origin (first grid point) and lattice (grid step vectors as rows) of a regular energy map grid.
+    """
+    n = np.array(emap_header['shape'])
+    if emap_header['grid'] == 'fractional':
+        origin = np.zeros(3)
+        lattice = (to_car_matrix(emap_header['to_car']) / n).T
+    else:
+        origin = emap[0, 0:3]
+        lattice = np.diag((emap[-1, 0:3] - emap[0, 0:3]) / np.maximum(n - 1, 1))
+    return {'origin': origin.tolist(), 'lattice': lattice.tolist()}
+
+
+def energy_map_points(emap_header, index=None):
+    """
+    Coordinates of the grid points of a regular energy map grid (using origin and lattice in header).
+    Grid points are ordered as a -> b -> c (c changes fastest), same as energy map rows.
+    If index is given only the grid points with these (flat) indices are returned.
+    """
+    if index is None:
+        grid_index = np.indices(emap_header['shape']).reshape(3, -1).T
+    else:
+        grid_index = np.stack(np.unravel_index(index, emap_header['shape']), axis=1)
+    return np.array(emap_header['origin']) + grid_index @ np.array(emap_header['lattice'])
+
+
+def energy_map_block(emap, emap_header):
+    """
+    Converts energy map rows (emap[i] = [x, y, z, atom1_energy, ...]) to an energy block (float32)
+    with shape (columns, na, nb, nc).
+    """
+    emap = np.asarray(emap)
+    return np.ascontiguousarray(emap[:, 3:].T.reshape([emap.shape[1] - 3] + list(emap_header['shape'])),
+                                dtype='<f4')
+
+
+def energy_map_rows(emap_block, emap_header):
+    """
+    Converts an energy block (see energy_map_block) to energy map rows: emap[i] = [x, y, z, atom1_energy, ...]
+    """
+    energy = decode_energy_block(emap_block, emap_header).reshape(len(emap_block), -1).T
+    return np.concatenate([energy_map_points(emap_header), energy], axis=1)
+
+
+def energy_map_pyramid(emap, emap_header, factors, interpolation='linear'):
+    """
+    Coarse levels of a fractional energy map for coarse-to-fine screening (see coarse_screen).
+    Coarse grid point [I, J, K] of a level with factor f stores the minimum energy of the fine grid points
+    [I * f ... I * f + f, J * f ... J * f + f, K * f ... K * f + f] (indices are wrapped periodically).
+    These are all grid points used for interpolation inside the coarse cell, therefore the coarse value is
+    a lower bound of the interpolated energy of any point in that cell.
+    For cubic interpolation the minimum of the B-spline coefficients in the header (see cubic_coefficients)
+    [I * f - 1 ... I * f + f + 1, ...] is used instead, since B-spline weights are positive and add up to one.
+    Returns list of levels ordered from coarse to fine: {'factor': f, 'block': (columns, ma, mb, mc) array}
+    Levels are only calculated for fractional grids (an empty list is returned otherwise).
+    Atom columns are decoded and pooled one at a time, so that only one full resolution column is in memory.
+    """
+    if emap_header is None or emap_header['grid'] != 'fractional':
+        return []
+    grid_shape = emap_header['shape']
+    window = [0, 1]
+    if interpolation == 'cubic':
+        coefficients = emap_header['coefficients']
+        num_columns = len(coefficients)
+        window = [1, 2]
+
+        def column_energy(column):
+            return log_energy_inverse(np.asarray(coefficients[column], dtype=float))
+    elif emap_header.get('layout') == 'block':
+        num_columns = len(emap)
+
+        def column_energy(column):
+            return decode_energy_block(emap[column], emap_header)
+    else:
+        emap = np.asarray(emap)
+        num_columns = emap.shape[1] - 3
+
+        def column_energy(column):
+            return np.asarray(emap[:, column + 3], dtype=float).reshape(grid_shape)
+
+    levels = [{'factor': factor, 'block': np.empty([num_columns] + [-(-n // factor) for n in grid_shape])}
+              for factor in sorted(set(factors), reverse=True) if factor > 1]
+    if levels:
+        for column in range(num_columns):
+            energy = column_energy(column)
+            for level in levels:
+                level['block'][column] = periodic_min_pool(energy, level['factor'], *window)
+    return levels
+
+
+def periodic_min_pool(energy, factor, before=0, after=1):
+    """
+    Minimum of the windows [I * factor - before ... I * factor + factor - 1 + after] (along each axis)
+    of a periodic energy grid.
+    """
+    for axis in range(3):
+        n = energy.shape[axis]
+        m = -(-n // factor)
+        window = (np.arange(m)[:, None] * factor + np.arange(-before, factor + after)[None, :]) % n
+        energy = np.take(energy, window, axis=axis).min(axis=axis + 1)
+    return energy
+
+
+def quantize_energy_block(emap_block, quantize, overlap_energy=None):
+    """
+    Quantizes an energy block into 'uint8' or 'uint16' codes on a clipped log-energy scale:
+        y(E) = sign(E) * ln(1 + |E|)
+    Codes 0 ... levels - 2 are evenly spaced in y between y(energy_min) and y(QUANTIZE_ENERGY_MAX) where
+    energy_min is the minimum energy of the block (higher energies are clipped to QUANTIZE_ENERGY_MAX).
+    Code levels - 1 is reserved for saturated grid points (energy >= overlap_energy) and decodes to overlap_energy.
+    Decoding error is bounded by (dy: code step in y):
+        |E_decoded - E| <= (1 + |E|) * (exp(dy / 2) - 1)     -> 'max_error' in quantization header
+    For energies between -1E3 and QUANTIZE_ENERGY_MAX this is ~2E-4 for 'uint16' and ~6E-2 for 'uint8'.
+    Returns energy codes and quantization header.
+    """
+    levels = 2 ** (8 * np.dtype(QUANTIZE_DTYPES[quantize]).itemsize)
+    emap_block = np.asarray(emap_block, dtype=float)
+    energy_min = min(float(emap_block.min()), 0.0)
+    y_min, y_max = -np.log1p(-energy_min), np.log1p(QUANTIZE_ENERGY_MAX)
+    dy = (y_max - y_min) / (levels - 2)
+    energy = np.clip(emap_block, energy_min, QUANTIZE_ENERGY_MAX)
+    codes = np.rint((log_energy(energy) - y_min) / dy)
+    if overlap_energy is not None:
+        codes[emap_block >= overlap_energy] = levels - 1
+    quantization = {'dtype': quantize, 'energy_min': energy_min, 'energy_max': QUANTIZE_ENERGY_MAX,
+                    'overlap_energy': overlap_energy, 'max_error': float(np.expm1(dy / 2))}
+    return codes.astype(QUANTIZE_DTYPES[quantize]), quantization
+
+
+def energy_decode_table(quantization):
+    """
+    Energy values of all quantized energy codes (see quantize_energy_block): energy = table[code]
+    """
+    levels = 2 ** (8 * np.dtype(QUANTIZE_DTYPES[quantization['dtype']]).itemsize)
+    y_min, y_max = -np.log1p(-quantization['energy_min']), np.log1p(quantization['energy_max'])
+    y = y_min + np.arange(levels) * (y_max - y_min) / (levels - 2)
+    table = log_energy_inverse(y)
+    table[-1] = quantization['overlap_energy'] if quantization['overlap_energy'] is not None else table[-2]
+    return table
+
+
+def log_energy(energy):
+    """
+    Signed log-energy scale used for quantized energy maps and cubic interpolation: y = sign(E) * ln(1 + |E|)
+    """
+    return np.sign(energy) * np.log1p(np.abs(energy))
+
+
+def log_energy_inverse(y):
+    """
+    Energy values of signed log-energy values (see log_energy): E = sign(y) * (exp(|y|) - 1)
+    """
+    return np.sign(y) * np.expm1(np.abs(y))
+
+
+def cubic_coefficients(emap, emap_header):
+    """
+    Periodic cubic B-spline coefficients of a fractional energy map for tricubic interpolation (see tricubic_block).
+    Coefficients c of each atom column satisfy sum(c[i + l, j + m, k + n] * B(l) * B(m) * B(n)) = y[i, j, k]
+    with B(-1) = B(1) = 1 / 6 and B(0) = 4 / 6, therefore they are calculated by dividing the Fourier transform
+    of the energy grid by the transform of B along each axis.
+    Energies are interpolated on the signed log-energy scale (see log_energy) after clipping them to
+    QUANTIZE_ENERGY_MAX, which avoids overshooting next to the steep repulsive walls of the framework atoms.
+    Returns float32 array with shape (columns, na, nb, nc).
+    """
+    if emap_header.get('layout') == 'block':
+        energy = decode_energy_block(emap, emap_header)
+    else:
+        emap = np.asarray(emap, dtype=float)
+        energy = emap[:, 3:].T.reshape([emap.shape[1] - 3] + list(emap_header['shape']))
+    y = log_energy(np.minimum(energy, QUANTIZE_ENERGY_MAX))
+    na, nb, nc = emap_header['shape']
+    bspline = [(4 + 2 * np.cos(2 * np.pi * np.fft.fftfreq(n))) / 6 for n in [na, nb]]
+    bspline.append((4 + 2 * np.cos(2 * np.pi * np.fft.rfftfreq(nc))) / 6)
+    transform = np.fft.rfftn(y, axes=(1, 2, 3))
+    transform /= bspline[0][:, None, None] * bspline[1][None, :, None] * bspline[2][None, None, :]
+    coefficients = np.fft.irfftn(transform, s=[na, nb, nc], axes=(1, 2, 3))
+    return np.ascontiguousarray(coefficients, dtype='<f4')
+
+
+def decode_energy_block(emap_block, emap_header):
+    """
+    Energy values (float64) of an energy block or a part of it, quantized energy codes are decoded.
+    """
+    if 'quantization' in emap_header:
+        return energy_decode_table(emap_header['quantization'])[np.asarray(emap_block)]
+    return np.asarray(emap_block, dtype=float)
+
+
+def sparse_energy_block(emap_block, ceiling):
+    """
+    Splits an energy block (see energy_map_block) into an occupancy bitmask and the energy values of the
+    accessible grid points (energy of any atom <= ceiling), see SparseEnergyBlock.
+    Bit i of the mask (uint64 words, bit i % 64 of word i // 64) is set if grid point i (a -> b -> c order)
+    is stored. Returns mask words and float32 values with shape (columns, stored points).
+    """
+    emap_block = np.asarray(emap_block)
+    energy = emap_block.reshape(len(emap_block), -1)
+    stored = energy.min(axis=0) <= ceiling
+    mask = np.packbits(stored, bitorder='little')
+    mask = np.concatenate([mask, np.zeros(-len(mask) % 8, dtype=np.uint8)])
+    return mask.view('<u8'), np.ascontiguousarray(energy[:, stored], dtype='<f4')
+
+
+class SparseEnergyBlock:
+    """
+    Energy block (see energy_map_block) storing only accessible grid points (see sparse_energy_block).
+    Values are read like a regular energy block (block[atom_index - 3][a, b, c], slices are supported as well)
+    and excluded grid points return excluded_energy. Position of a stored grid point in the values array is the
+    number of set bits before it in the mask (cumulative number of set bits is kept for each mask word).
+    Converting the block (or a column) to an array (np.asarray) returns the full energy block.
+    """
+    def __init__(self, mask, values, grid_shape, excluded_energy=OVERLAP_ENERGY):
+        self.mask = mask
+        self.values = values
+        self.grid_shape = tuple(grid_shape)
+        self.shape = (len(values),) + self.grid_shape
+        self.excluded_energy = excluded_energy
+        word_counts = np.unpackbits(np.asarray(mask).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+        self.rank = np.concatenate([[0], np.cumsum(word_counts)[:-1]]).astype(int)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, column):
+        if not -len(self) <= column < len(self):
+            raise IndexError('Energy block column {} out of range ({} columns)'.format(column, len(self)))
+        return SparseEnergyColumn(self, column % len(self))
+
+    def __iter__(self):
+        return (self[column] for column in range(len(self)))
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.full(self.shape, self.excluded_energy, dtype='<f4')
+        dense.reshape(len(self), -1)[:, self.stored_index()] = self.values
+        return dense if dtype is None else dense.astype(dtype)
+
+    def stored_index(self):
+        """
+        Indices of the stored grid points (a -> b -> c order, see energy_map_points).
+        """
+        stored = np.unpackbits(np.asarray(self.mask).view(np.uint8), bitorder='little')
+        return np.flatnonzero(stored[:int(np.prod(self.grid_shape))])
+
+    def value_index(self, a, b, c):
+        """
+        Position of grid point [a, b, c] in the values array (None if the grid point is not stored).
+        """
+        na, nb, nc = self.grid_shape
+        i = (a * nb + b) * nc + c
+        word = int(self.mask[i >> 6])
+        bit = i & 63
+        if not (word >> bit) & 1:
+            return None
+        return int(self.rank[i >> 6]) + bin(word & ((1 << bit) - 1)).count('1')
+
+    def lookup(self, column, a, b, c):
+        """
+        Energy values of an atom column at grid points with index arrays a, b, c (excluded grid points
+        return excluded_energy).
+        """
+        na, nb, nc = self.grid_shape
+        i = ((np.asarray(a, dtype=np.uint64) * nb + b) * nc + c).ravel().astype(np.uint64)
+        words = np.asarray(self.mask)[i >> np.uint64(6)]
+        bit = i & np.uint64(63)
+        stored = (words >> bit) & np.uint64(1) == 1
+        below = words & ((np.uint64(1) << bit) - np.uint64(1))
+        below_counts = np.unpackbits(below.astype('<u8').view(np.uint8)).reshape(-1, 64).sum(axis=1)
+        rank = self.rank[i >> np.uint64(6)] + below_counts
+        energy = np.full(len(i), self.excluded_energy, dtype=float)
+        energy[stored] = self.values[column, rank[stored]]
+        return energy.reshape(np.shape(a))
+
+
+class SparseEnergyColumn:
+    """
+    Energy values of one atom of a SparseEnergyBlock: column[a, b, c]
+    """
+    def __init__(self, block, column):
+        self.block = block
+        self.column = column
+        self.shape = block.grid_shape
+
+    def __getitem__(self, index):
+        a, b, c = index
+        if type(a) is int and type(b) is int and type(c) is int:
+            value_index = self.block.value_index(a, b, c)
+            if value_index is None:
+                return self.block.excluded_energy
+            return self.block.values[self.column, value_index]
+        # Slices (or index arrays) along each axis, only the selected grid points are read
+        axes = [np.atleast_1d(np.arange(n)[i]) for n, i in zip(self.shape, index)]
+        energy = self.block.lookup(self.column, *np.meshgrid(*axes, indexing='ij'))
+        return energy.reshape([len(axis) for axis, i in zip(axes, index) if not isinstance(i, (int, np.integer))])
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.full(int(np.prod(self.shape)), self.block.excluded_energy, dtype='<f4')
+        dense[self.block.stored_index()] = self.block.values[self.column]
+        dense = dense.reshape(self.shape)
+        return dense if dtype is None else dense.astype(dtype)
+
+
 def coor_dist(coor1, coor2):
     """
     Calculates distance between two given coordinates: [x1, y1, z1] and [x2, y2, z2]
@@ -214,6 +1575,7 @@ def energy_map_atom_list(sim_par, force_field, mof_path_list):
     """
     Returns atom list for energy map according to 'energy_map_atom_list' simulation parameter.
      - 'full': Full atom list in the force field parameters database. (103 atoms)
+        If 'energy_map_lazy' is set, only the atoms of each MOF are calculated (see LazyEnergyMap).
      - 'uniq': Unique atoms for a given list of MOFs
      - 'dummy': Single dummy atom with force field parameters defined below
      - 'qnd': Simplified atom list consisting of 1 dummy atom and 10 most common atoms.
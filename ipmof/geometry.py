@@ -1,45 +1,83 @@
 # Python library for 3 dimensional geometric operations
 # Date: October 2016
 # Author: Kutay B. Sezginel
+import os
 import math
 from random import random
+from functools import lru_cache
+from collections import OrderedDict
 
-import mathutils
+import numpy as np
+import yaml
+
+# Number of rotation matrices (distinct angle triples) kept in cache (see cached_rotation)
+ROTATION_CACHE_SIZE = 4096
 
 
 def rotation(p, a1, a2, angle):
     """
-    Quaternion rotation using mathutils library.
-    Rotation is performed for a given point and angle around an axis defined by two given points.
+    Rotation of a point around an axis defined by two given points (Rodrigues' rotation formula).
      >>> new_point = rotation(rotation_point, axis_point1, axis_point2, rotation_angle)
             p: point of rotation
             a1: first point for rotation axis
             a2: second point for rotation axis
             angle: angle of rotaion in radians
     """
-    Q_point = mathutils.Quaternion((0, p[0] - a2[0], p[1] - a2[1], p[2] - a2[2]))
-    Q_rot = mathutils.Quaternion((a2[0] - a1[0], a2[1] - a1[1], a2[2] - a1[2]), angle).normalized()
-    Quat = (Q_rot * Q_point) * Q_rot.inverted()
+    axis = np.array([a2[0] - a1[0], a2[1] - a1[1], a2[2] - a1[2]], dtype=float)
+    axis /= np.linalg.norm(axis)
+    v = np.array([p[0] - a2[0], p[1] - a2[1], p[2] - a2[2]], dtype=float)
+    v_rot = v * math.cos(angle) + np.cross(axis, v) * math.sin(angle) + axis * (axis @ v) * (1 - math.cos(angle))
+
+    return [float(v_rot[0] + a2[0]), float(v_rot[1] + a2[1]), float(v_rot[2] + a2[2])]
+
 
-    return [Quat.x + a2[0], Quat.y + a2[1], Quat.z + a2[2]]
+@lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def cached_rotation(angle):
+    """
+    Rotation matrix for an angle triple (tuple of x, y, z angles in radians), calculated once for each
+    distinct angle triple. Rotation around x, y, and z axes respectively: R = Rz @ Ry @ Rx
+    Returns matrix rows (tuples of floats, used for single points) and read-only numpy array.
+    """
+    cx, sx = math.cos(angle[0]), math.sin(angle[0])
+    cy, sy = math.cos(angle[1]), math.sin(angle[1])
+    cz, sz = math.cos(angle[2]), math.sin(angle[2])
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    matrix = rz @ ry @ rx
+    matrix.setflags(write=False)
+    return tuple(tuple(float(i) for i in row) for row in matrix), matrix
 
 
 def xyz_rotation(p, angle):
     """
-    Quaternion rotation using mathutils library.
-    Rotation is performed for a given point and angle list around x, y, and z axes respectively.
-     >>> new_point = rotation(rotation_point, rotation_angle_list)
+    Rotation of a point around x, y, and z axes respectively (see cached_rotation).
+     >>> new_point = xyz_rotation(rotation_point, rotation_angle_list)
             p: point of rotation
             rotation_angle_list: angle of rotations for x, y, z axes in radians.
     """
+    r0, r1, r2 = cached_rotation(tuple(angle))[0]
+    x, y, z = p
 
-    Q_point = mathutils.Quaternion((0, p[0], p[1], p[2]))
-    Qrx = mathutils.Quaternion((1, 0, 0), angle[0])
-    Qry = mathutils.Quaternion((0, 1, 0), angle[1])
-    Qrz = mathutils.Quaternion((0, 0, 1), angle[2])
-    Quat = (Qrz * Qry * Qrx * Q_point) * Qrx.inverted() * Qry.inverted() * Qrz.inverted()
+    return [r0[0] * x + r0[1] * y + r0[2] * z, r1[0] * x + r1[1] * y + r1[2] * z, r2[0] * x + r2[1] * y + r2[2] * z]
 
-    return [Quat.x, Quat.y, Quat.z]
+
+def rotation_matrix(angle):
+    """
+    Rotation matrix of xyz_rotation (rotation around x, y, and z axes respectively, angles in radians).
+    Matrices are cached for each distinct angle triple (see cached_rotation) and are read-only.
+    Used to rotate many points at once:
+     >>> new_points = points @ rotation_matrix(rotation_angle_list).T
+    """
+    return cached_rotation(tuple(angle))[1]
+
+
+def rotate_points(points, angle):
+    """
+    Rotates an array of points (N, 3) around x, y, and z axes respectively (see xyz_rotation).
+     >>> new_points = rotate_points(mof.atom_coors, rotation_angle_list)
+    """
+    return np.asarray(points, dtype=float).reshape(-1, 3) @ rotation_matrix(angle).T
 
 
 def add3(p1, p2):
@@ -88,8 +126,41 @@ def frac2car(frac_coor, to_car):
     return [x, y, z]
 
 
-def possible_rotations(rot_degree, num_of_points=10):
-    """ Calculate possible degrees of rotation about x, y, z axes for given rotation freedom. """
+def possible_rotations(rot_degree, num_of_points=10, cache_dir=None):
+    """
+    Calculate possible degrees of rotation about x, y, z axes for given rotation freedom.
+    Rotation angle combinations are compared by rotating an arbitrary point (coordinates rounded to 3 decimals)
+    and the first combination of each group of equal points is returned (combinations that are not equal to any
+    other combination are not returned).
+    If cache directory is given (e.g. sim_dir['rotation_cache_dir']), unique rotations are calculated once for
+    each rotation freedom and stored in that directory (rotations_<rot_degree>.yaml).
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, 'rotations_%g.yaml' % rot_degree)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as cache_file:
+                return yaml.safe_load(cache_file)['rotations']
+
+    possible_rot_degrees = unique_rotations(rot_degree)
+
+    if cache_path is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Written to a temporary file first so that parallel jobs never read a partial file
+        with open(cache_path + '.%i.tmp' % os.getpid(), 'w') as cache_file:
+            yaml.dump({'rotation_freedom': rot_degree, 'rotations': possible_rot_degrees}, cache_file)
+        os.replace(cache_path + '.%i.tmp' % os.getpid(), cache_path)
+
+    return possible_rot_degrees
+
+
+def unique_rotations(rot_degree):
+    """
+    Rotation angle combinations (see possible_rotations) grouped by the rotated point of their rotation matrix
+    (see cached_rotation) using an ordered dictionary with rounded coordinates as keys, so that groups are
+    kept in order of their first combination.
+    """
     # Calculate possible rotation angles for the given rotation freedom
     degrees = []
     increments = round(360 / rot_degree)
@@ -98,36 +169,12 @@ def possible_rotations(rot_degree, num_of_points=10):
 
     # Rotate an arbitrary point around x, y, and z axes with combinations of possible rot angles
     p = [-34.34, -3.1231, 31.123]
-    points = []
-    degree_combinations = []
+    groups = OrderedDict()
     for dx in degrees:
         for dy in degrees:
             for dz in degrees:
-                degree_combinations.append([dx, dy, dz])
-                points.append(xyz_rotation(p, [dx, dy, dz]))
-
-    # Look for points that are equal to each other after rotations were performed
-    eq_list = []
-    for p1_index, p1 in enumerate(points):
-        for p2_index, p2 in enumerate(points):
-            if p2_index > p1_index:
-                p1r = [round(i, 3) for i in p1]
-                p2r = [round(i, 3) for i in p2]
-                if p1r == p2r and [p2_index, p1_index] not in eq_list:
-                    eq_list.append([p1_index, p2_index])
-
-    # Identify all identical points (in the above step more than one equalities can be returned)
-    eq1 = [i[0] for i in eq_list]
-    eq2 = [i[1] for i in eq_list]
-    new_eq = []
-    for eq in eq1:
-        if eq not in eq2 and eq not in new_eq:
-            new_eq.append(eq)
-
-    # Gather rot angle combinations that give unique results
-    possible_rot_degrees = []
-    for d_index, d in enumerate(degree_combinations):
-        if d_index in new_eq:
-            possible_rot_degrees.append(d)
+                point = xyz_rotation(p, [dx, dy, dz])
+                groups.setdefault(tuple(round(i, 3) for i in point), []).append([dx, dy, dz])
 
-    return possible_rot_degrees
+    # Gather the first rot angle combination of each group of identical points (in order of combinations)
+    return [group[0] for group in groups.values() if len(group) > 1]
@@ -9,18 +9,32 @@ import yaml
 from random import random
 from glob import glob
 
+import numpy as np
+
 from ipmof.crystal import Packing, MOF
-from ipmof.geometry import xyz_rotation, pbc3, add3, sub3, possible_rotations
-from ipmof.energymap import energy_map_atom_index, import_energy_map
+from ipmof.geometry import xyz_rotation, rotation_matrix, rotate_points, pbc3, add3, sub3, possible_rotations
+from ipmof.celllist import to_frac_matrix, to_car_matrix
+from ipmof.energymap import energy_map_atom_index, import_energy_map, energy_map_from_sums, uniq_atom_list
+from ipmof.energymap import energy_map_points, energy_map_rows, decode_energy_block, energy_decode_table
+from ipmof.energymap import energy_map_pyramid, cubic_coefficients, log_energy_inverse, LazyEnergyMap
+from ipmof.forcefield import read_ff_parameters
+from ipmof.octree import octree_interpolate
+from ipmof.archive import is_energy_map_archive, archived_energy_maps
 from ipmof.parameters import export_interpenetration_results
 from ipmof.core import core_interpenetration_list
 
+# Number of mobile MOF atoms interpolated at once by the vectorized trial engines (see vectorized_trial)
+TRIAL_CHUNK_SIZE = 64
+# Approximate memory used for each atom of each trial by the batched trial engine (see trial_batch_size)
+TRIAL_POINT_BYTES = 512
+
 
-def initial_coordinates(mof, energy_map, atom_list, energy_limit):
+def initial_coordinates(mof, energy_map, atom_list, energy_limit, emap_header=None):
     """
     Determine initial coordinates to start interpenetration simulations from.
     Points are determined acoording to their energy (accepted if energy < energy_limit)
     and their position (accepted if applying pbc does not change its coordinates)
+    All points of a fractional (or octree) energy map are inside the unit cell, therefore only energy is checked.
     """
     reference_atom = 'C'
     if reference_atom in atom_list['atom']:
@@ -31,6 +45,24 @@ def initial_coordinates(mof, energy_map, atom_list, energy_limit):
     energy_count = 0
     pbc_count = 0
 
+    if emap_header is not None and 'sparse' in emap_header:
+        # Only the stored (accessible) grid points of a sparse energy block are checked
+        ref_energy = energy_map.values[ref_atom_index - 3]
+        energy_map = np.concatenate([energy_map_points(emap_header, energy_map.stored_index()),
+                                     ref_energy[:, None]], axis=1)
+        ref_atom_index = 3
+    elif emap_header is not None and emap_header.get('layout') == 'block':
+        # Use grid points and reference atom energies of the energy block
+        ref_energy = decode_energy_block(energy_map[ref_atom_index - 3], emap_header).ravel()
+        energy_map = np.concatenate([energy_map_points(emap_header), ref_energy[:, None]], axis=1)
+        ref_atom_index = 3
+
+    if emap_header is not None and emap_header['grid'] in ['fractional', 'octree']:
+        for emap_line in energy_map:
+            if emap_line[ref_atom_index] < energy_limit:
+                initial_coors.append([emap_line[0], emap_line[1], emap_line[2]])
+        return initial_coors
+
     for emap_line in energy_map:
         emap_coor = [emap_line[0], emap_line[1], emap_line[2]]
         pbc_coor = pbc3(emap_coor, mof.to_frac, mof.to_car)
@@ -49,10 +81,11 @@ def initial_coordinates(mof, energy_map, atom_list, energy_limit):
     return initial_coors
 
 
-def tripolate(point, atom_index, emap, x_length, y_length):
+def tripolate(point, atom_index, emap, x_length, y_length, saturated=None):
     """
     3D Linear Interpolation for given energy map and point in space (point must be in emap).
     Only works for energy map constructed with a grid size of 1.
+    If saturated energy is given and any of the surrounding grid points is saturated, it is returned.
     """
     point0 = []
     dif = []
@@ -69,6 +102,11 @@ def tripolate(point, atom_index, emap, x_length, y_length):
     i110 = i010 + x_length
     i111 = i110 + 1
 
+    if saturated is not None:
+        for i in [i000, i001, i010, i011, i100, i101, i110, i111]:
+            if emap[i][atom_index] >= saturated:
+                return saturated
+
     d1 = 1 - dif[0]
     c00 = emap[i000][atom_index] * d1 + emap[i100][atom_index] * dif[0]
     c01 = emap[i001][atom_index] * d1 + emap[i101][atom_index] * dif[0]
@@ -83,10 +121,447 @@ def tripolate(point, atom_index, emap, x_length, y_length):
     return c
 
 
-def check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list):
+def tripolate_periodic(point, atom_index, emap, grid_shape, to_frac, saturated=None):
+    """
+    3D Linear Interpolation for given fractional energy map and point in space.
+    The point is converted to fractional coordinates and grid indices are wrapped periodically,
+    therefore any point in space and any grid size can be used.
+    If saturated energy is given and any of the surrounding grid points is saturated, it is returned.
+    """
+    na, nb, nc = grid_shape
+    x, y, z = point
+    fa = (to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na
+    fb = (to_frac[3] * y + to_frac[4] * z) * nb
+    fc = to_frac[5] * z * nc
+    a0, b0, c0 = math.floor(fa), math.floor(fb), math.floor(fc)
+    da, db, dc = fa - a0, fb - b0, fc - c0
+    a0, b0, c0 = a0 % na, b0 % nb, c0 % nc
+    a1, b1, c1 = (a0 + 1) % na, (b0 + 1) % nb, (c0 + 1) % nc
+
+    i00, i01 = (a0 * nb + b0) * nc, (a0 * nb + b1) * nc
+    i10, i11 = (a1 * nb + b0) * nc, (a1 * nb + b1) * nc
+
+    if saturated is not None:
+        for i in [i00 + c0, i00 + c1, i01 + c0, i01 + c1, i10 + c0, i10 + c1, i11 + c0, i11 + c1]:
+            if emap[i][atom_index] >= saturated:
+                return saturated
+
+    d1 = 1 - da
+    c00 = emap[i00 + c0][atom_index] * d1 + emap[i10 + c0][atom_index] * da
+    c01 = emap[i00 + c1][atom_index] * d1 + emap[i10 + c1][atom_index] * da
+    c10 = emap[i01 + c0][atom_index] * d1 + emap[i11 + c0][atom_index] * da
+    c11 = emap[i01 + c1][atom_index] * d1 + emap[i11 + c1][atom_index] * da
+
+    e0 = c00 * (1 - db) + c10 * db
+    e1 = c01 * (1 - db) + c11 * db
+
+    return e0 * (1 - dc) + e1 * dc
+
+
+def tripolate_block(point, atom_index, emap_block, to_frac, saturated=None, decode=None):
+    """
+    3D Linear Interpolation for given fractional energy block (binary energy map) and point in space.
+    Energy block has the shape (columns, na, nb, nc) and energy values of an atom are in
+    emap_block[atom_index - 3], grid indices are wrapped periodically (see tripolate_periodic).
+    Quantized energy blocks are decoded using decode table (see energy_decode_table): energy = decode[code]
+    """
+    energy = emap_block[atom_index - 3]
+    na, nb, nc = energy.shape
+    x, y, z = point
+    fa = (to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na
+    fb = (to_frac[3] * y + to_frac[4] * z) * nb
+    fc = to_frac[5] * z * nc
+    a0, b0, c0 = math.floor(fa), math.floor(fb), math.floor(fc)
+    da, db, dc = fa - a0, fb - b0, fc - c0
+    a0, b0, c0 = a0 % na, b0 % nb, c0 % nc
+    a1, b1, c1 = (a0 + 1) % na, (b0 + 1) % nb, (c0 + 1) % nc
+
+    corners = (energy[a0, b0, c0], energy[a0, b0, c1], energy[a0, b1, c0], energy[a0, b1, c1],
+               energy[a1, b0, c0], energy[a1, b0, c1], energy[a1, b1, c0], energy[a1, b1, c1])
+    if decode is not None:
+        corners = decode[list(corners)]
+    e000, e001, e010, e011, e100, e101, e110, e111 = map(float, corners)
+
+    if saturated is not None:
+        if max(e000, e001, e010, e011, e100, e101, e110, e111) >= saturated:
+            return saturated
+
+    d1 = 1 - da
+    c00 = e000 * d1 + e100 * da
+    c01 = e001 * d1 + e101 * da
+    c10 = e010 * d1 + e110 * da
+    c11 = e011 * d1 + e111 * da
+
+    e0 = c00 * (1 - db) + c10 * db
+    e1 = c01 * (1 - db) + c11 * db
+
+    return e0 * (1 - dc) + e1 * dc
+
+
+def tricubic_block(point, atom_index, coefficients, to_frac):
+    """
+    3D Cubic B-spline Interpolation for given fractional energy map B-spline coefficients (see cubic_coefficients)
+    and point in space. Coefficients of an atom are in coefficients[atom_index - 3] and the 4 x 4 x 4 coefficients
+    around the point are used (grid indices are wrapped periodically).
+    Interpolation is done on the signed log-energy scale and the energy value is returned.
+    """
+    coef = coefficients[atom_index - 3]
+    na, nb, nc = coef.shape
+    x, y, z = point
+    fa = (to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na
+    fb = (to_frac[3] * y + to_frac[4] * z) * nb
+    fc = to_frac[5] * z * nc
+    weights = []
+    indices = []
+    for f, n in [(fa, na), (fb, nb), (fc, nc)]:
+        i = math.floor(f)
+        t = f - i
+        t2, t3 = t * t, t * t * t
+        weights.append(np.array([(1 - t) ** 3, 3 * t3 - 6 * t2 + 4, -3 * t3 + 3 * t2 + 3 * t + 1, t3]) / 6)
+        indices.append([(i - 1) % n, i % n, (i + 1) % n, (i + 2) % n])
+    y_point = np.einsum('i,j,k,ijk->', weights[0], weights[1], weights[2], coef[np.ix_(*indices)])
+    return float(log_energy_inverse(y_point))
+
+
+def energy_map_interpolator(emap, emap_header=None, interpolation='linear'):
+    """
+    Returns interpolation function for given energy map according to energy map header.
+     >>> interpolate = energy_map_interpolator(emap, emap_header)
+     >>> point_energy = interpolate(point, atom_index)
+    Energy maps without header (or with 'cartesian' grid) use tripolate (grid size of 1).
+    Octree energy maps use octree_interpolate, fractional binary energy maps use tripolate_block
+    (quantized energy codes are decoded with a lookup table, see energy_decode_table).
+    Saturated grid points (hard-core overlap, 'overlap_energy' in header) are treated as rejected:
+    interpolation returns the saturated energy if any of the surrounding grid points is saturated.
+    If interpolation='cubic', fractional energy maps use tricubic_block with the B-spline coefficients in the
+    header (calculated here if they are not stored with the energy map, see cubic_coefficients).
+    """
+    saturated = emap_header.get('overlap_energy') if emap_header is not None else None
+    block_layout = emap_header is not None and emap_header.get('layout') == 'block'
+    if block_layout and emap_header['grid'] == 'cartesian':
+        # Cartesian energy blocks are converted to energy map rows
+        emap = energy_map_rows(emap, emap_header)
+
+    if block_layout and emap_header['grid'] == 'fractional':
+        to_frac = emap_header['to_frac']
+        decode = energy_decode_table(emap_header['quantization']) if 'quantization' in emap_header else None
+
+        def interpolate(point, atom_index):
+            return tripolate_block(point, atom_index, emap, to_frac, saturated, decode)
+    elif emap_header is not None and emap_header['grid'] == 'octree':
+        root_shape = emap_header['shape']
+        to_frac = emap_header['to_frac']
+        tree = {'child': np.asarray(emap_header['tree']['child']), 'corners': np.asarray(emap_header['tree']['corners'])}
+
+        def interpolate(point, atom_index):
+            return octree_interpolate(point, atom_index, emap, root_shape, tree, to_frac, saturated)
+    elif emap_header is not None and emap_header['grid'] == 'fractional':
+        grid_shape = emap_header['shape']
+        to_frac = emap_header['to_frac']
+
+        def interpolate(point, atom_index):
+            return tripolate_periodic(point, atom_index, emap, grid_shape, to_frac, saturated)
+    else:
+        # Get energy map dimensions for trilinear interpolation
+        emap_max = [emap[-1][0], emap[-1][1], emap[-1][2]]
+        emap_min = [emap[0][0], emap[0][1], emap[0][2]]
+        side_length = [emap_max[0] - emap_min[0] + 1, emap_max[1] - emap_min[1] + 1, emap_max[2] - emap_min[2] + 1]
+        x_length, y_length = int(side_length[1] * side_length[2]), int(side_length[2])
+
+        def interpolate(point, atom_index):
+            return tripolate(point, atom_index, emap, x_length, y_length, saturated)
+
+    if interpolation == 'cubic' and emap_header is not None and emap_header['grid'] == 'fractional':
+        # Saturated grid points are detected with linear interpolation
+        linear_interpolate = interpolate
+        coefficients = emap_header.get('coefficients')
+        if coefficients is None:
+            coefficients = cubic_coefficients(emap, emap_header)
+        to_frac = emap_header['to_frac']
+
+        def interpolate(point, atom_index):
+            if saturated is not None and linear_interpolate(point, atom_index) >= saturated:
+                return saturated
+            return tricubic_block(point, atom_index, coefficients, to_frac)
+
+    return interpolate
+
+
+def coarse_energy_bound(point, atom_index, level, grid_shape, to_frac):
+    """
+    Lower bound of the interpolated energy at a point in space using a coarse energy map level
+    (see energy_map_pyramid). The coarse grid point of the fine grid cell containing the point is returned.
+    """
+    na, nb, nc = grid_shape
+    x, y, z = point
+    a0 = math.floor((to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na) % na
+    b0 = math.floor((to_frac[3] * y + to_frac[4] * z) * nb) % nb
+    c0 = math.floor(to_frac[5] * z * nc) % nc
+    factor = level['factor']
+    return float(level['block'][atom_index - 3][a0 // factor, b0 // factor, c0 // factor])
+
+
+def coarse_screen(levels, emap_header, base_mof, mobile_mof, atom_list, rotation, translation_vector,
+                  energy_density_limit):
+    """
+    Coarse-to-fine screening of an interpenetration trial (rotation and translation of the mobile MOF).
+    Energy density of the trial is accumulated using lower energy bounds of each coarse level (from coarse
+    to fine) and the trial is rejected as soon as the lower bound exceeds energy density limit.
+    Since coarse energies are lower bounds, rejected trials would also be rejected on the full energy map.
+    Atom coordinates are calculated only once (as long as the trial survives) for all levels.
+    Returns True if the trial is rejected.
+    """
+    grid_shape, to_frac = emap_header['shape'], emap_header['to_frac']
+    ucv = mobile_mof.ucv
+    pbc_coors = []
+    emap_atom_indices = []
+    for level in levels:
+        energy_density = 0
+        # Same atoms as the interpenetration trial loop (see check_interpenetration)
+        for idx in range(1, len(mobile_mof) - 1):
+            if idx > len(pbc_coors):
+                rot_coor = xyz_rotation(mobile_mof.atom_coors[idx], rotation)
+                pbc_coors.append(pbc3(add3(rot_coor, translation_vector), base_mof.to_frac, base_mof.to_car))
+                emap_atom_indices.append(energy_map_atom_index(mobile_mof.atom_names[idx], atom_list))
+            energy_bound = coarse_energy_bound(pbc_coors[idx - 1], emap_atom_indices[idx - 1], level, grid_shape,
+                                               to_frac)
+            energy_density += energy_bound / ucv
+            if energy_density > energy_density_limit:
+                return True
+    return False
+
+
+def tripolate_gather(points, atom_indices, gather, grid_shape, to_frac, saturated=None):
+    """
+    Vectorized 3D Linear Interpolation for fractional energy maps (same as tripolate_periodic and tripolate_block)
+    for arrays of points (N, 3) and atom indices (N) at once.
+    Energy values of the surrounding grid points are read with gather(atom_indices, a, b, c) (grid index arrays).
+    If saturated energy is given, it is returned for points with any saturated surrounding grid point.
+    """
+    na, nb, nc = grid_shape
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    fa = (to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na
+    fb = (to_frac[3] * y + to_frac[4] * z) * nb
+    fc = to_frac[5] * z * nc
+    a0, b0, c0 = np.floor(fa), np.floor(fb), np.floor(fc)
+    da, db, dc = fa - a0, fb - b0, fc - c0
+    a0, b0, c0 = a0.astype(int) % na, b0.astype(int) % nb, c0.astype(int) % nc
+    a1, b1, c1 = (a0 + 1) % na, (b0 + 1) % nb, (c0 + 1) % nc
+
+    e000, e001, e010, e011 = [gather(atom_indices, a0, b, c) for b, c in [(b0, c0), (b0, c1), (b1, c0), (b1, c1)]]
+    e100, e101, e110, e111 = [gather(atom_indices, a1, b, c) for b, c in [(b0, c0), (b0, c1), (b1, c0), (b1, c1)]]
+
+    d1 = 1 - da
+    c00 = e000 * d1 + e100 * da
+    c01 = e001 * d1 + e101 * da
+    c10 = e010 * d1 + e110 * da
+    c11 = e011 * d1 + e111 * da
+
+    e0 = c00 * (1 - db) + c10 * db
+    e1 = c01 * (1 - db) + c11 * db
+    energy = e0 * (1 - dc) + e1 * dc
+
+    if saturated is not None:
+        corner_max = np.max([e000, e001, e010, e011, e100, e101, e110, e111], axis=0)
+        energy = np.where(corner_max >= saturated, saturated, energy)
+    return energy
+
+
+def energy_map_batch_interpolator(emap, emap_header=None, interpolation='linear'):
+    """
+    Returns interpolation function for arrays of points and atom indices (see energy_map_interpolator).
+     >>> interpolate = energy_map_batch_interpolator(emap, emap_header)
+     >>> energies = interpolate(points, atom_indices)
+    Linear interpolation of fractional energy maps (energy blocks and energy map rows) is vectorized
+    (see tripolate_gather), other energy maps use energy_map_interpolator for each point.
+    """
+    if interpolation == 'linear' and emap_header is not None and emap_header['grid'] == 'fractional':
+        saturated = emap_header.get('overlap_energy')
+        grid_shape = emap_header['shape']
+        if emap_header.get('layout') == 'block' and 'sparse' in emap_header:
+            def gather(atom_indices, a, b, c):
+                energy = np.empty(len(atom_indices))
+                for atom_index in np.unique(atom_indices):
+                    select = atom_indices == atom_index
+                    energy[select] = emap.lookup(atom_index - 3, a[select], b[select], c[select])
+                return energy
+        elif emap_header.get('layout') == 'block' and 'quantization' in emap_header:
+            decode = energy_decode_table(emap_header['quantization'])
+
+            def gather(atom_indices, a, b, c):
+                return decode[emap[atom_indices - 3, a, b, c]]
+        elif emap_header.get('layout') == 'block':
+            def gather(atom_indices, a, b, c):
+                return np.asarray(emap[atom_indices - 3, a, b, c], dtype=float)
+        else:
+            emap_rows = np.asarray(emap, dtype=float)
+            na, nb, nc = grid_shape
+
+            def gather(atom_indices, a, b, c):
+                return emap_rows[(a * nb + b) * nc + c, atom_indices]
+
+        def interpolate(points, atom_indices):
+            return tripolate_gather(points, atom_indices, gather, grid_shape, emap_header['to_frac'], saturated)
+        return interpolate
+
+    point_interpolate = energy_map_interpolator(emap, emap_header, interpolation)
+
+    def interpolate(points, atom_indices):
+        return np.array([point_interpolate(point, atom_index)
+                         for point, atom_index in zip(points.tolist(), atom_indices.tolist())], dtype=float)
+    return interpolate
+
+
+def coarse_energy_bounds(points, atom_indices, level, grid_shape, to_frac):
+    """
+    Vectorized coarse_energy_bound for arrays of points (N, 3) and atom indices (N).
+    """
+    na, nb, nc = grid_shape
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    a0 = np.floor((to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na).astype(int) % na
+    b0 = np.floor((to_frac[3] * y + to_frac[4] * z) * nb).astype(int) % nb
+    c0 = np.floor(to_frac[5] * z * nc).astype(int) % nc
+    factor = level['factor']
+    return np.asarray(level['block'][atom_indices - 3, a0 // factor, b0 // factor, c0 // factor], dtype=float)
+
+
+def density_exceeded(energy, energy_density, ucv, energy_density_limit):
+    """
+    Accumulates energy density of point energies in the same order as the interpenetration trial loop.
+    Returns True if the running energy density exceeds energy density limit at any point, and the final energy density.
+    """
+    densities = np.cumsum(np.concatenate([[energy_density], energy / ucv]))[1:]
+    if (densities > energy_density_limit).any():
+        return True, energy_density
+    return False, float(densities[-1]) if len(densities) > 0 else energy_density
+
+
+def trial_coordinates(trial_atoms, rotation, first_point, base_mof):
+    """
+    Coordinates of mobile MOF atoms 1 ... N - 2 of an interpenetration trial (see vectorized_trial).
+    Returns rotated and translated coordinates, pbc coordinates (wrapped into the unit cell of the base MOF)
+    and translation vector.
+    """
+    rotated_coors = trial_atoms['coors'] @ rotation_matrix(rotation).T
+    translation_vector = np.asarray(first_point, dtype=float) - rotated_coors[0]
+    new_coors = rotated_coors[1:-1] + translation_vector
+    frac_coors = new_coors @ to_frac_matrix(base_mof.to_frac).T
+    pbc_coors = (frac_coors - np.floor(frac_coors)) @ to_car_matrix(base_mof.to_car).T
+    return new_coors, pbc_coors, translation_vector
+
+
+def vectorized_trial(trial_atoms, rotation, first_point, interpolate, base_mof, ucv, energy_density_limit,
+                     levels=(), emap_header=None):
+    """
+    Evaluates an interpenetration trial for all mobile MOF atoms at once (same result as the trial loop in
+    check_interpenetration). Mobile MOF atoms (trial_atoms: {'coors': (N, 3) array, 'emap_index': (N) array of
+    energy map atom indices}) are rotated with a single rotation matrix (see rotation_matrix), translated so that
+    the first atom is on the first point and wrapped into the unit cell of the base MOF.
+    Energies of atoms 1 ... N - 2 (same as the trial loop) are interpolated in chunks of TRIAL_CHUNK_SIZE atoms
+    (see energy_map_batch_interpolator) and the energy density is accumulated in the same order, so the trial
+    is rejected as soon as the energy density exceeds energy density limit. Coarse energy map levels (see
+    coarse_screen) are checked before the full energy map.
+    Returns (rotated coordinates, pbc coordinates, translation vector, energy, energy density) or None if the
+    trial is rejected.
+    """
+    new_coors, pbc_coors, translation_vector = trial_coordinates(trial_atoms, rotation, first_point, base_mof)
+    emap_index = trial_atoms['emap_index'][1:-1]
+
+    for level in levels:
+        energy_bounds = coarse_energy_bounds(pbc_coors, emap_index, level, emap_header['shape'], emap_header['to_frac'])
+        if density_exceeded(energy_bounds, 0, ucv, energy_density_limit)[0]:
+            return None
+
+    structure_energy, energy_density = 0, 0
+    for start in range(0, len(pbc_coors), TRIAL_CHUNK_SIZE):
+        energy = interpolate(pbc_coors[start:start + TRIAL_CHUNK_SIZE], emap_index[start:start + TRIAL_CHUNK_SIZE])
+        exceeded, energy_density = density_exceeded(energy, energy_density, ucv, energy_density_limit)
+        if exceeded:
+            return None
+        structure_energy = float(np.cumsum(np.concatenate([[structure_energy], energy]))[-1])
+    return new_coors, pbc_coors, translation_vector, structure_energy, energy_density
+
+
+def trial_structure(mobile_mof, rotation, first_point, new_coors, pbc_coors, translation_vector, energy,
+                    energy_density):
+    """
+    Structure information of an accepted interpenetration trial (same as the trial loop in check_interpenetration).
+    """
+    return {'atom_names': mobile_mof.atom_names[:-1],
+            'atom_coors': [first_point] + new_coors.tolist(),
+            'pbc_coors': [first_point] + pbc_coors.tolist(),
+            'first_point': first_point,
+            'translation_vector': translation_vector.tolist(),
+            'rotation': rotation,
+            'energy': energy,
+            'energy_density': energy_density}
+
+
+def trial_batch_size(sim_par, mobile_mof_length):
+    """
+    Number of interpenetration trials evaluated at once by the batched trial engine (see batched_trials)
+    so that the arrays of a block of TRIAL_CHUNK_SIZE atoms fit into 'trial_batch_memory' (MB).
+    """
+    block_bytes = TRIAL_POINT_BYTES * max(1, min(TRIAL_CHUNK_SIZE, mobile_mof_length - 2))
+    return max(1, int(sim_par['trial_batch_memory'] * 1024 ** 2 // block_bytes))
+
+
+def batched_trials(trial_atoms, rotations, first_points, interpolate, base_mof, ucv, energy_density_limit,
+                   levels=(), emap_header=None):
+    """
+    Evaluates a batch of interpenetration trials (rotation angles and first points) as array operations
+    (same result as vectorized_trial for each trial). Mobile MOF atoms 1 ... N - 2 are processed in blocks of
+    TRIAL_CHUNK_SIZE atoms for all active trials at once, energy density of each trial is accumulated in the
+    same order as the trial loop and trials are dropped from the active set as soon as their energy density
+    exceeds energy density limit (coarse energy map levels are checked first, see coarse_screen).
+    Returns list of (energy, energy density) for each trial (None if the trial is rejected).
+    """
+    rotations = np.array([rotation_matrix(rotation) for rotation in rotations]).transpose(0, 2, 1)
+    translation_vectors = np.asarray(first_points, dtype=float) - trial_atoms['coors'][0] @ rotations
+    atom_coors, emap_index = trial_atoms['coors'][1:-1], trial_atoms['emap_index'][1:-1]
+    to_frac, to_car = to_frac_matrix(base_mof.to_frac).T, to_car_matrix(base_mof.to_car).T
+
+    def screen(trials, block_energy):
+        trial_energy, trial_energy_density = np.zeros(len(trials)), np.zeros(len(trials))
+        for start in range(0, len(atom_coors), TRIAL_CHUNK_SIZE):
+            if len(trials) == 0:
+                break
+            # Coordinates of the atom block for all active trials (trials, atoms, 3)
+            new_coors = atom_coors[start:start + TRIAL_CHUNK_SIZE] @ rotations[trials] + \
+                translation_vectors[trials][:, None, :]
+            frac_coors = new_coors @ to_frac
+            pbc_coors = (frac_coors - np.floor(frac_coors)) @ to_car
+            block_index = np.tile(emap_index[start:start + TRIAL_CHUNK_SIZE], len(trials))
+            energy = block_energy(pbc_coors.reshape(-1, 3), block_index).reshape(len(trials), -1)
+            densities = np.cumsum(np.concatenate([trial_energy_density[:, None], energy / ucv], axis=1), axis=1)
+            energies = np.cumsum(np.concatenate([trial_energy[:, None], energy], axis=1), axis=1)
+            active = ~(densities[:, 1:] > energy_density_limit).any(axis=1)
+            trials, trial_energy, trial_energy_density = trials[active], energies[active, -1], densities[active, -1]
+        return trials, trial_energy, trial_energy_density
+
+    trials = np.arange(len(rotations))
+    for level in levels:
+        def level_bounds(points, atom_indices):
+            return coarse_energy_bounds(points, atom_indices, level, emap_header['shape'], emap_header['to_frac'])
+        trials = screen(trials, level_bounds)[0]
+    trials, trial_energy, trial_energy_density = screen(trials, interpolate)
+
+    results = [None] * len(rotations)
+    for trial, energy, energy_density in zip(trials, trial_energy, trial_energy_density):
+        results[trial] = (float(energy), float(energy_density))
+    return results
+
+
+def check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list, emap_header=None, rotation_cache_dir=None):
     """
     Run interpenetration algorithm with given simulation parameters and energy map.
     Returns simulation summary and structural information on the discovered structures.
+    Energy map header (see import_energy_map) determines the interpolation method.
+    If 'trial_engine' is 'vectorized' each trial is evaluated for all mobile MOF atoms at once (see vectorized_trial),
+    if it is 'batched' many trials are evaluated at once (see batched_trials, batch size is limited by
+    'trial_batch_memory'), otherwise ('loop') atoms are rotated and interpolated one by one.
+    If rotation cache directory is given, unique rotations are read from (and stored in) that directory
+    (see possible_rotations).
     """
     # Initialize simulation parameters
     structure_energy_limit = sim_par['structure_energy_limit']
@@ -96,20 +571,22 @@ def check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list):
     rotation_freedom = sim_par['rotation_freedom']
     summary_percent = sim_par['summary_percent']
     try_all_rotations = sim_par['try_all_rotations']
-    # Get energy map dimensions for trilinear interpolation
-    emap_max = [emap[-1][0], emap[-1][1], emap[-1][2]]
-    emap_min = [emap[0][0], emap[0][1], emap[0][2]]
-    side_length = [emap_max[0] - emap_min[0] + 1, emap_max[1] - emap_min[1] + 1, emap_max[2] - emap_min[2] + 1]
-    x_length, y_length = int(side_length[1] * side_length[2]), int(side_length[2])
+    interpolation = sim_par['energy_map_interpolation']
+    if interpolation == 'cubic' and emap_header is not None and emap_header['grid'] == 'fractional' and \
+       emap_header.get('coefficients') is None:
+        emap_header = dict(emap_header, coefficients=cubic_coefficients(emap, emap_header))
+    interpolate = energy_map_interpolator(emap, emap_header, interpolation)
+    # Coarse energy map levels used to reject trials before the full energy map is used
+    emap_levels = energy_map_pyramid(emap, emap_header, sim_par['energy_map_levels'], interpolation)
 
     if try_all_rotations:
-        all_rot_degrees = possible_rotations(sim_par['rotation_freedom'])
+        all_rot_degrees = possible_rotations(sim_par['rotation_freedom'], cache_dir=rotation_cache_dir)
         rotation_limit = len(all_rot_degrees)
         sim_par['rotation_limit'] = rotation_limit
     else:
         rotation_limit = sim_par['rotation_limit']
 
-    initial_coors = initial_coordinates(base_mof, emap, atom_list, atom_energy_limit)
+    initial_coors = initial_coordinates(base_mof, emap, atom_list, atom_energy_limit, emap_header)
     trial_limit = len(initial_coors) * rotation_limit
     div = round(trial_limit / (100 / summary_percent))
     rot_freedom = 360 / rotation_freedom
@@ -126,78 +603,129 @@ def check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list):
     initial_coor_index = 0
     rotation_index = 0
 
+    # Vectorized trial engines: mobile MOF atoms and their energy map atom indices are stored as arrays
+    trial_engine = sim_par['trial_engine']
+    if trial_engine in ['vectorized', 'batched']:
+        batch_interpolate = energy_map_batch_interpolator(emap, emap_header, interpolation)
+        trial_atoms = {'coors': np.array(mobile_mof.atom_coors, dtype=float).reshape(-1, 3),
+                       'emap_index': np.array([energy_map_atom_index(atom_name, atom_list)
+                                               for atom_name in mobile_mof.atom_names], dtype=int)}
+    if trial_engine == 'batched':
+        batch_size = trial_batch_size(sim_par, mobile_mof_length)
+        batch = []
+
     # Interpenetration trial loop for different positions and orientations
     for t in range(trial_limit):
         abort_ip = False
-        # Interpenetration trial loop for a specific position and different orientations
-        for idx in range(mobile_mof_length):
-
-            if not abort_ip:
-                # If the interpenetration is just starting select rotation angles
-                if idx == 0:
-                    # Determine random angles for rotation in 3D space
-
-                    # Determine first point for interpenetrating structure
-                    if t % rotation_limit == 0:
-                        # Start with original orientation for first trial
-                        x_angle, y_angle, z_angle = [0, 0, 0]
-                        first_point = initial_coors[initial_coor_index]
-                        initial_coor_index += 1
-                        rotation_index = 0
-                    elif try_all_rotations:
-                        x_angle, y_angle, z_angle = all_rot_degrees[rotation_index]
+        # Determine random angles for rotation in 3D space
+
+        # Determine first point for interpenetrating structure
+        if t % rotation_limit == 0:
+            # Start with original orientation for first trial
+            x_angle, y_angle, z_angle = [0, 0, 0]
+            first_point = initial_coors[initial_coor_index]
+            initial_coor_index += 1
+            rotation_index = 0
+        elif try_all_rotations:
+            x_angle, y_angle, z_angle = all_rot_degrees[rotation_index]
+        else:
+            x_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
+            y_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
+            z_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
+
+        rotation_index += 1
+
+        if trial_engine == 'batched':
+            # Trials are evaluated in batches, then recorded (together with the summary) in trial order
+            batch.append({'t': t, 'rotation': [x_angle, y_angle, z_angle], 'first_point': first_point})
+            if len(batch) < batch_size and t < trial_limit - 1:
+                continue
+            # Trials of mobile MOFs with a single atom are never recorded (same as the trial loop)
+            results = [None] * len(batch)
+            if mobile_mof_length > 1:
+                results = batched_trials(trial_atoms, [trial['rotation'] for trial in batch],
+                                         [trial['first_point'] for trial in batch], batch_interpolate, base_mof,
+                                         ucv, energy_density_limit, emap_levels, emap_header)
+            for trial, result in zip(batch, results):
+                if result is not None:
+                    coordinates = trial_coordinates(trial_atoms, trial['rotation'], trial['first_point'], base_mof)
+                    new_structures.append(trial_structure(mobile_mof, trial['rotation'], trial['first_point'],
+                                                          *coordinates, *result))
+                    structure_count += 1
+                if trial['t'] % div == 0:
+                    summary['percent'].append(round(trial['t'] / trial_limit * 100))
+                    summary['structure_count'].append(structure_count)
+                    summary['trial_count'].append(trial['t'])
+            batch = []
+            continue
+        elif trial_engine == 'vectorized':
+            # Trials of mobile MOFs with a single atom are never recorded (same as the trial loop)
+            trial = None
+            if mobile_mof_length > 1:
+                trial = vectorized_trial(trial_atoms, [x_angle, y_angle, z_angle], first_point, batch_interpolate,
+                                         base_mof, ucv, energy_density_limit, emap_levels, emap_header)
+            if trial is not None:
+                new_structures.append(trial_structure(mobile_mof, [x_angle, y_angle, z_angle], first_point, *trial))
+                structure_count += 1
+        else:
+            # Interpenetration trial loop for a specific position and different orientations
+            for idx in range(mobile_mof_length):
+
+                if not abort_ip:
+                    # If the interpenetration is just starting rotate the first atom
+                    if idx == 0:
+                        # Rotate first atom of the mobile MOF
+                        atom_name = mobile_mof.atom_names[idx]
+                        rot_coor = mobile_mof.atom_coors[idx]
+                        rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
+                        translation_vector = sub3(first_point, rot_coor)
+
+                        # Initialize new structure dictionary
+                        structure = {'atom_names': [], 'atom_coors': [], 'pbc_coors': []}
+                        structure['first_point'] = first_point
+                        structure['translation_vector'] = translation_vector
+                        structure['atom_coors'].append(first_point)
+                        structure['pbc_coors'].append(first_point)
+                        structure['atom_names'].append(atom_name)
+                        structure['rotation'] = [x_angle, y_angle, z_angle]
+
+                        if emap_levels and coarse_screen(emap_levels, emap_header, base_mof, mobile_mof, atom_list,
+                                                         structure['rotation'], translation_vector,
+                                                         energy_density_limit):
+                            abort_ip = True
+                            break
+
+                    # If interpenetration is still going on
+                    elif idx < mobile_mof_length - 1:
+                        atom_name = mobile_mof.atom_names[idx]
+                        rot_coor = mobile_mof.atom_coors[idx]
+                        rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
+                        new_coor = add3(rot_coor, translation_vector)
+                        pbc_coor = pbc3(new_coor, base_mof.to_frac, base_mof.to_car)
+
+                        emap_atom_index = energy_map_atom_index(atom_name, atom_list)
+                        point_energy = interpolate(pbc_coor, emap_atom_index)
+                        structure_total_energy += point_energy
+                        energy_density += point_energy / ucv
+
+                        if energy_density > energy_density_limit:
+                            structure_total_energy = 0
+                            energy_density = 0
+                            abort_ip = True
+                            break  # Fix this part (break interpenetration trial loop)
+                        else:
+                            structure['atom_coors'].append(new_coor)
+                            structure['pbc_coors'].append(pbc_coor)
+                            structure['atom_names'].append(atom_name)
+
+                    # If interpenetration trial ended with no collision - record structure info
                     else:
-                        x_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
-                        y_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
-                        z_angle = 2 * math.pi * math.floor(random() * rot_freedom) / rot_freedom
-
-                    rotation_index += 1
-                    # Rotate first atom of the mobile MOF
-                    atom_name = mobile_mof.atom_names[idx]
-                    rot_coor = mobile_mof.atom_coors[idx]
-                    rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-                    translation_vector = sub3(first_point, rot_coor)
-
-                    # Initialize new structure dictionary
-                    structure = {'atom_names': [], 'atom_coors': [], 'pbc_coors': []}
-                    structure['first_point'] = first_point
-                    structure['translation_vector'] = translation_vector
-                    structure['atom_coors'].append(first_point)
-                    structure['pbc_coors'].append(first_point)
-                    structure['atom_names'].append(atom_name)
-                    structure['rotation'] = [x_angle, y_angle, z_angle]
-
-                # If interpenetration is still going on
-                elif idx < mobile_mof_length - 1:
-                    atom_name = mobile_mof.atom_names[idx]
-                    rot_coor = mobile_mof.atom_coors[idx]
-                    rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-                    new_coor = add3(rot_coor, translation_vector)
-                    pbc_coor = pbc3(new_coor, base_mof.to_frac, base_mof.to_car)
-
-                    emap_atom_index = energy_map_atom_index(atom_name, atom_list)
-                    point_energy = tripolate(pbc_coor, emap_atom_index, emap, x_length, y_length)
-                    structure_total_energy += point_energy
-                    energy_density += point_energy / ucv
-
-                    if energy_density > energy_density_limit:
+                        structure['energy'] = structure_total_energy
+                        structure['energy_density'] = energy_density
+                        new_structures.append(structure)
+                        structure_count += 1
                         structure_total_energy = 0
                         energy_density = 0
-                        abort_ip = True
-                        break  # Fix this part (break interpenetration trial loop)
-                    else:
-                        structure['atom_coors'].append(new_coor)
-                        structure['pbc_coors'].append(pbc_coor)
-                        structure['atom_names'].append(atom_name)
-
-                # If interpenetration trial ended with no collision - record structure info
-                else:
-                    structure['energy'] = structure_total_energy
-                    structure['energy_density'] = energy_density
-                    new_structures.append(structure)
-                    structure_count += 1
-                    structure_total_energy = 0
-                    energy_density = 0
 
         # Record simulation progress according to division (div) and summary
         if t % div == 0:
@@ -209,7 +737,7 @@ def check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list):
     return summary, new_structures
 
 
-def check_extension(sim_par, base_mof, mobile_mof, emap, emap_atom_list, new_structure):
+def check_extension(sim_par, base_mof, mobile_mof, emap, emap_atom_list, new_structure, emap_header=None):
     """
     Checks collision between interpenetrating layer and base layer for a determined distance.
     Distance is calculated from given ext_cut_off value which determines the packing amount of the
@@ -217,10 +745,7 @@ def check_extension(sim_par, base_mof, mobile_mof, emap, emap_atom_list, new_str
     Each coordinate in the interpenetrating layer is checked for high energy values by applying
     perodic boundary conditions to the coordinate according to energy map of the base layer.
     """
-    emap_max = [emap[-1][0], emap[-1][1], emap[-1][2]]
-    emap_min = [emap[0][0], emap[0][1], emap[0][2]]
-    side_length = [emap_max[0] - emap_min[0] + 1, emap_max[1] - emap_min[1] + 1, emap_max[2] - emap_min[2] + 1]
-    x_length, y_length = int(side_length[1] * side_length[2]), int(side_length[2])
+    interpolate = energy_map_batch_interpolator(emap, emap_header, sim_par['energy_map_interpolation'])
 
     energy_limit = sim_par['atom_energy_limit']
     ext_cut_off = sim_par['ext_cut_off']
@@ -233,37 +758,22 @@ def check_extension(sim_par, base_mof, mobile_mof, emap, emap_atom_list, new_str
     trans_vec = Packing.translation_vectors(packing_factor, uc_vectors)
     packed_coors = Packing.uc_coors(trans_vec, packing_factor, uc_vectors, mobile_mof.atom_coors)
 
-    x_angle, y_angle, z_angle = rotation_info
-    collision = False
-    collision_info = {'exist': collision, 'coor': None, 'pbc_coor': None}
+    emap_index = np.array([energy_map_atom_index(atom_name, emap_atom_list) for atom_name in mobile_mof.atom_names],
+                          dtype=int)
+    to_frac, to_car = to_frac_matrix(base_mof.to_frac), to_car_matrix(base_mof.to_car)
+    collision_info = {'exist': False, 'coor': None, 'pbc_coor': None}
 
+    # Each unit cell is rotated at once and the first atom (in order) with high energy is reported
     for unit_cell in packed_coors:
-
-        if not collision:
-
-            for coor_index, coor in enumerate(unit_cell):
-
-                if not collision:
-
-                    rot_coor = coor
-                    rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-                    new_coor = add3(rot_coor, translation_vector)
-                    pbc_coor = pbc3(new_coor, base_mof.to_frac, base_mof.to_car)
-                    atom_name = mobile_mof.atom_names[coor_index]
-                    atom_index = energy_map_atom_index(atom_name, emap_atom_list)
-                    point_energy = tripolate(pbc_coor, atom_index, emap, x_length, y_length)
-
-                    if point_energy < energy_limit:
-                        continue
-                    else:
-                        collision = True
-                        collision_info = {'exist': collision,
-                                          'coor': [float(round(p, 3)) for p in new_coor],
-                                          'pbc_coor': [float(round(p, 3)) for p in pbc_coor]}
-                        break
-                else:
-                    break
-        else:
+        new_coors = rotate_points(unit_cell, rotation_info) + np.asarray(translation_vector, dtype=float)
+        frac_coors = new_coors @ to_frac.T
+        pbc_coors = (frac_coors - np.floor(frac_coors)) @ to_car.T
+        point_energy = interpolate(pbc_coors, emap_index[:len(new_coors)])
+        collisions = np.flatnonzero(~(point_energy < energy_limit))
+        if len(collisions) > 0:
+            collision_info = {'exist': True,
+                              'coor': [float(round(p, 3)) for p in new_coors[collisions[0]]],
+                              'pbc_coor': [float(round(p, 3)) for p in pbc_coors[collisions[0]]]}
             break
 
     return collision_info
@@ -288,19 +798,13 @@ def save_extension(sim_par, base_mof, mobile_mof, emap, emap_atom_list, new_stru
     trans_vec = Packing.translation_vectors(packing_factor, uc_vectors)
     packed_coors = Packing.uc_coors(trans_vec, packing_factor, uc_vectors, mobile_mof.atom_coors)
 
-    x_angle, y_angle, z_angle = rotation_info
     extended_coors = []
     extended_names = []
 
     for unit_cell in packed_coors:
-
-        for coor_index, coor in enumerate(unit_cell):
-
-            rot_coor = xyz_rotation(coor, [x_angle, y_angle, z_angle])
-            new_coor = add3(rot_coor, translation_vector)
-            atom_name = mobile_mof.atom_names[coor_index]
-            extended_names.append(atom_name)
-            extended_coors.append(new_coor)
+        new_coors = rotate_points(unit_cell, rotation_info) + np.asarray(translation_vector, dtype=float)
+        extended_names += mobile_mof.atom_names[:len(new_coors)]
+        extended_coors += new_coors.tolist()
 
     extended_structure = {'atom_names': extended_names, 'atom_coors': extended_coors}
     extended_structure['name'] = mobile_mof.name
@@ -322,9 +826,23 @@ def run_interpenetration(interpenetration_path, sim_par, sim_dir):
     emap_path, base_mof_path, mobile_mof_path = interpenetration_path           # Read file paths
     base_mof = MOF(base_mof_path)                                               # Initialize MOF1
     mobile_mof = MOF(mobile_mof_path)                                           # Initialize MOF2
-    atom_list, emap = import_energy_map(emap_path)                              # Read energy map
+    atom_list, emap, emap_header = import_energy_map(emap_path, header=True)    # Read energy map
+    if emap_header.get('mode') == 'sums':
+        # Derive energy values for the atoms of the mobile MOF with selected force field
+        force_field = read_ff_parameters(sim_dir['force_field_path'], sim_par['force_field'])
+        atom_list = uniq_atom_list([mobile_mof_path], force_field)
+        emap, emap_header = energy_map_from_sums(emap, emap_header, atom_list, force_field)
+    elif sim_par['energy_map_lazy']:
+        # Calculate (and store) energy map columns of the mobile MOF atoms missing in the energy map
+        force_field = read_ff_parameters(sim_dir['force_field_path'], sim_par['force_field'])
+        lazy_emap = LazyEnergyMap(sim_par, emap_path, base_mof_path, force_field, workers=sim_par['energy_map_workers'])
+        new_atoms = lazy_emap.add_atoms(mobile_mof.uniq_atom_names)
+        if len(new_atoms) > 0:
+            print('Energy map atoms calculated ->', new_atoms)
+        atom_list, emap, emap_header = lazy_emap.atom_list, lazy_emap.emap, lazy_emap.header
     # Run Interpenetration
-    summary, new_structures = check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list)
+    summary, new_structures = check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list, emap_header,
+                                                     rotation_cache_dir=sim_dir['rotation_cache_dir'])
     # Create export directory ------------------=-------------------------------------------
     if sim_par['directory_separation']:
         export_dir = os.path.join(sim_dir['export_dir'], base_mof.name[0], base_mof.name + '_' + mobile_mof.name)
@@ -344,7 +862,8 @@ def run_interpenetration(interpenetration_path, sim_par, sim_dir):
             min_energy_structure = sorted_structures[export_index]
             if sim_par['check_extension']:
                 # Check for collision in the extended unitcell of new structure and energy map
-                collision = check_extension(sim_par, base_mof, mobile_mof, emap, atom_list, min_energy_structure)
+                collision = check_extension(sim_par, base_mof, mobile_mof, emap, atom_list, min_energy_structure,
+                                            emap_header)
             else:
                 collision = None
             # Record structure information -------------------------------------------------
@@ -378,17 +897,27 @@ def get_interpenetration_list(sim_par, sim_dir):
 
     Format: interpenetration_list = {'emap_path': [], 'emap_mof_path': [], 'ip_mof_path': []}
     """
+    # Energy maps are read from the energy map archive if it is used (see archive_energy_maps)
+    if sim_par['energy_map_archive'] and is_energy_map_archive(sim_dir['energy_map_archive_dir']):
+        emap_dir = sim_dir['energy_map_archive_dir']
+    else:
+        emap_dir = sim_dir['energy_map_dir']
+
     if sim_par['interpenetration_list'] is not None:
         interpenetration_list = yaml.load(open(sim_par['interpenetration_list'], 'r'))
     elif sim_par['core_database']:
         if sim_par['core_limit'] is not None:
-            interpenetration_list = core_interpenetration_list(sim_dir, limit=sim_par['core_limit'])
+            interpenetration_list = core_interpenetration_list(sim_dir, limit=sim_par['core_limit'], emap_dir=emap_dir)
         else:
-            interpenetration_list = core_interpenetration_list(sim_dir)
+            interpenetration_list = core_interpenetration_list(sim_dir, emap_dir=emap_dir)
     else:
         mof_path_list = os.listdir(sim_dir['mof_dir'])
         mof_path_list = [os.path.join(sim_dir['mof_dir'], path) for path in mof_path_list]
-        emap_path_list = os.listdir(sim_dir['energy_map_dir'])
+        if emap_dir == sim_dir['energy_map_dir']:
+            # Only energy map files (energy map directory also contains the batch manifest)
+            emap_path_list = [emap_file for emap_file in os.listdir(emap_dir) if '_emap' in emap_file]
+        else:
+            emap_path_list = archived_energy_maps(emap_dir)
 
         interpenetration_list = []
         ip_mof_list = []
@@ -399,7 +928,7 @@ def get_interpenetration_list(sim_par, sim_dir):
             emap_mof_name = os.path.basename(emap_path).split('_emap')[0]
             # What if multiple files are returned?? (IndexError if file cannot be found)
             emap_mof_path = glob(os.path.join(sim_dir['mof_dir'], emap_mof_name) + '*')[0]
-            emap_path = os.path.join(sim_dir['energy_map_dir'], emap_path)
+            emap_path = os.path.join(emap_dir, emap_path)
 
             for ip_mof_path in mof_path_list:
 
@@ -476,22 +1005,13 @@ def regenerate(s1_name, s2_name, rotation, initial_coordinate, sim_par, sim_dir,
     x_angle, y_angle, z_angle = [math.radians(a) for a in rotation]
     structure = {'atom_names': [], 'atom_coors': [], 'pbc_coors': []}
 
-    for idx in range(s2_mof_length):
-        if idx == 0:
-            atom_name = s2_mof.atom_names[idx]
-            rot_coor = s2_mof.atom_coors[idx]
-            rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-            translation_vector = sub3(first_point, rot_coor)
-        else:
-            atom_name = s2_mof.atom_names[idx]
-            rot_coor = s2_mof.atom_coors[idx]
-            rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-            new_coor = add3(rot_coor, translation_vector)
-            pbc_coor = pbc3(new_coor, s1_mof.to_frac, s1_mof.to_car)
-
-            structure['atom_coors'].append(new_coor)
-            structure['pbc_coors'].append(pbc_coor)
-            structure['atom_names'].append(atom_name)
+    if s2_mof_length > 0:
+        rot_coors = rotate_points(s2_mof.atom_coors, [x_angle, y_angle, z_angle])
+        new_coors = rot_coors[1:] + (np.asarray(first_point, dtype=float) - rot_coors[0])
+        frac_coors = new_coors @ to_frac_matrix(s1_mof.to_frac).T
+        pbc_coors = (frac_coors - np.floor(frac_coors)) @ to_car_matrix(s1_mof.to_car).T
+        structure = {'atom_names': s2_mof.atom_names[1:], 'atom_coors': new_coors.tolist(),
+                     'pbc_coors': pbc_coors.tolist()}
 
     new_structure = {'atom_names': structure['atom_names'], 'name': s2_mof.name}
     if sim_par['export_pbc']:
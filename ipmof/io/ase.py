@@ -21,14 +21,15 @@ def read(file_path, input_format=None):
     # Get unit cell parameters (converting from unit cell vectors)
     uc = ase_cellpar(atoms.cell)
 
-    # Additional unit cell information (currently not used)
-    sg = atoms.info['spacegroup'].symbol
+    # Additional unit cell information (space group is used for energy map symmetry)
+    sg = atoms.info['spacegroup'] if 'spacegroup' in atoms.info else None
     volume = atoms.get_volume()
 
     molecule = {'uc_size': [uc[0], uc[1], uc[2]],
                 'uc_angle': [uc[3], uc[4], uc[5]],
                 'atom_names': atom_names,
-                'atom_coors': atom_coors}
+                'atom_coors': atom_coors,
+                'spacegroup': sg}
 
     return atoms, molecule
 
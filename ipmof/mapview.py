@@ -0,0 +1,151 @@
+# IPMOF Energy Map View Functions
+# Date: October 2026
+import numpy as np
+
+from ipmof.energymap import decode_energy_block, energy_map_lattice, log_energy, QUANTIZE_ENERGY_MAX
+
+# Tetrahedra of a grid cell used for isosurface extraction (corner index: 4 * di + 2 * dj + dk)
+# Each tetrahedron follows a path from corner 0 to corner 7 along the cell edges (one for each axis order)
+TETRAHEDRA = [[0, 1, 3, 7], [0, 1, 5, 7], [0, 2, 3, 7], [0, 2, 6, 7], [0, 4, 5, 7], [0, 4, 6, 7]]
+CELL_CORNERS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+
+
+def regular_grid_header(emap, emap_header):
+    """
+    Checks that the energy map has a regular grid ('fractional' or 'cartesian') and adds grid origin and
+    lattice to the header (see energy_map_lattice) if they are missing.
+    """
+    if emap_header is None or 'shape' not in emap_header or emap_header['grid'] not in ['fractional', 'cartesian']:
+        raise ValueError('Energy map view requires a fractional or cartesian grid header')
+    if 'lattice' not in emap_header:
+        emap_header = dict(emap_header, **energy_map_lattice(np.asarray(emap, dtype=float), emap_header))
+    return emap_header
+
+
+def energy_column(emap, emap_header, atom_index):
+    """
+    Energy grid of an atom with shape (na, nb, nc) (atom_index is given by energy_map_atom_index).
+    Energy blocks (binary energy maps) are not read here, memory-mapped grid points are only read when
+    they are indexed (quantized energy codes are decoded with decode_energy_block).
+    """
+    if emap_header.get('layout') == 'block':
+        return emap[atom_index - 3]
+    return np.asarray(emap, dtype=float)[:, atom_index].reshape(emap_header['shape'])
+
+
+def grid_coordinates(emap_header, grid_index):
+    """
+    Cartesian coordinates of (fractional) grid indices with shape (..., 3) using origin and lattice in header.
+    """
+    return np.array(emap_header['origin']) + np.asarray(grid_index, dtype=float) @ np.array(emap_header['lattice'])
+
+
+def energy_map_slice(emap, emap_header, atom_index, axis=2, index=0, step=1):
+    """
+    2D slice of the energy grid of an atom at grid layer index along axis (0: a, 1: b, 2: c).
+    Only the grid points of the slice are read from memory-mapped energy blocks (every step'th grid point
+    along the other two axes). Returns energy values and cartesian coordinates of the slice grid points:
+     >>> energy, points = energy_map_slice(emap, emap_header, atom_index, axis=2, index=10)
+     >>> energy.shape -> (na / step, nb / step) | points.shape -> (na / step, nb / step, 3)
+    """
+    emap_header = regular_grid_header(emap, emap_header)
+    column = energy_column(emap, emap_header, atom_index)
+    grid_slice = [slice(None, None, step)] * 3
+    grid_slice[axis] = index
+    energy = decode_energy_block(column[tuple(grid_slice)], emap_header)
+    grid_index = [np.arange(n)[s] for n, s in zip(emap_header['shape'], grid_slice)]
+    grid_index = np.stack(np.meshgrid(*grid_index, indexing='ij'), axis=-1).reshape(energy.shape + (3,))
+    return energy, grid_coordinates(emap_header, grid_index)
+
+
+def energy_map_projection(emap, emap_header, atom_index, axis=2, step=1):
+    """
+    2D projection (minimum energy) of the energy grid of an atom along axis (0: a, 1: b, 2: c).
+    Grid layers are read one at a time (see energy_map_slice), so that memory-mapped energy maps are not
+    loaded into memory. Returns minimum energy values and cartesian coordinates of the first grid layer.
+    """
+    emap_header = regular_grid_header(emap, emap_header)
+    energy, points = energy_map_slice(emap, emap_header, atom_index, axis, 0, step)
+    for index in range(step, emap_header['shape'][axis], step):
+        energy = np.fmin(energy, energy_map_slice(emap, emap_header, atom_index, axis, index, step)[0])
+    return energy, points
+
+
+def energy_map_isosurface(emap, emap_header, atom_index, level=0, step=2):
+    """
+    Isosurface mesh of the energy grid of an atom at given energy level (e.g. boundary of the accessible region)
+    calculated on a downsampled grid (every step'th grid point along each axis, see marching_tetrahedra).
+    Grid layers along a are read one at a time, so that memory-mapped energy maps are not loaded into memory.
+    Fractional grids are periodic, therefore the cell between the last grid layer and the first one is included.
+    Returns vertices (cartesian coordinates) and faces (vertex indices of each triangle):
+     >>> vertices, faces = energy_map_isosurface(emap, emap_header, atom_index, level=0, step=2)
+     >>> ax.plot_trisurf(vertices[:, 0], vertices[:, 1], vertices[:, 2], triangles=faces)
+    """
+    emap_header = regular_grid_header(emap, emap_header)
+    column = energy_column(emap, emap_header, atom_index)
+    periodic = emap_header['grid'] == 'fractional'
+    # Grid indices of the downsampled grid along each axis (first grid point is repeated for periodic grids)
+    samples = [list(range(0, n, step)) + ([n] if periodic else []) for n in emap_header['shape']]
+    level_y = log_energy(level)
+
+    def read_layer(a):
+        layer = decode_energy_block(column[a % emap_header['shape'][0], ::step, ::step], emap_header)
+        if periodic:
+            layer = np.pad(layer, ((0, 1), (0, 1)), mode='wrap')
+        return log_energy(np.minimum(layer, QUANTIZE_ENERGY_MAX))
+
+    triangles = []
+    layer = read_layer(samples[0][0])
+    for i in range(len(samples[0]) - 1):
+        next_layer = read_layer(samples[0][i + 1])
+        slab_triangles = marching_tetrahedra(np.array([layer, next_layer]), level_y)
+        slab_triangles[..., 0] += i
+        triangles.append(slab_triangles)
+        layer = next_layer
+    triangles = np.concatenate(triangles) if triangles else np.zeros((0, 3, 3))
+
+    # Downsampled grid indices -> grid indices -> cartesian coordinates
+    grid_index = np.stack([np.interp(triangles[..., axis], np.arange(len(samples[axis])), samples[axis])
+                           for axis in range(3)], axis=-1)
+    vertices = grid_coordinates(emap_header, grid_index.reshape(-1, 3))
+    faces = np.arange(len(vertices)).reshape(-1, 3)
+    return vertices, faces
+
+
+def marching_tetrahedra(values, level):
+    """
+    Isosurface triangles of a 3D grid of values at given level. Each grid cell is split into 6 tetrahedra
+    (see TETRAHEDRA) and the surface crosses the edges between corners below and above the level
+    (crossing points are linearly interpolated). Tetrahedra with one (or three) corners below the level
+    give one triangle and tetrahedra with two corners below the level give two triangles.
+    Triangle orientation is not consistent and vertices are not shared between triangles.
+    Returns triangle vertices (grid index coordinates) with shape (triangles, 3, 3).
+    """
+    n0, n1, n2 = values.shape
+    cells = np.indices((n0 - 1, n1 - 1, n2 - 1)).reshape(3, -1).T
+    triangles = []
+    for tetrahedron in TETRAHEDRA:
+        corners = cells[:, None, :] + CELL_CORNERS[tetrahedron][None, :, :]
+        corner_values = values[corners[..., 0], corners[..., 1], corners[..., 2]]
+        below = corner_values < level
+        count = below.sum(axis=1)
+
+        def crossing(select, i, j):
+            rows = np.flatnonzero(select)
+            vi, vj = corner_values[rows, i], corner_values[rows, j]
+            t = ((level - vi) / (vj - vi))[:, None]
+            return corners[rows, i] + t * (corners[rows, j] - corners[rows, i])
+
+        for lone_count in [1, 3]:
+            select = count == lone_count
+            lone = np.argmax(below[select] if lone_count == 1 else ~below[select], axis=1)
+            others = [(lone + shift) % 4 for shift in [1, 2, 3]]
+            triangles.append(np.stack([crossing(select, lone, other) for other in others], axis=1))
+
+        select = count == 2
+        # Corners below the level first: a, b (below) and c, d (above)
+        a, b, c, d = np.argsort(~below[select], axis=1, kind='stable').T
+        ac, ad, bc, bd = crossing(select, a, c), crossing(select, a, d), crossing(select, b, c), crossing(select, b, d)
+        triangles.append(np.stack([ac, ad, bd], axis=1))
+        triangles.append(np.stack([ac, bd, bc], axis=1))
+    return np.concatenate(triangles).astype(float)
@@ -0,0 +1,141 @@
+# IPMOF Adaptive (Octree) Energy Map Functions
+# Date: October 2026
+import math
+
+import numpy as np
+
+from ipmof.celllist import to_car_matrix
+
+# Corner offsets of an octree cell, corner (or child) index = 4 * i + 2 * j + k
+CORNER_OFFSETS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+
+
+def build_octree(energy, to_car, root_shape, max_depth, energy_limit, tolerance):
+    """
+    Builds an adaptive energy map in fractional coordinates.
+    The unit cell is divided into root_shape = [na, nb, nc] cells which are subdivided (up to max_depth
+    times) only if energy varies strongly inside the cell or crosses energy_limit:
+        - Energy at the cell center differs from the trilinear interpolation of the corners by more
+          than tolerance (energies are clipped at energy_limit before comparison).
+        - Some corners are below and some are above energy_limit.
+    Points deep inside framework atoms and flat pore interiors therefore stay coarse.
+    - energy: function that returns energies (npoints x natoms) for given cartesian points
+    Returns grid points (fractional), energy values and the tree:
+        - child: index of first child for each node (-1 for leaves), children are stored consecutively
+        - corners: index of grid points at 8 corners of each node
+    Nodes 0 ... na * nb * nc - 1 are the root cells ordered as a -> b -> c (c changes fastest).
+    """
+    scale = 2 ** max_depth
+    fine_shape = np.array(root_shape) * scale
+    to_car = to_car_matrix(to_car)
+
+    # Grid points are identified with integer coordinates on the finest grid (wrapped periodically)
+    point_keys = np.zeros(0, dtype=np.int64)
+    sorted_keys, sorted_index = point_keys, point_keys
+    point_frac, point_energy = [], []
+
+    def point_index(coors):
+        """ Returns grid point indices for integer coordinates, new points are evaluated. """
+        nonlocal point_keys, sorted_keys, sorted_index
+        wrapped = coors % fine_shape
+        keys = (wrapped[:, 0] * fine_shape[1] + wrapped[:, 1]) * fine_shape[2] + wrapped[:, 2]
+        uniq_keys, inverse = np.unique(keys, return_inverse=True)
+        position = np.minimum(np.searchsorted(sorted_keys, uniq_keys), max(len(sorted_keys) - 1, 0))
+        found = (sorted_keys[position] == uniq_keys) if len(sorted_keys) > 0 else np.zeros(len(uniq_keys), bool)
+        new_keys = uniq_keys[~found]
+        new_frac = np.stack([new_keys // (fine_shape[1] * fine_shape[2]),
+                             new_keys // fine_shape[2] % fine_shape[1],
+                             new_keys % fine_shape[2]], axis=1) / fine_shape
+        if len(new_keys) > 0:
+            point_frac.append(new_frac)
+            point_energy.append(energy(new_frac @ to_car.T))
+        uniq_index = np.zeros(len(uniq_keys), dtype=np.int64)
+        uniq_index[found] = sorted_index[position[found]]
+        uniq_index[~found] = len(point_keys) + np.arange(len(new_keys))
+        point_keys = np.concatenate([point_keys, new_keys])
+        order = np.argsort(point_keys, kind='stable')
+        sorted_keys, sorted_index = point_keys[order], order
+        return uniq_index[inverse]
+
+    def point_values(index):
+        values = np.concatenate(point_energy)
+        return np.minimum(values[index], energy_limit)
+
+    # Root cells
+    grid = np.meshgrid(*[np.arange(n) for n in root_shape], indexing='ij')
+    origins = np.stack([g.ravel() for g in grid], axis=1) * scale
+    node_ids = np.arange(len(origins))
+    child = [np.full(len(origins), -1, dtype=np.int64)]
+    corners = []
+    num_nodes = len(origins)
+    size = scale
+
+    for depth in range(max_depth + 1):
+        corner_coors = origins[:, None, :] + CORNER_OFFSETS * size
+        corner_index = point_index(corner_coors.reshape(-1, 3)).reshape(-1, 8)
+        corners.append(corner_index)
+        if depth == max_depth or len(origins) == 0:
+            break
+
+        # Compare energy at cell centers with trilinear interpolation of the corners
+        center_index = point_index(origins + size // 2)
+        corner_energy = point_values(corner_index)
+        center_energy = point_values(center_index)
+        error = np.abs(center_energy - corner_energy.mean(axis=1)).max(axis=1)
+        above = corner_energy >= energy_limit
+        crosses = np.any(above.any(axis=1) & ~above.all(axis=1), axis=1)
+        refine = (error > tolerance) | crosses
+
+        # Subdivide selected cells into 8 children
+        size //= 2
+        refined_ids = node_ids[refine]
+        first_child = num_nodes + 8 * np.arange(len(refined_ids))
+        child_array = np.concatenate(child)
+        child_array[refined_ids] = first_child
+        origins = (origins[refine][:, None, :] + CORNER_OFFSETS * size).reshape(-1, 3)
+        node_ids = num_nodes + np.arange(len(origins))
+        num_nodes += len(origins)
+        child = [child_array, np.full(len(origins), -1, dtype=np.int64)]
+
+    tree = {'child': np.concatenate(child), 'corners': np.concatenate(corners)}
+    return np.concatenate(point_frac), np.concatenate(point_energy), tree
+
+
+def octree_interpolate(point, atom_index, emap, root_shape, tree, to_frac, saturated=None):
+    """
+    Finds the leaf cell of an octree energy map that contains given point (cartesian, any position)
+    and performs trilinear interpolation using the corners of that cell.
+    Energy map rows are structured as: emap[i] = [x, y, z, atom1_energy, atom2_energy, ...]
+    If saturated energy is given and any of the corners is saturated, it is returned.
+    """
+    na, nb, nc = root_shape
+    x, y, z = point
+    fa = (to_frac[0] * x + to_frac[1] * y + to_frac[2] * z) * na
+    fb = (to_frac[3] * y + to_frac[4] * z) * nb
+    fc = to_frac[5] * z * nc
+    a0, b0, c0 = math.floor(fa), math.floor(fb), math.floor(fc)
+    ua, ub, uc = fa - a0, fb - b0, fc - c0
+    node = ((a0 % na) * nb + b0 % nb) * nc + c0 % nc
+
+    child = tree['child']
+    while child[node] >= 0:
+        oa, ob, oc = int(ua >= 0.5), int(ub >= 0.5), int(uc >= 0.5)
+        ua, ub, uc = 2 * ua - oa, 2 * ub - ob, 2 * uc - oc
+        node = child[node] + 4 * oa + 2 * ob + oc
+
+    c = tree['corners'][node]
+    if saturated is not None:
+        for i in c:
+            if emap[i][atom_index] >= saturated:
+                return saturated
+
+    da = 1 - ua
+    c00 = emap[c[0]][atom_index] * da + emap[c[4]][atom_index] * ua
+    c01 = emap[c[1]][atom_index] * da + emap[c[5]][atom_index] * ua
+    c10 = emap[c[2]][atom_index] * da + emap[c[6]][atom_index] * ua
+    c11 = emap[c[3]][atom_index] * da + emap[c[7]][atom_index] * ua
+
+    e0 = c00 * (1 - ub) + c10 * ub
+    e1 = c01 * (1 - ub) + c11 * ub
+
+    return e0 * (1 - uc) + e1 * uc
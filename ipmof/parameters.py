@@ -15,11 +15,32 @@ sim_par_data = {'structure_energy_limit': 1E8,   # Maximum allowed potential ene
                 'ext_cut_off': 50,               # Cut-off radius for checking extension (Angstrom)
                 'check_extension': True,         # Check extended unit cells for collisions
                 'grid_size': 1,                  # Grid size for potential energy map (Angstrom)
+                'energy_map_grid': 'cartesian',  # Energy map grid type ('cartesian', 'fractional' or 'octree')
+                'energy_map_symmetry': False,    # Use space group symmetry for fractional energy map grid
+                'octree_depth': 3,               # Levels of refinement for octree energy map grid
+                'octree_tolerance': 1.0,         # Max. interpolation error before refining octree cells
+                'energy_map_interpolation': 'linear',  # Energy map interpolation ('linear' or 'cubic' B-spline)
+                'energy_map_levels': [],         # Coarse screening levels (multiples of grid size, [] -> not used)
+                'trial_engine': 'loop',          # Interpenetration trial evaluation ('loop', 'vectorized', 'batched')
+                'trial_batch_memory': 256,       # Memory budget for batched interpenetration trials (MB)
                 'force_field': 'uff',            # Force field selection for LJ ('uff' or 'dre')
                 'core_database': False,          # Use CoRE database information or not
                 'core_limit': 1000,              # Number of MOF combinations to select from CoRE database
                 'energy_map_atom_list': 'uniq',  # Atom list for energy map ('full', 'uniq', 'dummy', 'qnd')
-                'energy_map_type': 'numpy',      # Energy map file format ('numpy' or 'yaml')
+                'energy_map_lazy': False,        # Calculate energy map atoms when they are first used
+                'energy_map_type': 'numpy',      # Energy map file format ('numpy', 'yaml' or 'binary')
+                'energy_map_quantize': None,     # Quantized binary energy map codes (None, 'uint8' or 'uint16')
+                'energy_map_sparse': None,       # Max. energy of grid points stored in binary energy maps (None -> all)
+                'energy_map_mode': 'energy',     # Energy map values ('energy' or force field independent 'sums')
+                'energy_map_engine': 'direct',   # Energy map calculation ('direct' or 'fft' for fractional grids)
+                'fft_near_field': 4.0,           # Near field radius summed directly by the FFT engine (Angstrom)
+                'energy_map_workers': 1,         # Number of processes used for energy map calculation
+                'energy_map_memory': 0,          # Memory budget for energy map calculation (MB, 0 -> not used)
+                'energy_map_batch': 0,           # Number of energy maps calculated in parallel (0 -> not used)
+                'energy_map_overlap': 0,         # Hard-core overlap distance (fraction of sigma, 0 -> not used)
+                'energy_map_append': False,      # Append missing atoms to existing energy maps
+                'energy_map_cache': 0,           # Disk budget for energy map cache (MB, 0 -> not used)
+                'energy_map_archive': 0,         # Number of energy map archive shards (0 -> not used)
                 'self_interpenetration': True,   # Test for homo-interpenetration or not
                 'interpenetration_list': None,  # Interpenetration list in yaml format
                 'report_structures': 10,         # Number of min. energy structures to report in results
@@ -43,6 +64,9 @@ vf_list_path = os.path.join(main_dir, 'doc', 'core_mof_vf_list.yaml')
 core_mof_dir = r'CoRE MOFs database directory'
 mof_dir = os.path.join(main_dir, 'mof')
 energy_map_dir = os.path.join(main_dir, 'energymap')
+energy_map_cache_dir = os.path.join(main_dir, 'energymap_cache')
+energy_map_archive_dir = os.path.join(main_dir, 'energymap_archive')
+rotation_cache_dir = os.path.join(main_dir, 'rotation_cache')
 export_dir = os.path.join(main_dir, 'results')
 settings_dir = os.path.join(main_dir, 'settings')
 if not os.path.isdir(export_dir):
@@ -58,6 +82,9 @@ sim_dir_data = {'main_dir': main_dir,
                 'core_mof_dir': core_mof_dir,
                 'mof_dir': mof_dir,
                 'energy_map_dir': energy_map_dir,
+                'energy_map_cache_dir': energy_map_cache_dir,
+                'energy_map_archive_dir': energy_map_archive_dir,
+                'rotation_cache_dir': rotation_cache_dir,
                 'export_dir': export_dir,
                 'settings_dir': settings_dir,
                 'vf_list_path': vf_list_path
@@ -68,15 +95,17 @@ def read_parameters(sim_par_path=sim_par_path, sim_dir_path=sim_dir_path):
     """
     Read simulation parameters and directories from yaml files if they exist.
     Otherwise they are read from ~/ipmof/parameters.py.
+    Parameters missing in the yaml files (e.g. files written before a parameter was added) are also
+    read from ~/ipmof/parameters.py.
     """
+    sim_par = dict(sim_par_data)
     if os.path.exists(sim_par_path):
-        sim_par = yaml.load(open(sim_par_path, 'r'))
-    else:
-        sim_par = sim_par_data
+        with open(sim_par_path, 'r') as sim_par_file:
+            sim_par.update(yaml.safe_load(sim_par_file) or {})
+    sim_dir = dict(sim_dir_data)
     if os.path.exists(sim_dir_path):
-        sim_dir = yaml.load(open(sim_dir_path, 'r'))
-    else:
-        sim_dir = sim_dir_data
+        with open(sim_dir_path, 'r') as sim_dir_file:
+            sim_dir.update(yaml.safe_load(sim_dir_file) or {})
 
     return sim_par, sim_dir
 
@@ -3,7 +3,7 @@
 # Author: Kutay B. Sezginel
 import os
 import math
-from ipmof.geometry import car2frac, frac2car, sub3, add3, xyz_rotation
+from ipmof.geometry import car2frac, frac2car, sub3, rotate_points
 from ipmof.crystal import MOF
 from ase import Atom
 from ase import Atoms
@@ -71,11 +71,8 @@ def reshape(mof, rotation, initial_coordinate):
     rot_coor = mof.packed_coors[0][0]
     translation_vector = sub3(first_point, rot_coor)
     for unit_cell in mof.packed_coors:
-        for atom_coor in unit_cell:
-            rot_coor = atom_coor
-            rot_coor = xyz_rotation(rot_coor, [x_angle, y_angle, z_angle])
-            new_coor = add3(rot_coor, translation_vector)
-            structure['atom_coors'].append(new_coor)
+        new_coors = rotate_points(unit_cell, [x_angle, y_angle, z_angle]) + translation_vector
+        structure['atom_coors'] += new_coors.tolist()
     structure['atom_names'] = len(mof.packed_coors) * mof.atom_names
     return structure
 
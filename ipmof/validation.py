@@ -0,0 +1,106 @@
+# IPMOF Energy Map Interpolation Validation Functions
+# Date: October 2026
+import time
+
+import numpy as np
+
+from ipmof.crystal import MOF
+from ipmof.celllist import CellList, to_car_matrix
+from ipmof.energymap import energy_map, energy_map_header, fractional_grid, energy_map_sums
+from ipmof.energymap import lj_coefficients, lj_energy, cubic_coefficients
+from ipmof.interpenetration import energy_map_interpolator
+
+
+def interpolation_report(sim_par, mof_path, atom_list, force_field, grid_sizes=(1, 2), num_points=1000, seed=0,
+                         interpolations=('linear', 'cubic')):
+    """
+    Compares interpolation methods ('linear' and 'cubic', see energy_map_interpolator) of fractional energy maps
+    with different grid sizes against energies calculated directly at random points in the unit cell.
+    Hard-core overlap is not used, energy maps are calculated with the rest of the simulation parameters.
+    Errors are reported for each grid size and interpolation method:
+        - mae / rmse: mean absolute and root mean square error for points with negative energy (adsorption region)
+        - median_rel / max_rel: median and max. relative error |E_interpolated - E| / (1 + |E|) for points with
+          energy below atom_energy_limit
+        - points: number of grid points of the energy map
+    Returns report as a list of dictionaries (one for each grid size and interpolation method).
+    """
+    mof = MOF(mof_path)
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    sim_par = dict(sim_par, energy_map_grid='fractional', energy_map_mode='energy', energy_map_overlap=0)
+
+    # Reference energies at random points in the unit cell
+    random_frac = np.random.RandomState(seed).random_sample((num_points, 3))
+    points = random_frac @ to_car_matrix(mof.to_car).T
+    s6, s12 = energy_map_sums(points, CellList(mof, sim_par['cut_off']))
+    c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list)
+    exact = lj_energy(s6, s12, c6, c12)
+    adsorption = exact < 0
+    relevant = exact < sim_par['atom_energy_limit']
+
+    report = []
+    for grid_size in grid_sizes:
+        grid_par = dict(sim_par, grid_size=grid_size)
+        emap = energy_map(grid_par, mof_path, atom_list, force_field, export=False,
+                          workers=sim_par['energy_map_workers'])
+        emap_header = energy_map_header(grid_par, mof, fractional_grid(mof, grid_size)[0])
+        emap_header['coefficients'] = cubic_coefficients(emap, emap_header)
+        for interpolation in interpolations:
+            interpolate = energy_map_interpolator(emap, emap_header, interpolation)
+            energy = np.array([[interpolate(point, atom_index + 3) for atom_index in range(len(atom_list['atom']))]
+                               for point in points])
+            error = np.abs(energy - exact)
+            relative_error = error[relevant] / (1 + np.abs(exact[relevant]))
+            report.append({'grid_size': grid_size, 'interpolation': interpolation, 'points': len(emap),
+                           'mae': float(error[adsorption].mean()) if adsorption.any() else None,
+                           'rmse': float(np.sqrt((error[adsorption] ** 2).mean())) if adsorption.any() else None,
+                           'median_rel': float(np.median(relative_error)) if relevant.any() else None,
+                           'max_rel': float(relative_error.max()) if relevant.any() else None})
+    return report
+
+
+def print_interpolation_report(report):
+    """
+    Prints interpolation report (see interpolation_report) as a table.
+    """
+    print('%10s %14s %10s %12s %12s %12s %12s' % ('Grid size', 'Interpolation', 'Points', 'MAE', 'RMSE',
+                                                 'Median rel.', 'Max rel.'))
+    for row in report:
+        values = [row[key] for key in ['mae', 'rmse', 'median_rel', 'max_rel']]
+        values = [value if value is not None else float('nan') for value in values]
+        print('%10s %14s %10i %12.4g %12.4g %12.4g %12.4g' % (row['grid_size'], row['interpolation'], row['points'],
+                                                             *values))
+
+
+def engine_report(sim_par, mof_path, atom_list, force_field, grid_sizes=(1, 0.5)):
+    """
+    Compares energy maps calculated with the FFT engine (see fft_energy_map_sums) against direct summation
+    for fractional grids with given grid sizes (hard-core overlap is not used):
+        - mae / max_abs: mean and max. absolute error for grid points with negative energy (adsorption region)
+        - median_rel / max_rel: median and max. relative error |E_fft - E| / (1 + |E|) for grid points with
+          energy below atom_energy_limit
+        - direct_time / fft_time: calculation time of each engine (seconds)
+    Returns report as a list of dictionaries (one for each grid size).
+    """
+    sim_par = dict(sim_par, energy_map_grid='fractional', energy_map_mode='energy', energy_map_overlap=0)
+    report = []
+    for grid_size in grid_sizes:
+        emaps, times = {}, {}
+        for engine in ['direct', 'fft']:
+            start = time.time()
+            emaps[engine] = energy_map(dict(sim_par, grid_size=grid_size, energy_map_engine=engine), mof_path,
+                                       atom_list, force_field, export=False, workers=sim_par['energy_map_workers'])
+            times[engine] = time.time() - start
+        exact, energy = emaps['direct'][:, 3:], emaps['fft'][:, 3:]
+        error = np.abs(energy - exact)
+        adsorption = exact < 0
+        relevant = exact < sim_par['atom_energy_limit']
+        relative_error = error[relevant] / (1 + np.abs(exact[relevant]))
+        report.append({'grid_size': grid_size, 'points': len(exact),
+                       'mae': float(error[adsorption].mean()) if adsorption.any() else None,
+                       'max_abs': float(error[adsorption].max()) if adsorption.any() else None,
+                       'median_rel': float(np.median(relative_error)) if relevant.any() else None,
+                       'max_rel': float(relative_error.max()) if relevant.any() else None,
+                       'direct_time': times['direct'], 'fft_time': times['fft']})
+    return report
+
@@ -186,3 +186,54 @@ def plot_energy_map(emap, azim, elev):
     ax.elev = elev
 
     plt.show()
+
+
+def plot_energy_map_slice(emap, emap_header, atom_index, axis=2, index=None, step=1, energy_max=0):
+    """
+    Plots a 2D slice (or the minimum energy projection if index is None) of the energy grid of an atom
+    along axis (0: a, 1: b, 2: c) without loading memory-mapped energy maps (see ipmof.mapview).
+    Energies are clipped to energy_max and shown on the signed log-energy scale.
+     >>> plot_energy_map_slice(emap, emap_header, energy_map_atom_index('C', atom_list), axis=2, index=10)
+    """
+    from ipmof.mapview import energy_map_slice, energy_map_projection
+    from ipmof.energymap import log_energy
+
+    if index is None:
+        energy, points = energy_map_projection(emap, emap_header, atom_index, axis, step)
+    else:
+        energy, points = energy_map_slice(emap, emap_header, atom_index, axis, index, step)
+    axes = [name for i, name in enumerate('abc') if i != axis]
+
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
+    image = ax.imshow(log_energy(np.minimum(energy, energy_max)).T, origin='lower', cmap='viridis')
+    fig.colorbar(image, ax=ax, label='sign(E) ln(1 + |E|)')
+    ax.set_xlabel(axes[0] + ' (grid points / %i)' % step)
+    ax.set_ylabel(axes[1] + ' (grid points / %i)' % step)
+
+    plt.show()
+
+
+def plot_energy_map_isosurface(emap, emap_header, atom_index, level=0, step=2, azim=0, elev=0):
+    """
+    Plots the isosurface of the energy grid of an atom at given energy level calculated on a downsampled
+    grid (every step'th grid point) without loading memory-mapped energy maps (see ipmof.mapview).
+     >>> plot_energy_map_isosurface(emap, emap_header, energy_map_atom_index('C', atom_list), level=0, step=2)
+    """
+    from ipmof.mapview import energy_map_isosurface
+
+    vertices, faces = energy_map_isosurface(emap, emap_header, atom_index, level, step)
+
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111, projection='3d')
+    ax.plot_trisurf(vertices[:, 0], vertices[:, 1], vertices[:, 2], triangles=faces, color='royalblue',
+                    linewidth=0)
+
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+
+    ax.azim = azim
+    ax.elev = elev
+
+    plt.show()
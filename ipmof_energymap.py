@@ -3,7 +3,9 @@ import sys
 
 # Load IPMOF python libraries
 from ipmof.forcefield import read_ff_parameters
-from ipmof.energymap import energy_map, get_mof_list, energy_map_atom_list
+from ipmof.energymap import energy_map, append_energy_map, get_mof_list, energy_map_atom_list, archive_energy_maps
+from ipmof.batch import build_energy_maps, mof_atom_list, energy_map_paths, EMAP_EXTENSIONS
+from ipmof.cache import energy_map_key, cached_energy_map, cache_energy_map
 from ipmof.parameters import read_parameters
 
 # Read simulation parameters and directories
@@ -24,23 +26,57 @@ print('Starting energy map calculation for', len(mof_path_list), 'MOF(s) (grid s
 print('Atom list ->', atom_list['atom'])
 print('Energy map(s) will be exported in', sim_par['energy_map_type'], 'format')
 
-# Main Loop (Energy Map)
-for mof_index, mof_path in enumerate(mof_path_list):
+if sim_par['energy_map_batch'] and sys.argv[-1] != 'q':
+    # Calculate energy maps in a process pool (largest first), completed energy maps are recorded in a manifest
+    build_energy_maps(sim_par, sim_dir, mof_path_list, atom_list, force_field, processes=sim_par['energy_map_batch'])
+else:
+    # Main Loop (Energy Map)
+    for mof_index, mof_path in enumerate(mof_path_list):
 
+        print('-' * 80)
+        print(mof_index + 1, 'Calculating energy map for ->', os.path.basename(mof_path))
+        emap_extension = EMAP_EXTENSIONS[sim_par['energy_map_type']]
+        mof_name = os.path.splitext(os.path.basename(mof_path))[0]
+        emap_path = os.path.join(sim_dir['energy_map_dir'], mof_name + '_emap' + emap_extension)
+        # Lazy 'full' energy maps start with the atoms of the MOF (other atoms are added when they are used)
+        emap_atom_list = mof_atom_list(sim_par, mof_path, atom_list, force_field)
+
+        # Skip calculation if an energy map with the same inputs is found in the cache
+        if sim_par['energy_map_cache']:
+            emap_key = energy_map_key(sim_par, mof_path, emap_atom_list, force_field)
+            if cached_energy_map(emap_key, sim_dir['energy_map_cache_dir'], emap_path):
+                print('Energy map found in cache ->', emap_key)
+                continue
+
+        # Submit jobs here
+        if sys.argv[-1] == 'q':
+            # Load job server libraries
+            from rq import Queue
+            from redis import Redis
+            import sjs
+
+            # Load job queue
+            sjs.load(os.path.join("settings", "sjs.yaml"))
+            job_queue = sjs.get_job_queue()
+
+            # Calculate energy map
+            job_queue.enqueue(energy_map, sim_par, mof_path, emap_atom_list, force_field)
+        else:
+            if sim_par['energy_map_append'] and os.path.exists(emap_path):
+                # Calculate only the atoms missing in the existing energy map
+                new_atoms = append_energy_map(sim_par, mof_path, emap_atom_list, force_field, emap_path,
+                                              workers=sim_par['energy_map_workers'])
+                print('Appended atoms ->', new_atoms)
+            else:
+                emap = energy_map(sim_par, mof_path, emap_atom_list, force_field,
+                                  workers=sim_par['energy_map_workers'])
+            if sim_par['energy_map_cache']:
+                cache_energy_map(emap_key, sim_dir['energy_map_cache_dir'], emap_path, sim_par['energy_map_cache'])
+
+# Store all energy maps in a single chunked and compressed archive
+if sim_par['energy_map_archive'] and sys.argv[-1] != 'q':
+    emap_path_list = energy_map_paths(sim_dir['energy_map_dir'])
+    archive_index = archive_energy_maps(emap_path_list, sim_dir['energy_map_archive_dir'],
+                                        num_shards=sim_par['energy_map_archive'])
     print('-' * 80)
-    print(mof_index + 1, 'Calculating energy map for ->', os.path.basename(mof_path))
-    # Submit jobs here
-    if sys.argv[-1] == 'q':
-        # Load job server libraries
-        from rq import Queue
-        from redis import Redis
-        import sjs
-
-        # Load job queue
-        sjs.load(os.path.join("settings", "sjs.yaml"))
-        job_queue = sjs.get_job_queue()
-
-        # Calculate energy map
-        job_queue.enqueue(energy_map, sim_par, mof_path, atom_list, force_field)
-    else:
-        emap = energy_map(sim_par, mof_path, atom_list, force_field)
+    print(len(archive_index['energy_maps']), 'energy map(s) archived ->', sim_dir['energy_map_archive_dir'])
@@ -0,0 +1,26 @@
+import os
+
+# Load IPMOF python libraries
+from ipmof.forcefield import read_ff_parameters
+from ipmof.energymap import get_mof_list, energy_map_atom_list
+from ipmof.validation import interpolation_report, print_interpolation_report
+from ipmof.parameters import read_parameters
+
+# Read simulation parameters and directories
+sim_par, sim_dir = read_parameters()
+
+# Read excel file containing force field information
+force_field = read_ff_parameters(sim_dir['force_field_path'], sim_par['force_field'])
+
+# Read MOF list from CoRE or from a given directory
+mof_path_list = get_mof_list(sim_par, sim_dir)
+
+# Calculate atom list according to 'energy_map_atom_list' simulation parameter
+atom_list = energy_map_atom_list(sim_par, force_field, mof_path_list)
+
+# Compare linear and cubic interpolation of 1 and 2 Angstrom energy maps for each MOF
+for mof_index, mof_path in enumerate(mof_path_list):
+    print('-' * 80)
+    print(mof_index + 1, 'Interpolation report for ->', os.path.basename(mof_path))
+    report = interpolation_report(sim_par, mof_path, atom_list, force_field, grid_sizes=(1, 2))
+    print_interpolation_report(report)
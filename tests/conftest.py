@@ -0,0 +1,83 @@
+# IPMOF Test Fixtures
+# Date: October 2026
+import os
+
+import numpy as np
+import pytest
+
+from ipmof.celllist import to_car_matrix
+from ipmof.forcefield import read_ff_parameters, get_ff_parameters
+from ipmof.parameters import sim_par_data
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Triclinic unit cell and grid with a different number of grid points along each axis (random energy maps)
+RANDOM_MAP_TO_CAR = [10.0, 1.5, 0.8, 9.0, 1.2, 8.0]
+RANDOM_MAP_SHAPE = (6, 7, 8)
+
+
+@pytest.fixture(scope='session')
+def mof_path():
+    return os.path.join(ROOT_DIR, 'mof', 'SAHYIK.cif')
+
+
+@pytest.fixture(scope='session')
+def symmetric_mof_path():
+    """
+    Cubic (Fm-3m) test framework with atoms on special positions (Zn on the origin).
+    """
+    return os.path.join(ROOT_DIR, 'tests', 'data', 'FM3M.cif')
+
+
+@pytest.fixture(scope='session')
+def force_field():
+    return read_ff_parameters(os.path.join(ROOT_DIR, 'doc', 'FF_Parameters.xlsx'), 'uff')
+
+
+@pytest.fixture(scope='session')
+def dreiding_force_field():
+    return read_ff_parameters(os.path.join(ROOT_DIR, 'doc', 'FF_Parameters.xlsx'), 'dre')
+
+
+@pytest.fixture
+def sim_par():
+    """
+    Simulation parameters with a coarse grid and a short cut-off radius so that energy maps are small.
+    """
+    return dict(sim_par_data, grid_size=3, cut_off=8, energy_map_type='numpy')
+
+
+def probe_atom_list(atom_names, force_field):
+    """
+    Atom list (energy map probe atoms) with force field parameters of given atoms.
+    """
+    ff_parameters = get_ff_parameters(atom_names, force_field)
+    return {'atom': [ff[0] for ff in ff_parameters], 'sigma': [ff[1] for ff in ff_parameters],
+            'epsilon': [ff[2] for ff in ff_parameters]}
+
+
+@pytest.fixture(scope='session')
+def atom_list_of(force_field):
+    return lambda atom_names: probe_atom_list(atom_names, force_field)
+
+
+def random_energy_map(seed=0, inaccessible=0):
+    """
+    Energy map rows (emap[i] = [x, y, z, atom1_energy, atom2_energy]) and header of a random fractional map
+    (energies between -2 and 50). Given fraction of the grid points is inaccessible (energy of 1E4 for both atoms).
+    """
+    rng = np.random.default_rng(seed)
+    to_car = to_car_matrix(RANDOM_MAP_TO_CAR)
+    to_frac = np.linalg.inv(to_car)
+    grid_index = np.indices(RANDOM_MAP_SHAPE).reshape(3, -1).T
+    points = (grid_index / RANDOM_MAP_SHAPE) @ to_car.T
+    energy = rng.uniform(-2, 50, size=(len(points), 2))
+    energy[rng.random(len(points)) < inaccessible] = 1E4
+    emap_header = {'grid': 'fractional', 'mode': 'energy', 'shape': list(RANDOM_MAP_SHAPE),
+                   'to_car': RANDOM_MAP_TO_CAR, 'overlap_energy': None,
+                   'to_frac': [float(i) for i in to_frac[np.triu_indices(3)]]}
+    return np.concatenate([points, energy], axis=1), emap_header
+
+
+@pytest.fixture(scope='session')
+def fractional_energy_map():
+    return random_energy_map
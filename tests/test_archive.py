@@ -0,0 +1,62 @@
+# IPMOF Energy Map Archive Tests
+# Date: October 2026
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from ipmof.archive import read_archived_energy_map, read_archive_index
+from ipmof.batch import energy_map_paths
+from ipmof.energymap import energy_map, import_energy_map, archive_energy_maps, energy_map_rows
+
+
+@pytest.fixture
+def energy_map_dir(tmp_path, sim_par, mof_path, force_field, atom_list_of):
+    """
+    Energy map directory with a numpy, a yaml and a binary energy map (copies of SAHYIK named after the
+    energy map type) together with a lock file and an unfinished temporary file.
+    """
+    emap_dir = str(tmp_path / 'energymap')
+    os.makedirs(emap_dir)
+    sim_par['energy_map_grid'] = 'fractional'
+    for emap_type in ['numpy', 'yaml', 'binary']:
+        emap_mof_path = os.path.join(str(tmp_path), emap_type.upper() + '.cif')
+        shutil.copyfile(mof_path, emap_mof_path)
+        energy_map(dict(sim_par, energy_map_type=emap_type), emap_mof_path, atom_list_of(['C', 'H']), force_field,
+                   export_dir=emap_dir)
+    open(os.path.join(emap_dir, 'NUMPY_emap.npy.lock'), 'w').close()
+    open(os.path.join(emap_dir, 'BINARY_emap.bin.1a2b3c.tmp'), 'w').close()
+    return emap_dir
+
+
+def test_energy_map_archive(tmp_path, energy_map_dir):
+    emap_paths = energy_map_paths(energy_map_dir)
+    assert [os.path.basename(path) for path in emap_paths] == ['BINARY_emap.bin', 'NUMPY_emap.npy', 'YAML_emap.yaml']
+    archive_dir = str(tmp_path / 'archive')
+    archive_index = archive_energy_maps(emap_paths, archive_dir, num_shards=2)
+    assert sorted(archive_index['energy_maps']) == ['BINARY', 'NUMPY', 'YAML']
+    assert read_archive_index(archive_dir) == archive_index
+
+    for emap_path in emap_paths:
+        mof_name = os.path.basename(emap_path).split('_emap')[0]
+        atom_list, emap, emap_header = import_energy_map(emap_path, header=True)
+        if emap_header.get('layout') == 'block':
+            emap = energy_map_rows(emap, emap_header)
+        archived_atom_list, emap_block, archived_header = import_energy_map(
+            os.path.join(archive_dir, mof_name + '_emap.bin'), header=True)
+        assert archived_atom_list['atom'] == list(atom_list['atom'])
+        assert np.allclose(archived_atom_list['sigma'], atom_list['sigma'])
+        assert archived_header['shape'] == emap_header['shape']
+        # Archived energy blocks are float32
+        assert np.allclose(energy_map_rows(emap_block, archived_header), emap, rtol=1E-6, atol=1E-6)
+
+        # Single columns are read without the others
+        _, column_block, _ = read_archived_energy_map(archive_dir, mof_name, columns=[1])
+        assert np.isnan(column_block[0]).all()
+        assert np.array_equal(column_block[1], emap_block[1])
+
+
+def test_archive_unknown_energy_map_format(tmp_path, energy_map_dir):
+    with pytest.raises(ValueError):
+        archive_energy_maps([os.path.join(energy_map_dir, 'NUMPY_emap.npy.lock')], str(tmp_path / 'archive'))
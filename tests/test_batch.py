@@ -0,0 +1,61 @@
+# IPMOF Batch Energy Map Tests
+# Date: October 2026
+import os
+import shutil
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import ipmof.batch
+from ipmof.batch import build_energy_maps, read_manifest
+from ipmof.energymap import energy_map, import_energy_map
+
+
+def interrupted_energy_map(sim_par, mof_path, atom_list, force_field, export_dir, **kwargs):
+    """
+    Energy map calculation that is interrupted for MOF C after writing part of its energy map file.
+    """
+    if os.path.basename(mof_path) == 'C.cif':
+        with open(os.path.join(export_dir, 'C_emap.npy'), 'wb') as emap_file:
+            emap_file.write(b'partial')
+        raise RuntimeError('interrupted')
+    return energy_map(sim_par, mof_path, atom_list, force_field, export_dir=export_dir, **kwargs)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='worker processes must be forked')
+def test_resume_energy_map_batch(tmp_path, monkeypatch, sim_par, mof_path, force_field, atom_list_of):
+    emap_dir = str(tmp_path / 'energymap')
+    os.makedirs(emap_dir)
+    sim_dir = {'energy_map_dir': emap_dir, 'energy_map_cache_dir': str(tmp_path / 'cache')}
+    sim_par['energy_map_grid'] = 'fractional'
+    atom_list = atom_list_of(['C', 'H'])
+    mof_path_list = []
+    for mof_name in ['A', 'B', 'C']:
+        mof_path_list.append(os.path.join(str(tmp_path), mof_name + '.cif'))
+        shutil.copyfile(mof_path, mof_path_list[-1])
+
+    # Energy maps have the same cost, so they are calculated in order (A, B and then C)
+    monkeypatch.setattr(ipmof.batch, 'energy_map', interrupted_energy_map)
+    with pytest.raises(RuntimeError):
+        build_energy_maps(sim_par, sim_dir, mof_path_list, atom_list, force_field, processes=1)
+    assert sorted(read_manifest(emap_dir)) == ['A', 'B']
+    completed = {mof_name: os.stat(os.path.join(emap_dir, mof_name + '_emap.npy')).st_mtime_ns
+                 for mof_name in ['A', 'B']}
+
+    monkeypatch.setattr(ipmof.batch, 'energy_map', energy_map)
+    manifest = build_energy_maps(sim_par, sim_dir, mof_path_list, atom_list, force_field, processes=1)
+    assert sorted(manifest) == ['A', 'B', 'C'] and read_manifest(emap_dir) == manifest
+    for mof_name in ['A', 'B']:
+        assert os.stat(os.path.join(emap_dir, mof_name + '_emap.npy')).st_mtime_ns == completed[mof_name]
+    emap_atom_list, emap = import_energy_map(os.path.join(emap_dir, 'C_emap.npy'))
+    assert list(emap_atom_list['atom']) == ['C', 'H']
+    _, reference_emap = import_energy_map(os.path.join(emap_dir, 'A_emap.npy'))
+    assert np.array_equal(emap, reference_emap)
+
+    # Energy maps with changed inputs are recalculated
+    keys = {mof_name: manifest[mof_name]['key'] for mof_name in manifest}
+    manifest = build_energy_maps(dict(sim_par, grid_size=2), sim_dir, mof_path_list, atom_list, force_field,
+                                 processes=1)
+    assert all(manifest[mof_name]['key'] != keys[mof_name] for mof_name in ['A', 'B', 'C'])
+    assert os.stat(os.path.join(emap_dir, 'A_emap.npy')).st_mtime_ns != completed['A']
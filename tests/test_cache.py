@@ -0,0 +1,84 @@
+# IPMOF Energy Map Cache Tests
+# Date: October 2026
+import os
+from multiprocessing import Pool
+
+from ipmof.cache import energy_map_key, cached_energy_map, cache_energy_map, read_cache_index
+
+
+def write_energy_map_file(emap_dir, mof_name, size):
+    """
+    Energy map file with given size (bytes) and content, returns its path.
+    """
+    emap_path = os.path.join(str(emap_dir), mof_name + '_emap.npy')
+    with open(emap_path, 'wb') as emap_file:
+        emap_file.write(mof_name.encode().ljust(size, b'.'))
+    return emap_path
+
+
+def test_energy_map_key(sim_par, mof_path, force_field, dreiding_force_field, atom_list_of):
+    atom_list = atom_list_of(['C', 'H'])
+    key = energy_map_key(sim_par, mof_path, atom_list, force_field)
+    assert key == energy_map_key(dict(sim_par), mof_path, atom_list, force_field)
+    assert key != energy_map_key(dict(sim_par, grid_size=2), mof_path, atom_list, force_field)
+    assert key != energy_map_key(sim_par, mof_path, atom_list_of(['C', 'O']), force_field)
+    assert key != energy_map_key(sim_par, mof_path, atom_list, dreiding_force_field)
+
+
+def test_sums_energy_map_key(sim_par, mof_path, force_field, dreiding_force_field, atom_list_of):
+    """
+    Energy maps in 'sums' mode do not depend on the atom list, and on the force field only through the
+    hard-core overlap radii.
+    """
+    sim_par.update(energy_map_mode='sums', energy_map_overlap=0)
+    key = energy_map_key(sim_par, mof_path, atom_list_of(['C']), force_field)
+    assert key == energy_map_key(sim_par, mof_path, atom_list_of(['H']), force_field)
+    assert key == energy_map_key(sim_par, mof_path, atom_list_of(['C']), dreiding_force_field)
+    sim_par['energy_map_overlap'] = 0.5
+    key = energy_map_key(sim_par, mof_path, atom_list_of(['C']), force_field)
+    assert key == energy_map_key(sim_par, mof_path, atom_list_of(['H']), force_field)
+    assert key != energy_map_key(sim_par, mof_path, atom_list_of(['C']), dreiding_force_field)
+
+
+def test_cached_energy_map(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    emap_path = write_energy_map_file(tmp_path, 'MOF', 100)
+    assert not cached_energy_map('key', cache_dir, emap_path)
+    cache_energy_map('key', cache_dir, emap_path, 1)
+    os.remove(emap_path)
+    assert cached_energy_map('key', cache_dir, emap_path)
+    with open(emap_path, 'rb') as emap_file:
+        assert emap_file.read() == b'MOF'.ljust(100, b'.')
+    assert not cached_energy_map('other', cache_dir, emap_path)
+
+
+def test_evict_energy_maps(tmp_path):
+    """
+    Least recently used energy maps are removed when the cache exceeds its budget (1 MB = 1024^2 bytes).
+    """
+    cache_dir = str(tmp_path / 'cache')
+    size = 1024 ** 2 // 3
+    for mof_name in ['A', 'B', 'C']:
+        cache_energy_map(mof_name, cache_dir, write_energy_map_file(tmp_path, mof_name, size), 1)
+    assert sorted(read_cache_index(cache_dir)) == ['A', 'B', 'C']
+    # A is used again, so B is the least recently used energy map
+    assert cached_energy_map('A', cache_dir, os.path.join(str(tmp_path), 'A_emap.npy'))
+    cache_energy_map('D', cache_dir, write_energy_map_file(tmp_path, 'D', size), 1)
+    assert sorted(read_cache_index(cache_dir)) == ['A', 'C', 'D']
+    assert sorted(f for f in os.listdir(cache_dir) if f.endswith('.npy')) == ['A.npy', 'C.npy', 'D.npy']
+
+
+def cache_worker(args):
+    cache_dir, emap_path, key = args
+    cache_energy_map(key, cache_dir, emap_path, 100)
+
+
+def test_concurrent_cache_updates(tmp_path):
+    """
+    Energy maps cached by concurrent workers are all kept in the cache index.
+    """
+    cache_dir = str(tmp_path / 'cache')
+    jobs = [(cache_dir, write_energy_map_file(tmp_path, 'MOF%i' % i, 1000), 'key%i' % i) for i in range(24)]
+    with Pool(4) as pool:
+        pool.map(cache_worker, jobs, chunksize=1)
+    assert sorted(read_cache_index(cache_dir)) == sorted(job[2] for job in jobs)
@@ -0,0 +1,379 @@
+# IPMOF Energy Map Tests
+# Date: October 2026
+import os
+from multiprocessing import Pool
+
+import ase
+import numpy as np
+import pytest
+
+import ipmof.energymap
+from ipmof.celllist import CellList
+from ipmof.crystal import MOF
+from ipmof.forcefield import lorentz_berthelot_mix
+from ipmof.validation import engine_report
+from ipmof.energymap import write_binary_energy_map, read_binary_energy_map, energy_map_pyramid, energy_map_block
+from ipmof.energymap import energy_map, append_energy_map, import_energy_map, energy_map_rows, atomic_file
+from ipmof.energymap import quantize_energy_block, energy_decode_table, QUANTIZE_ENERGY_MAX
+from ipmof.energymap import LazyEnergyMap, OVERLAP_ENERGY, fractional_grid, energy_map_sums, fft_energy_map_sums
+from ipmof.energymap import lj_coefficients, lj_energy, tile_layers, fractional_grid_shape, plain_data
+from ipmof.energymap import BLOCK_ELEMENTS, LJ_SCRATCH_ARRAYS, grid_symmetry, parallel_tasks
+
+ATOM_LIST = {'atom': ['C', 'H'], 'sigma': [3.4, 2.6], 'epsilon': [0.1, 0.02]}
+
+
+def reference_min_pool(energy, factor, before=0, after=1):
+    """
+    Minimum of each periodic window of an energy grid (explicit loop over coarse grid points).
+    """
+    pooled = np.empty([-(-n // factor) for n in energy.shape])
+    for coarse in np.ndindex(*pooled.shape):
+        window = np.ix_(*[np.arange(i * factor - before, i * factor + factor + after) % n
+                          for i, n in zip(coarse, energy.shape)])
+        pooled[coarse] = energy[window].min()
+    return pooled
+
+
+def test_energy_map_pyramid(fractional_energy_map):
+    emap, emap_header = fractional_energy_map(inaccessible=0.25)
+    grid_shape = tuple(emap_header['shape'])
+    emap_block = energy_map_block(emap, emap_header)
+    levels = energy_map_pyramid(emap, emap_header, [2, 4, 1, 2])
+    block_levels = energy_map_pyramid(emap_block, dict(emap_header, layout='block'), [2, 4])
+    assert [level['factor'] for level in levels] == [4, 2]
+    for level, block_level in zip(levels, block_levels):
+        for column in range(2):
+            energy = emap[:, column + 3].reshape(grid_shape)
+            assert np.array_equal(level['block'][column], reference_min_pool(energy, level['factor']))
+            assert np.array_equal(block_level['block'][column],
+                                  reference_min_pool(emap_block[column].astype(float), level['factor']))
+    assert energy_map_pyramid(emap, dict(emap_header, grid='cartesian'), [2]) == []
+
+
+def test_sparse_energy_map_pyramid(tmp_path, fractional_energy_map):
+    emap, emap_header = fractional_energy_map(inaccessible=0.25)
+    grid_shape = tuple(emap_header['shape'])
+    emap_path = os.path.join(str(tmp_path), 'MOF_emap.bin')
+    write_binary_energy_map(emap_path, emap, ATOM_LIST, emap_header, sparse=1E3)
+    atom_list, emap_block, sparse_header = read_binary_energy_map(emap_path)
+    assert 'sparse' in sparse_header
+    assert len(list(emap_block)) == len(atom_list['atom'])
+
+    levels = energy_map_pyramid(emap_block, sparse_header, [4, 2])
+    dense_levels = energy_map_pyramid(np.asarray(emap_block), dict(sparse_header, sparse=None), [4, 2])
+    assert [level['factor'] for level in levels] == [4, 2]
+    for level, dense_level in zip(levels, dense_levels):
+        assert level['block'].shape == (2,) + tuple(-(-n // level['factor']) for n in grid_shape)
+        assert np.array_equal(level['block'], dense_level['block'])
+
+    # Coarse levels are lower bounds of the accessible grid point energies (excluded points are saturated)
+    energy = np.where(emap[:, 3:] <= 1E3, emap[:, 3:], OVERLAP_ENERGY).T.reshape((2,) + grid_shape)
+    fine = levels[-1]['block'].repeat(2, axis=1).repeat(2, axis=2).repeat(2, axis=3)
+    fine = fine[:, :grid_shape[0], :grid_shape[1], :grid_shape[2]]
+    assert np.all(fine <= energy.astype('<f4'))
+
+
+@pytest.mark.parametrize('quantize, max_error', [('uint16', 2.5E-4), ('uint8', 6.5E-2)])
+def test_quantize_energy_block(quantize, max_error):
+    """
+    Decoded energies are within the documented bound (1 + |E|) * max_error, energies above the log-energy scale
+    are clipped and saturated (or infinite) grid points decode to the overlap energy.
+    """
+    rng = np.random.default_rng(0)
+    energy = np.concatenate([-np.expm1(rng.uniform(0, np.log1p(1E3), 5000)),
+                             np.expm1(rng.uniform(0, np.log1p(QUANTIZE_ENERGY_MAX), 5000)),
+                             [0, -1E3, QUANTIZE_ENERGY_MAX, 1E20, OVERLAP_ENERGY, np.inf]])
+    codes, quantization = quantize_energy_block(energy, quantize, overlap_energy=OVERLAP_ENERGY)
+    decoded = energy_decode_table(quantization)[codes]
+    assert quantization['max_error'] < max_error
+    exact = energy <= QUANTIZE_ENERGY_MAX
+    assert np.all(np.abs(decoded[exact] - energy[exact]) <= (1 + np.abs(energy[exact])) * quantization['max_error'])
+    assert np.isclose(decoded[-3], QUANTIZE_ENERGY_MAX)
+    assert np.all(decoded[-2:] == OVERLAP_ENERGY)
+
+
+def test_quantized_binary_energy_map(tmp_path, fractional_energy_map):
+    emap, emap_header = fractional_energy_map(inaccessible=0.25)
+    emap[:20, 3:] = OVERLAP_ENERGY
+    emap_path = os.path.join(str(tmp_path), 'MOF_emap.bin')
+    write_binary_energy_map(emap_path, emap, ATOM_LIST, dict(emap_header, overlap_energy=OVERLAP_ENERGY),
+                            quantize='uint16')
+    atom_list, emap_block, quantized_header = read_binary_energy_map(emap_path)
+    assert emap_block.dtype == np.dtype('<u2')
+    energy = energy_map_rows(emap_block, quantized_header)[:, 3:]
+    max_error = quantized_header['quantization']['max_error']
+    assert np.all(energy[:20] == OVERLAP_ENERGY)
+    assert np.all(np.abs(energy[20:] - emap[20:, 3:]) <= (1 + np.abs(emap[20:, 3:])) * max_error)
+
+
+def energy_map_values(emap_path):
+    """
+    Atom names, energy map rows and header of an energy map file.
+    """
+    atom_list, emap, emap_header = import_energy_map(emap_path, header=True)
+    if emap_header.get('layout') == 'block':
+        emap = energy_map_rows(emap, emap_header)
+    return list(atom_list['atom']), np.asarray(emap, dtype=float), emap_header
+
+
+@pytest.mark.parametrize('emap_type, store_sums', [('numpy', True), ('binary', True), ('binary', False)])
+def test_append_energy_map(tmp_path, monkeypatch, sim_par, mof_path, force_field, atom_list_of, emap_type,
+                           store_sums):
+    sim_par.update(energy_map_type=emap_type, energy_map_append=store_sums)
+    energy_map(sim_par, mof_path, atom_list_of(['C', 'H']), force_field, export_dir=str(tmp_path))
+    emap_path = os.path.join(str(tmp_path), 'SAHYIK_emap' + ('.npy' if emap_type == 'numpy' else '.bin'))
+    if store_sums:
+        # New columns are derived from the stored sums without summing over neighbor atoms
+        monkeypatch.setattr(ipmof.energymap, 'energy_map_sums', None)
+    new_atoms = append_energy_map(sim_par, mof_path, atom_list_of(['C', 'O', 'Zn']), force_field, emap_path)
+    assert new_atoms == ['O', 'Zn']
+    monkeypatch.undo()
+
+    atoms, emap, emap_header = energy_map_values(emap_path)
+    assert atoms == ['C', 'H', 'O', 'Zn']
+    assert (emap_header.get('sums') is not None) == store_sums
+    reference = energy_map(sim_par, mof_path, atom_list_of(['C', 'H', 'O', 'Zn']), force_field, export=False)
+    assert np.allclose(emap, reference.astype('<f4') if emap_type == 'binary' else reference, rtol=1E-6)
+    assert append_energy_map(sim_par, mof_path, atom_list_of(['O']), force_field, emap_path) == []
+
+
+def test_append_energy_map_settings_changed(tmp_path, sim_par, mof_path, force_field, atom_list_of):
+    energy_map(sim_par, mof_path, atom_list_of(['C', 'H']), force_field, export_dir=str(tmp_path))
+    emap_path = os.path.join(str(tmp_path), 'SAHYIK_emap.npy')
+    # Energy map is calculated again with its atoms followed by the missing atoms
+    sim_par.update(cut_off=7, energy_map_overlap=0.5)
+    new_atoms = append_energy_map(sim_par, mof_path, atom_list_of(['O', 'C']), force_field, emap_path)
+    assert new_atoms == ['C', 'H', 'O']
+    atoms, emap, emap_header = energy_map_values(emap_path)
+    assert atoms == ['C', 'H', 'O']
+    assert emap_header['cut_off'] == 7 and emap_header['overlap'] == 0.5
+    reference = energy_map(sim_par, mof_path, atom_list_of(['C', 'H', 'O']), force_field, export=False)
+    assert np.array_equal(emap, reference)
+
+
+def test_append_energy_map_mode_changed(tmp_path, sim_par, mof_path, force_field, atom_list_of):
+    energy_map(dict(sim_par, energy_map_mode='sums'), mof_path, atom_list_of(['C']), force_field,
+               export_dir=str(tmp_path))
+    emap_path = os.path.join(str(tmp_path), 'SAHYIK_emap.npy')
+    assert append_energy_map(dict(sim_par, energy_map_mode='sums'), mof_path, atom_list_of(['C']), force_field,
+                             emap_path) == []
+    new_atoms = append_energy_map(sim_par, mof_path, atom_list_of(['C', 'H']), force_field, emap_path)
+    assert new_atoms == ['C', 'H']
+    atoms, emap, emap_header = energy_map_values(emap_path)
+    assert emap_header['mode'] == 'energy' and atoms == ['C', 'H']
+
+
+def lazy_append(args):
+    sim_par, emap_path, mof_path, force_field, atom_name = args
+    return LazyEnergyMap(sim_par, emap_path, mof_path, force_field).add_atoms([atom_name])
+
+
+def test_concurrent_energy_map_appends(tmp_path, sim_par, mof_path, force_field, atom_list_of):
+    sim_par.update(energy_map_append=True)
+    energy_map(sim_par, mof_path, atom_list_of(['C']), force_field, export_dir=str(tmp_path))
+    emap_path = os.path.join(str(tmp_path), 'SAHYIK_emap.npy')
+    new_atoms = ['H', 'O', 'Zn', 'N', 'S', 'Cl']
+    with Pool(3) as pool:
+        added = pool.map(lazy_append, [(sim_par, emap_path, mof_path, force_field, atom) for atom in new_atoms])
+    assert sorted(sum(added, [])) == sorted(new_atoms)
+    atoms, emap, emap_header = energy_map_values(emap_path)
+    assert sorted(atoms) == sorted(['C'] + new_atoms)
+    reference = energy_map(sim_par, mof_path, atom_list_of(atoms), force_field, export=False)
+    assert np.allclose(emap, reference, rtol=1E-10)
+    assert sorted(os.listdir(str(tmp_path))) == ['SAHYIK_emap.npy', 'SAHYIK_emap.npy.lock']
+
+
+def test_atomic_file(tmp_path):
+    file_path = os.path.join(str(tmp_path), 'MOF_emap.bin')
+    with atomic_file(file_path) as emap_file:
+        emap_file.write(b'complete')
+    with pytest.raises(RuntimeError):
+        with atomic_file(file_path) as emap_file:
+            emap_file.write(b'partial')
+            raise RuntimeError('interrupted')
+    with open(file_path, 'rb') as emap_file:
+        assert emap_file.read() == b'complete'
+    assert os.listdir(str(tmp_path)) == ['MOF_emap.bin']
+
+
+def test_import_unknown_energy_map_format(tmp_path):
+    emap_path = os.path.join(str(tmp_path), 'MOF_emap.npy.lock')
+    open(emap_path, 'w').close()
+    with pytest.raises(ValueError):
+        import_energy_map(emap_path)
+
+
+def test_binary_octree_energy_map(tmp_path, sim_par, force_field, atom_list_of):
+    """
+    Octree grids cannot be exported in binary format, which is checked before the MOF is read.
+    """
+    sim_par.update(energy_map_grid='octree', energy_map_type='binary')
+    with pytest.raises(ValueError):
+        energy_map(sim_par, os.path.join(str(tmp_path), 'MISSING.cif'), atom_list_of(['C']), force_field,
+                   export_dir=str(tmp_path))
+
+
+def test_tile_layers(sim_par, mof_path, force_field, atom_list_of):
+    """
+    Scratch arrays of each worker are taken from the memory budget before the grid layers.
+    """
+    mof = MOF(mof_path)
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    grid_shape = fractional_grid_shape(mof, 0.5)
+    scratch_mb = LJ_SCRATCH_ARRAYS * BLOCK_ELEMENTS * 8 / 1024 ** 2
+    sim_par.update(grid_size=0.5, energy_map_memory=scratch_mb + 20)
+    atom_list = atom_list_of(['C', 'H', 'O'])
+    layers = tile_layers(sim_par, mof, atom_list, grid_shape)
+    layer_mb = grid_shape[1] * grid_shape[2] * 8 * (14 + 4 * 4 + 2 * 3) / 1024 ** 2
+    assert 1 < layers < 20 / layer_mb
+    assert tile_layers(sim_par, mof, atom_list, grid_shape, workers=2) == 1
+
+
+@pytest.mark.parametrize('grid, engine', [('cartesian', 'direct'), ('fractional', 'direct'), ('fractional', 'fft')])
+def test_parallel_energy_map(sim_par, mof_path, force_field, atom_list_of, grid, engine):
+    sim_par.update(energy_map_grid=grid, energy_map_engine=engine, energy_map_overlap=0.5)
+    atom_list = atom_list_of(['C', 'H', 'O'])
+    serial_map = energy_map(sim_par, mof_path, atom_list, force_field, export=False)
+    parallel_map = energy_map(sim_par, mof_path, atom_list, force_field, export=False, workers=3)
+    assert np.array_equal(serial_map, parallel_map)
+    assert (serial_map[:, 3:] == OVERLAP_ENERGY).any()
+
+
+@pytest.mark.parametrize('grid_size', [0.5, 1.0, 2.0])
+def test_fft_energy_map_error(tmp_path, force_field, atom_list_of, grid_size):
+    """
+    FFT energy map sums of a small triclinic cell against direct summation. The energy error is bounded
+    relative to the magnitude of the attractive and repulsive terms (the energy itself crosses zero).
+    """
+    atoms = ase.Atoms('ZnO2C', cell=[[9, 0, 0], [1.2, 8.5, 0], [0.7, 0.9, 10]], pbc=True,
+                      scaled_positions=[[0.1, 0.2, 0.3], [0.55, 0.45, 0.6], [0.3, 0.8, 0.15], [0.75, 0.1, 0.85]])
+    atoms.write(str(tmp_path / 'CELL.cif'))
+    mof = MOF(str(tmp_path / 'CELL.cif'))
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    grid_shape, grid_points = fractional_grid(mof, grid_size)
+    c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list_of(['C', 'H']))
+    s6, s12 = energy_map_sums(grid_points, CellList(mof, 12))
+    fft_s6, fft_s12 = fft_energy_map_sums(mof, grid_shape, grid_points, 12, 4.0)
+    energy_error = np.abs(lj_energy(fft_s6, fft_s12, c6, c12) - lj_energy(s6, s12, c6, c12))
+    assert np.max(np.abs(fft_s6 / s6 - 1)) < 0.05
+    assert np.max(energy_error / lj_energy(-s6, s12, c6, c12)) < 0.03
+
+
+@pytest.mark.parametrize('mode', ['energy', 'sums'])
+def test_energy_map_on_atom(sim_par, symmetric_mof_path, force_field, atom_list_of, mode):
+    """
+    Grid points on framework atoms (Zn on the origin, 8 in total) are saturated instead of skipping the atom.
+    """
+    sim_par.update(grid_size=1.0, cut_off=10, energy_map_grid='fractional', energy_map_mode=mode)
+    emap = energy_map(sim_par, symmetric_mof_path, atom_list_of(['C', 'H']), force_field, export=False)
+    assert np.allclose(emap[0, :3], 0)
+    if mode == 'energy':
+        saturated = emap[:, 3] == OVERLAP_ENERGY
+        assert saturated[0] and saturated.sum() == 8
+        assert np.all(emap[saturated, 3:] == OVERLAP_ENERGY)
+    else:
+        s6, s12 = np.split(emap[:, 3:], 2, axis=1)
+        saturated = np.isinf(s12).any(axis=1)
+        assert np.isinf(s12[0, MOF(symmetric_mof_path).uniq_atom_names.index('Zn')])
+        assert saturated.sum() == 8 and np.all(np.isfinite(s6))
+
+
+@pytest.mark.parametrize('mode', ['energy', 'sums'])
+def test_energy_map_overlap(sim_par, symmetric_mof_path, force_field, atom_list_of, mode):
+    """
+    Grid points inside the hard-core radius of a framework atom (energy_map_overlap times the smallest mixed
+    sigma of its species, or its own sigma in 'sums' mode) are saturated: OVERLAP_ENERGY in 'energy' mode and
+    NaN sums in 'sums' mode. Distances are found by brute force (cubic cell, minimum image).
+    """
+    sim_par.update(grid_size=1.0, energy_map_grid='fractional', energy_map_mode=mode, energy_map_overlap=0.8)
+    atom_list = atom_list_of(['C', 'H'])
+    emap = energy_map(sim_par, symmetric_mof_path, atom_list, force_field, export=False)
+    mof = MOF(symmetric_mof_path)
+    mof.set_force_field(force_field)
+    if mode == 'energy':
+        species_radii = 0.8 * lorentz_berthelot_mix(mof.sigma, atom_list['sigma'], mof.epsilon,
+                                                    atom_list['epsilon'])[0].min(axis=1)
+        saturated = emap[:, 3] == OVERLAP_ENERGY
+        assert np.all(emap[saturated, 3:] == OVERLAP_ENERGY) and np.all(emap[~saturated, 3:] < OVERLAP_ENERGY)
+    else:
+        species_radii = 0.8 * np.array(mof.sigma)
+        saturated = np.isnan(emap[:, 3])
+        assert np.all(np.isnan(emap[saturated, 3:])) and not np.isnan(emap[~saturated, 3:]).any()
+
+    atom_radii = species_radii[[mof.uniq_atom_names.index(atom_name) for atom_name in mof.atom_names]]
+    uc_length = mof.uc_size[0]
+    difference = (emap[:, None, :3] - np.array(mof.atom_coors)[None, :, :]) / uc_length
+    distance = np.linalg.norm((difference - np.round(difference)) * uc_length, axis=2)
+    overlap = (distance < atom_radii).any(axis=1)
+    assert 0 < overlap.sum() < len(emap)
+    # Grid points on the hard-core radius (within rounding) may be on either side
+    ties = (np.abs(distance - atom_radii) < 1E-9).any(axis=1)
+    assert np.array_equal(saturated[~ties], overlap[~ties])
+
+
+def test_fft_energy_map_sahyik(sim_par, mof_path, force_field, atom_list_of):
+    """
+    FFT against direct energy maps of SAHYIK (see engine_report): relative error |E_fft - E| / (1 + |E|) of
+    the grid points below atom_energy_limit.
+    """
+    sim_par.update(cut_off=12, fft_near_field=4.0)
+    report = engine_report(sim_par, mof_path, atom_list_of(['C', 'H', 'O']), force_field, grid_sizes=(2, 1))
+    for row in report:
+        assert row['median_rel'] < 5E-3
+        assert row['max_rel'] < 0.1
+
+
+@pytest.mark.parametrize('grid_size', [1.0, 0.9])
+@pytest.mark.parametrize('mode', ['energy', 'sums'])
+def test_symmetric_energy_map(sim_par, symmetric_mof_path, force_field, atom_list_of, grid_size, mode):
+    """
+    Energy map calculated on the asymmetric unit of the grid (Fm-3m) against the full grid, including the grid
+    points on special positions and on framework atoms.
+    """
+    sim_par.update(grid_size=grid_size, cut_off=10, energy_map_grid='fractional', energy_map_mode=mode)
+    atom_list = atom_list_of(['C', 'H'])
+    full_map = energy_map(sim_par, symmetric_mof_path, atom_list, force_field, export=False)
+    sim_par['energy_map_symmetry'] = True
+    symmetric_map = energy_map(sim_par, symmetric_mof_path, atom_list, force_field, export=False)
+    assert np.allclose(symmetric_map, full_map, rtol=1E-12, atol=0)
+    mof = MOF(symmetric_mof_path)
+    grid_shape = fractional_grid_shape(mof, grid_size)
+    representative = grid_symmetry(grid_shape, mof.spacegroup.get_symop())
+    assert len(np.unique(representative)) < len(full_map) / 20
+
+
+def test_parallel_tasks(mof_path, force_field):
+    """
+    Tasks are not limited to slabs of cell list bins along a (4 slabs for SAHYIK with a 12 A cut-off).
+    """
+    mof = MOF(mof_path)
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    grid_shape, grid_points = fractional_grid(mof, 1.0)
+    cell_list = CellList(mof, 12)
+    num_tasks = [len(np.unique(parallel_tasks(grid_points, cell_list, workers))) for workers in [1, 4, 32]]
+    assert num_tasks[0] < num_tasks[1] < num_tasks[2]
+    assert num_tasks[2] > len(np.unique(cell_list.point_bins_of(grid_points)[:, 0])) * 8
+    # Bins are not split between tasks
+    bins = cell_list.point_bins_of(grid_points) @ [10000, 100, 1]
+    tasks = parallel_tasks(grid_points, cell_list, 32)
+    assert all(len(np.unique(tasks[bins == i])) == 1 for i in np.unique(bins))
+
+
+@pytest.mark.parametrize('grid', ['fractional', 'octree'])
+def test_yaml_energy_map(tmp_path, sim_par, mof_path, force_field, atom_list_of, grid):
+    """
+    Yaml energy maps (and headers) are read back the same as numpy energy maps.
+    """
+    sim_par.update(energy_map_grid=grid, energy_map_type='yaml')
+    atom_list = atom_list_of(['C', 'H'])
+    energy_map(sim_par, mof_path, atom_list, force_field, export_dir=str(tmp_path))
+    emap_atom_list, emap, emap_header = import_energy_map(str(tmp_path / 'SAHYIK_emap.yaml'), header=True)
+    sim_par['energy_map_type'] = 'numpy'
+    energy_map(sim_par, mof_path, atom_list, force_field, export_dir=str(tmp_path))
+    numpy_atom_list, numpy_emap, numpy_header = import_energy_map(str(tmp_path / 'SAHYIK_emap.npy'), header=True)
+    assert emap_atom_list == numpy_atom_list
+    assert np.array_equal(emap, numpy_emap)
+    assert emap_header == plain_data(numpy_header)
@@ -0,0 +1,126 @@
+# IPMOF Geometry Tests
+# Date: October 2026
+import os
+import math
+
+import numpy as np
+import pytest
+
+from ipmof.geometry import possible_rotations, unique_rotations, xyz_rotation, rotation, rotation_matrix, rotate_points
+
+
+def pairwise_unique_rotations(rot_degree):
+    """
+    Unique rotations found by comparing the rotated points of all pairs of rotation angle combinations
+    (possible_rotations before rotations were grouped with a dictionary).
+    """
+    degrees = []
+    increments = round(360 / rot_degree)
+    for i in range(increments):
+        degrees.append(2 * math.pi * i / increments)
+
+    p = [-34.34, -3.1231, 31.123]
+    points = []
+    degree_combinations = []
+    for dx in degrees:
+        for dy in degrees:
+            for dz in degrees:
+                degree_combinations.append([dx, dy, dz])
+                points.append(xyz_rotation(p, [dx, dy, dz]))
+
+    eq_list = []
+    for p1_index, p1 in enumerate(points):
+        for p2_index, p2 in enumerate(points):
+            if p2_index > p1_index:
+                p1r = [round(i, 3) for i in p1]
+                p2r = [round(i, 3) for i in p2]
+                if p1r == p2r and [p2_index, p1_index] not in eq_list:
+                    eq_list.append([p1_index, p2_index])
+
+    eq1 = [i[0] for i in eq_list]
+    eq2 = [i[1] for i in eq_list]
+    new_eq = []
+    for eq in eq1:
+        if eq not in eq2 and eq not in new_eq:
+            new_eq.append(eq)
+
+    possible_rot_degrees = []
+    for d_index, d in enumerate(degree_combinations):
+        if d_index in new_eq:
+            possible_rot_degrees.append(d)
+    return possible_rot_degrees
+
+
+@pytest.mark.parametrize('rot_degree', [90, 60, 45])
+def test_unique_rotations(rot_degree):
+    rotations = unique_rotations(rot_degree)
+    assert rotations == pairwise_unique_rotations(rot_degree)
+    assert len(rotations) > 0
+
+
+def test_possible_rotations_cache(tmp_path):
+    cache_dir = os.path.join(str(tmp_path), 'rotation_cache')
+    rotations = possible_rotations(90, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == ['rotations_90.yaml']
+    assert possible_rotations(90, cache_dir=cache_dir) == rotations
+    # Without a cache directory nothing is written
+    assert possible_rotations(90) == rotations == unique_rotations(90)
+    assert os.listdir(str(tmp_path)) == ['rotation_cache']
+
+
+def quaternion(axis, angle):
+    """
+    Rotation quaternion [w, x, y, z] for an axis and angle (mathutils.Quaternion(axis, angle)).
+    """
+    axis = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    return np.concatenate([[math.cos(angle / 2)], axis * math.sin(angle / 2)])
+
+
+def quaternion_product(q1, q2):
+    """
+    Hamilton product of two quaternions [w, x, y, z] (mathutils.Quaternion multiplication).
+    """
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return np.array([w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2, w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2, w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2])
+
+
+def quaternion_xyz_rotation(p, angle):
+    """
+    Rotation of a point around x, y, and z axes respectively as calculated with mathutils quaternions
+    (xyz_rotation before rotation matrices were used): (Qrz Qry Qrx P) Qrx^-1 Qry^-1 Qrz^-1
+    """
+    q_rot = quaternion([0, 0, 1], angle[2])
+    q_rot = quaternion_product(q_rot, quaternion([0, 1, 0], angle[1]))
+    q_rot = quaternion_product(q_rot, quaternion([1, 0, 0], angle[0]))
+    q_point = quaternion_product(quaternion_product(q_rot, [0, p[0], p[1], p[2]]), q_rot * [1, -1, -1, -1])
+    return list(q_point[1:])
+
+
+def quaternion_rotation(p, a1, a2, angle):
+    """
+    Rotation of a point around an axis defined by two points as calculated with mathutils quaternions.
+    """
+    q_rot = quaternion(np.subtract(a2, a1), angle)
+    q_point = quaternion_product(quaternion_product(q_rot, np.concatenate([[0], np.subtract(p, a2)])),
+                                 q_rot * [1, -1, -1, -1])
+    return list(q_point[1:] + a2)
+
+
+def test_rotation_convention():
+    """
+    Rotation matrices (R = Rz @ Ry @ Rx) rotate points the same way as the quaternion rotations they replaced
+    for arbitrary angles (including negative angles and angles larger than 2 pi).
+    """
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-30, 30, size=(20, 3))
+    for angle in rng.uniform(-3 * math.pi, 3 * math.pi, size=(50, 3)):
+        reference = [quaternion_xyz_rotation(p, angle) for p in points]
+        assert np.allclose([xyz_rotation(p, angle) for p in points], reference, rtol=0, atol=1E-9)
+        assert np.allclose(rotate_points(points, angle), reference, rtol=0, atol=1E-9)
+        assert np.allclose(points @ rotation_matrix(list(angle)).T, reference, rtol=0, atol=1E-9)
+
+    for a1, a2, p in rng.uniform(-10, 10, size=(50, 3, 3)):
+        angle = rng.uniform(-2 * math.pi, 2 * math.pi)
+        assert np.allclose(rotation(p, a1, a2, angle), quaternion_rotation(p, a1, a2, angle), rtol=0, atol=1E-9)
@@ -0,0 +1,88 @@
+# IPMOF Interpenetration Tests
+# Date: October 2026
+import numpy as np
+import pytest
+
+from ipmof.crystal import MOF
+from ipmof.energymap import energy_map, energy_map_header, fractional_grid_shape
+from ipmof.interpenetration import check_interpenetration
+from ipmof.parameters import sim_par_data
+
+
+@pytest.fixture(scope='module')
+def fractional_emap(mof_path, force_field, atom_list_of):
+    """
+    Fractional energy map of SAHYIK (2 Angstrom grid) with its atom list and header, and base and mobile MOFs.
+    """
+    sim_par = dict(sim_par_data, grid_size=2, cut_off=8, energy_map_grid='fractional')
+    atom_list = atom_list_of(['C', 'H', 'O', 'Zn'])
+    emap = energy_map(sim_par, mof_path, atom_list, force_field, export=False)
+    mof = MOF(mof_path)
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    emap_header = energy_map_header(sim_par, mof, fractional_grid_shape(mof, sim_par['grid_size']))
+    # Base and mobile MOF objects are read once (reading the structure file takes most of the time)
+    return emap, atom_list, emap_header, MOF(mof_path), MOF(mof_path)
+
+
+def interpenetration(mof_path, fractional_emap, **parameters):
+    """
+    Homo-interpenetration of SAHYIK starting from the 4 lowest energy grid points with all rotations.
+    """
+    emap, atom_list, emap_header, base_mof, mobile_mof = fractional_emap
+    sim_par = dict(sim_par_data, try_all_rotations=True, rotation_freedom=90, summary_percent=10,
+                   atom_energy_limit=np.sort(emap[:, 3])[4], **parameters)
+    return check_interpenetration(sim_par, base_mof, mobile_mof, emap, atom_list, emap_header)
+
+
+@pytest.fixture(scope='module')
+def loop_results(mof_path, fractional_emap):
+    """
+    Results of the atom by atom trial loop for given energy density limit and coarse levels (calculated once).
+    """
+    results = {}
+
+    def loop_result(energy_density_limit, levels):
+        key = (energy_density_limit, tuple(levels))
+        if key not in results:
+            results[key] = interpenetration(mof_path, fractional_emap, trial_engine='loop',
+                                            energy_density_limit=energy_density_limit, energy_map_levels=levels)
+        return results[key]
+    return loop_result
+
+
+def assert_same_results(results, reference):
+    summary, structures = results
+    reference_summary, reference_structures = reference
+    assert summary == reference_summary
+    assert len(structures) == len(reference_structures)
+    for structure, reference_structure in zip(structures, reference_structures):
+        assert structure['first_point'] == reference_structure['first_point']
+        assert structure['rotation'] == reference_structure['rotation']
+        assert structure['atom_names'] == reference_structure['atom_names']
+        for key in ['atom_coors', 'pbc_coors', 'translation_vector', 'energy', 'energy_density']:
+            assert np.allclose(structure[key], reference_structure[key], rtol=1E-9, atol=1E-9)
+
+
+# Trials of SAHYIK overlap with the framework (energy densities between 1E12 and 3E13), a limit of 5E12 accepts
+# about half of them and the rest are rejected part way through the mobile MOF atoms
+@pytest.mark.parametrize('energy_density_limit', [5E12, 1E300])
+@pytest.mark.parametrize('levels', [[], [4, 2]])
+def test_vectorized_trial_engine(mof_path, fractional_emap, loop_results, energy_density_limit, levels):
+    parameters = dict(energy_density_limit=energy_density_limit, energy_map_levels=levels)
+    reference = loop_results(energy_density_limit, levels)
+    assert 0 < len(reference[1]) < 96 if energy_density_limit == 5E12 else len(reference[1]) == 96
+    assert_same_results(interpenetration(mof_path, fractional_emap, trial_engine='vectorized', **parameters),
+                        reference)
+
+
+@pytest.mark.parametrize('energy_density_limit', [5E12, 1E300])
+@pytest.mark.parametrize('levels', [[], [4, 2]])
+@pytest.mark.parametrize('trial_batch_memory', [0.25, 256])
+def test_batched_trial_engine(mof_path, fractional_emap, loop_results, energy_density_limit, levels,
+                              trial_batch_memory):
+    # Batches of 8 trials (0.25 MB) or all trials in a single batch
+    parameters = dict(energy_density_limit=energy_density_limit, energy_map_levels=levels)
+    reference = loop_results(energy_density_limit, levels)
+    assert_same_results(interpenetration(mof_path, fractional_emap, trial_engine='batched',
+                                         trial_batch_memory=trial_batch_memory, **parameters), reference)
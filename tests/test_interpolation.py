@@ -0,0 +1,53 @@
+# IPMOF Energy Map Interpolation Tests
+# Date: October 2026
+import numpy as np
+
+from ipmof.celllist import to_car_matrix
+from ipmof.energymap import cubic_coefficients, log_energy, log_energy_inverse
+from ipmof.interpenetration import tricubic_block
+
+
+def reference_tricubic(frac, column, coefficients):
+    """
+    Cubic B-spline interpolation of one atom column at fractional grid coordinates (explicit 4 x 4 x 4 sum).
+    """
+    def bspline(t):
+        t = abs(t)
+        if t < 1:
+            return (4 - 6 * t ** 2 + 3 * t ** 3) / 6
+        if t < 2:
+            return (2 - t) ** 3 / 6
+        return 0.0
+
+    coef = coefficients[column]
+    base = np.floor(frac).astype(int)
+    y = 0.0
+    for i in range(base[0] - 1, base[0] + 3):
+        for j in range(base[1] - 1, base[1] + 3):
+            for k in range(base[2] - 1, base[2] + 3):
+                weight = bspline(frac[0] - i) * bspline(frac[1] - j) * bspline(frac[2] - k)
+                y += weight * coef[i % coef.shape[0], j % coef.shape[1], k % coef.shape[2]]
+    return log_energy_inverse(y)
+
+
+def test_tricubic_block_grid_nodes(fractional_energy_map):
+    emap, emap_header = fractional_energy_map()
+    coefficients = cubic_coefficients(emap, emap_header)
+    rng = np.random.default_rng(1)
+    for row in rng.choice(len(emap), size=50, replace=False):
+        for atom_index in [3, 4]:
+            energy = tricubic_block(emap[row, :3], atom_index, coefficients, emap_header['to_frac'])
+            assert np.isclose(log_energy(energy), log_energy(emap[row, atom_index]), atol=1E-4)
+
+
+def test_tricubic_block_off_grid_points(fractional_energy_map):
+    emap, emap_header = fractional_energy_map()
+    coefficients = cubic_coefficients(emap, emap_header)
+    to_car = to_car_matrix(emap_header['to_car'])
+    rng = np.random.default_rng(2)
+    for frac in rng.uniform(-0.5, 1.5, size=(100, 3)):
+        point = to_car @ frac
+        for atom_index in [3, 4]:
+            energy = tricubic_block(point, atom_index, coefficients, emap_header['to_frac'])
+            reference = reference_tricubic(frac * emap_header['shape'], atom_index - 3, coefficients)
+            assert np.isclose(energy, reference, rtol=1E-6, atol=1E-9)
@@ -0,0 +1,76 @@
+# IPMOF Octree Energy Map Tests
+# Date: October 2026
+import numpy as np
+
+from ipmof.celllist import CellList, to_car_matrix
+from ipmof.crystal import MOF
+from ipmof.energymap import octree_energy_map, energy_map_sums, lj_coefficients, lj_energy, OVERLAP_ENERGY
+from ipmof.octree import octree_interpolate, CORNER_OFFSETS
+
+
+def octree_leaves(root_shape, tree, depth):
+    """
+    Leaf cells of an octree as (origin, size, depth) with integer coordinates on the finest grid.
+    """
+    scale = 2 ** depth
+    nodes = [(root_index, np.array(root_origin) * scale, scale, 0)
+             for root_index, root_origin in enumerate(np.ndindex(*root_shape))]
+    leaves = []
+    while nodes:
+        node, origin, size, node_depth = nodes.pop()
+        first_child = tree['child'][node]
+        if first_child < 0:
+            leaves.append((origin, size, node_depth))
+            continue
+        for child_index, offset in enumerate(CORNER_OFFSETS):
+            nodes.append((first_child + child_index, origin + offset * size // 2, size // 2, node_depth + 1))
+    return leaves
+
+
+def test_octree_energy_map(sim_par, mof_path, force_field, atom_list_of):
+    """
+    Octree lookups against the dense energy map on the finest grid: lookups at the corners of leaf cells
+    (from inside the cell) match the grid point energies and the interpolation error at the center of leaf
+    cells that were not refined is within octree_tolerance (energies clipped at atom_energy_limit).
+    """
+    sim_par.update(grid_size=1.0, energy_map_grid='octree', octree_depth=1, octree_tolerance=30.0,
+                   atom_energy_limit=1E3)
+    depth, tolerance, energy_limit = sim_par['octree_depth'], sim_par['octree_tolerance'], sim_par['atom_energy_limit']
+    mof = MOF(mof_path)
+    mof.set_force_field(force_field)
+    mof.calculate_vectors()
+    atom_list = atom_list_of(['C', 'H'])
+    emap, emap_header = octree_energy_map(sim_par, mof, atom_list)
+    root_shape, tree, to_frac = emap_header['shape'], emap_header['tree'], emap_header['to_frac']
+
+    # Dense energy map on the finest grid of the octree
+    fine_shape = np.array(root_shape) * 2 ** depth
+    to_car = to_car_matrix(mof.to_car)
+    c6, c12 = lj_coefficients(mof.sigma, mof.epsilon, atom_list)
+
+    def dense_energy(fine_coors):
+        s6, s12 = energy_map_sums((fine_coors / fine_shape) @ to_car.T, CellList(mof, sim_par['cut_off']))
+        energy = lj_energy(s6, s12, c6, c12)
+        energy[~np.isfinite(energy[:, 0])] = OVERLAP_ENERGY
+        return np.minimum(energy, energy_limit)
+
+    def lookup(fine_coors):
+        return np.minimum([[octree_interpolate(to_car @ (coors / fine_shape), atom_index + 3, emap, root_shape,
+                                               tree, to_frac) for atom_index in range(len(atom_list['atom']))]
+                           for coors in fine_coors], energy_limit)
+
+    leaves = octree_leaves(root_shape, tree, depth)
+    assert len(leaves) < np.prod(fine_shape)
+
+    # Corners are looked up slightly inside the cell (points on a cell face may belong to a coarser neighbor)
+    corners = np.concatenate([origin + CORNER_OFFSETS * size for origin, size, leaf_depth in leaves])
+    inside = np.concatenate([origin + CORNER_OFFSETS * size + (0.5 - CORNER_OFFSETS) * size * 1E-12
+                             for origin, size, leaf_depth in leaves])
+    assert np.allclose(lookup(inside), dense_energy(corners), rtol=1E-6, atol=1E-6)
+
+    centers = np.array([origin + size // 2 for origin, size, leaf_depth in leaves if leaf_depth < depth])
+    center_lookup = lookup(centers)
+    # Cells inside framework atoms (all corners above atom_energy_limit) are not refined either
+    accessible = center_lookup < energy_limit
+    assert accessible.sum() > 10
+    assert np.all(np.abs(center_lookup - dense_energy(centers))[accessible] <= tolerance)
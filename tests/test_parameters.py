@@ -0,0 +1,28 @@
+# IPMOF Simulation Parameter Tests
+# Date: October 2026
+import os
+
+import yaml
+
+from ipmof.parameters import read_parameters, sim_par_data, sim_dir_data
+
+
+def test_read_parameters_defaults(tmp_path):
+    sim_par_path = os.path.join(str(tmp_path), 'sim_par.yaml')
+    sim_dir_path = os.path.join(str(tmp_path), 'sim_dir.yaml')
+    with open(sim_par_path, 'w') as sim_par_file:
+        yaml.dump({'grid_size': 2, 'force_field': 'dre'}, sim_par_file)
+    with open(sim_dir_path, 'w') as sim_dir_file:
+        yaml.dump({'mof_dir': 'mofs'}, sim_dir_file)
+    sim_par, sim_dir = read_parameters(sim_par_path, sim_dir_path)
+    assert sim_par == dict(sim_par_data, grid_size=2, force_field='dre')
+    assert sim_dir == dict(sim_dir_data, mof_dir='mofs')
+    # Default parameters are not modified
+    assert sim_par_data['grid_size'] == 1
+
+
+def test_read_parameters_missing_files(tmp_path):
+    sim_par, sim_dir = read_parameters(os.path.join(str(tmp_path), 'sim_par.yaml'),
+                                       os.path.join(str(tmp_path), 'sim_dir.yaml'))
+    assert sim_par == sim_par_data and sim_dir == sim_dir_data
+    assert sim_par['energy_map_grid'] == 'cartesian'